@@ -0,0 +1,216 @@
+import json
+import logging
+import os
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class JsonlArticleWriter:
+    """
+    Потоковая запись статей в JSONL
+
+    Каждая готовая статья сразу дописывается в файл, поэтому при падении
+    краулера теряется не больше последних несброшенных строк. Состояние
+    краулера периодически сохраняется в checkpoint рядом с файлом.
+    """
+
+    def __init__(self, path: str, checkpoint_every: int = 50):
+        """
+        Args:
+            path: путь к JSONL файлу (дописывается, если уже существует)
+            checkpoint_every: через сколько статей делать fsync и checkpoint
+        """
+        self.path = path
+        self.checkpoint_path = checkpoint_path_for(path)
+        self.checkpoint_every = checkpoint_every
+        self.written = 0
+        self._file = open(path, 'a', encoding='utf-8')
+        self._terminate_partial_line()
+
+    def _terminate_partial_line(self):
+        """Если прошлый запуск оборвался посреди строки, начинаем с новой строки"""
+        if self._file.tell() == 0:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                self._file.write('\n')
+
+    def write(self, article: Dict):
+        """Дописывает одну статью"""
+        self._file.write(json.dumps(article, ensure_ascii=False) + '\n')
+        self._file.flush()
+        self.written += 1
+
+    def need_checkpoint(self) -> bool:
+        return self.checkpoint_every > 0 and self.written % self.checkpoint_every == 0
+
+    def checkpoint(self, state: Dict):
+        """
+        Сохраняет состояние краулера
+
+        Сначала fsync данных, затем атомарная замена файла checkpoint,
+        чтобы checkpoint никогда не ссылался на незаписанные статьи.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def close(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def checkpoint_path_for(path: str) -> str:
+    return str(path) + '.checkpoint.json'
+
+
+def load_checkpoint(path: str) -> Optional[Dict]:
+    """Читает checkpoint для JSONL файла, если он есть"""
+    checkpoint_path = checkpoint_path_for(path)
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _iter_json_array(f, chunk_size: int = 1 << 16) -> Iterator:
+    """
+    Элементы JSON массива из файла по одному, без чтения всего файла
+
+    Файл читается кусками по chunk_size символов, каждый элемент
+    разбирается json.JSONDecoder.raw_decode, как только он целиком
+    оказался в буфере; разобранная часть буфера отбрасывается.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def read_more() -> bool:
+        nonlocal buffer, pos, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or not read_more():
+                return
+
+    skip_whitespace()
+    if buffer[pos:pos + 1] != '[':
+        raise ValueError(f"Ожидался JSON массив в {getattr(f, 'name', f)}")
+    pos += 1
+
+    while True:
+        skip_whitespace()
+        if pos >= len(buffer):
+            raise ValueError("Незакрытый JSON массив")
+        if buffer[pos] == ']':
+            return
+        if buffer[pos] == ',':
+            pos += 1
+            skip_whitespace()
+
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Элемент еще не дочитан целиком
+                if not read_more():
+                    raise
+                continue
+            if (end == len(buffer) or buffer[end] not in ',] \t\r\n') and not eof and read_more():
+                # Число на границе куска могло оборваться ("-1." из "-1.5") - разбираем заново с продолжением
+                continue
+            break
+        pos = end
+        yield item
+
+
+def iter_articles(path: str) -> Iterator[Dict]:
+    """
+    Лениво перебирает статьи из файла
+
+    Для .jsonl читает построчно; старый формат (.json с массивом)
+    разбирается потоково, по одной статье, без загрузки всего файла.
+    """
+    if Path(path).suffix == '.json':
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from _iter_json_array(f)
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Последняя строка могла оборваться при падении
+                logger.warning("Пропускаю поврежденную строку в %s", path)
+
+
+def written_urls(path: str) -> Set[str]:
+    """URL статей, уже записанных в JSONL файл"""
+    if not os.path.exists(path):
+        return set()
+    return {article['url'] for article in iter_articles(path) if 'url' in article}
+
+
+def parse_published_time(value) -> Optional[datetime]:
+    """
+    Дата публикации как datetime в UTC
+
+    Принимает datetime, date и строки ISO 8601 ("2026-01-05",
+    "2026-01-05T10:00:00+03:00", "...Z"); время без зоны считается UTC.
+
+    Returns:
+        datetime с tzinfo=UTC или None, если дата не распознана
+    """
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, date):
+        parsed = datetime(value.year, value.month, value.day)
+    elif isinstance(value, str) and value.strip():
+        try:
+            parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    else:
+        return None
+
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def normalize_published_time(value) -> Optional[str]:
+    """Дата публикации в RFC 3339 UTC ("2026-01-05T00:00:00Z") для datetime индекса Qdrant"""
+    parsed = parse_published_time(value)
+    return parsed.strftime('%Y-%m-%dT%H:%M:%SZ') if parsed else None
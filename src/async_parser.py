@@ -0,0 +1,464 @@
+import asyncio
+import inspect
+import logging
+import time
+from concurrent.futures import Executor
+from contextlib import aclosing
+
+import aiohttp
+
+from article_store import JsonlArticleWriter, load_checkpoint, written_urls
+from crawl_ledger import CrawlLedger
+from html_extract import extract_with_backend, get_extractor
+from instrumentation import METRICS, Metrics, log_summary
+from near_dedup import DROP, NearDuplicateIndex
+from new_parser import (
+    BASE_URL,
+    HEADERS,
+    listing_page_url,
+    parse_listing_page,
+)
+from sitemap_discovery import SitemapDiscovery
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов (token bucket) для вежливого краулинга"""
+
+    def __init__(self, rate: float = 2.0, capacity: int = 4):
+        """
+        Args:
+            rate: сколько запросов в секунду разрешено в среднем
+            capacity: максимальный размер всплеска запросов
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Ждет, пока в корзине не появится токен, и забирает его"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncTechCrunchCrawler:
+    """
+    Асинхронный краулер TechCrunch AI
+
+    Листинги обходятся по порядку, а загрузка текста каждой статьи
+    запускается сразу после разбора страницы, на которой она найдена.
+    """
+
+    def __init__(self,
+                 base_url: str = BASE_URL,
+                 max_per_host: int = 8,
+                 requests_per_second: float = 2.0,
+                 burst: int = 4,
+                 timeout: float = 15,
+                 ledger: CrawlLedger = None,
+                 backend: str = 'lxml',
+                 parse_pool: Executor = None,
+                 metrics: Metrics = None,
+                 dedup: NearDuplicateIndex = None,
+                 dedup_mode: str = DROP,
+                 max_in_flight: int = 0,
+                 discovery: SitemapDiscovery = None):
+        """
+        Args:
+            base_url: адрес сайта (для тестов - адрес локального сервера с фикстурами)
+            max_per_host: максимум одновременных запросов к одному хосту
+            requests_per_second: средняя частота запросов
+            burst: допустимый всплеск запросов
+            timeout: таймаут запроса в секундах
+            ledger: журнал просмотренных URL для инкрементального обхода
+            backend: бэкенд извлечения текста статей ('lxml' или 'bs4')
+            parse_pool: пул процессов для разбора HTML; без него разбор идет в event loop
+            metrics: реестр метрик этапов (по умолчанию общий instrumentation.METRICS)
+            dedup: индекс почти-дубликатов; проверяются новые и измененные статьи с текстом
+            dedup_mode: DROP - дубликаты не отдаются дальше, FLAG - помечаются полем duplicate_of
+            max_in_flight: максимум статей, загружаемых и ожидающих on_article одновременно
+                (0 - без ограничения); вместе с медленным on_article дает backpressure
+            discovery: поиск статей по sitemap и фидам вместо обхода страниц листинга
+        """
+        self.base_url = base_url
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.bucket = TokenBucket(requests_per_second, burst)
+        self.ledger = ledger
+        self.backend = backend
+        self.parse_pool = parse_pool
+        self.metrics = metrics or METRICS
+        self.dedup = dedup
+        self.dedup_mode = dedup_mode
+        self.max_in_flight = max_in_flight
+        self.discovery = discovery
+        # Отданные статьи, которые еще не записаны в журнал: url -> аргументы ledger.record
+        self._unconfirmed = {}
+        get_extractor(backend)  # проверяем имя бэкенда заранее
+
+    def _make_session(self) -> aiohttp.ClientSession:
+        """Сессия с пулом keep-alive соединений"""
+        connector = aiohttp.TCPConnector(
+            limit_per_host=self.max_per_host,
+            keepalive_timeout=30
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            headers=HEADERS,
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+
+    async def _fetch(self, session: aiohttp.ClientSession, url: str, headers: dict = None,
+                     kind: str = 'article'):
+        """
+        Загружает страницу
+
+        Args:
+            kind: 'listing', 'sitemap' или 'article' - метка в метриках
+
+        Returns:
+            (status, body, response headers) или (None, None, None) при ошибке сети
+        """
+        # Ожидание ограничителя частоты - отдельный этап, чтобы не путать его с сетью
+        with self.metrics.timer('wait', kind=kind):
+            await self.bucket.acquire()
+
+        start = time.perf_counter()
+        try:
+            async with session.get(url, headers=headers) as response:
+                body = await response.read()
+            self.metrics.record('fetch', time.perf_counter() - start, nbytes=len(body),
+                                status=response.status, kind=kind)
+            return response.status, body, response.headers
+        except asyncio.TimeoutError:
+            self.metrics.record('fetch', time.perf_counter() - start, status='timeout', kind=kind)
+            self.metrics.inc('stage_errors_total', stage='fetch', kind=kind)
+            logger.warning("Таймаут: %s", url)
+        except aiohttp.ClientError as e:
+            self.metrics.record('fetch', time.perf_counter() - start, status='error', kind=kind)
+            self.metrics.inc('stage_errors_total', stage='fetch', kind=kind)
+            logger.warning("Ошибка запроса %s: %s", url, e)
+        return None, None, None
+
+    async def _parse(self, stage: str, func, *args):
+        """Выполняет разбор HTML в пуле процессов, чтобы не блокировать загрузку"""
+        with self.metrics.timer(stage):
+            if self.parse_pool is None:
+                return func(*args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.parse_pool, func, *args)
+
+    async def _fetch_article(self, session: aiohttp.ClientSession, article: dict):
+        """
+        Загружает и извлекает текст статьи
+
+        Returns:
+            статью или None, если текст не получен или (при наличии журнала) не изменился
+        """
+        url = article["url"]
+        headers = self.ledger.conditional_headers(url) if self.ledger is not None else None
+
+        status, body, response_headers = await self._fetch(session, url, headers)
+
+        if status == 304:
+            # Условный GET: статья не изменилась с прошлого обхода
+            self.ledger.touch(url)
+            self.metrics.inc('articles_total', result='not_modified')
+            return None
+
+        if status != 200:
+            self.metrics.inc('articles_total', result='fetch_failed')
+            return None
+
+        try:
+            full_text = await self._parse('extract', extract_with_backend, body, self.backend)
+        except Exception as e:
+            logger.warning("Ошибка получения текста %s: %s", url, e)
+            full_text = None
+
+        ledger_entry = (article["id"], full_text,
+                        response_headers.get('ETag'), response_headers.get('Last-Modified'))
+        if self.ledger is not None:
+            # Статья, которая уйдет дальше, записывается в журнал только в mark_done
+            if self.ledger.status(url, full_text) == CrawlLedger.UNCHANGED:
+                self._record(url, ledger_entry)
+                self.metrics.inc('articles_total', result='unchanged')
+                return None
+
+        if not full_text or len(full_text) < 500:
+            logger.info("Текст слишком короткий или не найден: %s", url)
+            self.metrics.inc('articles_total', result='no_text')
+            self._record(url, ledger_entry)
+            return None
+
+        if self.dedup is not None:
+            # До эмбеддинга: дубликат не тратит время модели и место в индексе
+            with self.metrics.timer('dedup'):
+                duplicate_of = self.dedup.check(url, article["id"], full_text)
+            if duplicate_of is not None:
+                self.metrics.inc('near_duplicates_total', action=self.dedup_mode)
+                if self.dedup_mode == DROP:
+                    logger.info("Почти-дубликат %s статьи %s, пропускаю", url, duplicate_of)
+                    self.metrics.inc('articles_total', result='near_duplicate')
+                    self._record(url, ledger_entry)
+                    return None
+                article["duplicate_of"] = duplicate_of
+
+        if self.ledger is not None:
+            self._unconfirmed[url] = ledger_entry
+        article["text"] = full_text
+        article["word_count"] = len(full_text.split())
+        self.metrics.inc('articles_total', result='ok')
+        logger.debug("Текст получен: %s слов, %s", article['word_count'], url)
+        return article
+
+    def _record(self, url: str, ledger_entry: tuple):
+        if self.ledger is not None:
+            self.ledger.record(url, *ledger_entry)
+
+    def mark_done(self, url: str):
+        """
+        Записывает отданную статью в журнал после того, как получатель ее сохранил
+
+        До этого статья в журнале не отмечена, и при падении между загрузкой
+        и сохранением следующий обход загрузит ее снова.
+        """
+        ledger_entry = self._unconfirmed.pop(url, None)
+        if ledger_entry is not None:
+            self._record(url, ledger_entry)
+
+    async def _crawl(self, target_articles: int, max_pages: int, on_article,
+                     start_page: int = 1, pending=None, skip_urls=None, on_page=None,
+                     confirm: bool = True):
+        """
+        Общий цикл обхода
+
+        Args:
+            on_article: вызывается для каждой статьи с текстом как on_article(order, article),
+                где order - порядковый номер статьи в порядке обнаружения; может быть корутиной
+            start_page: с какой страницы листинга начинать
+            pending: статьи без текста, найденные в прошлом запуске (для --resume)
+            skip_urls: URL, которые уже обработаны и не должны загружаться снова
+            on_page: вызывается после обработки каждой страницы листинга
+            confirm: True - статья записывается в журнал, как только on_article завершился
+                без ошибки; False - получатель сам вызывает mark_done после сохранения
+        """
+        seen = set(skip_urls or ())
+        tasks = set()
+        # Статьи, текст которых еще не получен - сохраняются в checkpoint
+        self._in_flight = {}
+        self._next_page = start_page
+        page = start_page
+
+        async def run(order, article):
+            result = await self._fetch_article(session, article)
+            self._in_flight.pop(article["url"], None)
+            if result is not None:
+                pending_call = on_article(order, result)
+                if inspect.isawaitable(pending_call):
+                    await pending_call
+                if confirm:
+                    self.mark_done(result["url"])
+
+        async def schedule(article):
+            # Новая статья не стартует, пока заняты все max_in_flight слотов
+            while self.max_in_flight and len(tasks) >= self.max_in_flight:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            seen.add(article["url"])
+            self._in_flight[article["url"]] = dict(article)
+            task = asyncio.create_task(run(len(seen), article))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        async with self._make_session() as session:
+            for article in pending or ():
+                if article["url"] not in seen:
+                    await schedule(article)
+
+            if self.discovery is not None:
+                await self._schedule_discovered(session, target_articles, seen, schedule)
+
+            while self.discovery is None and len(seen) < target_articles and page <= max_pages:
+                url = listing_page_url(page, self.base_url)
+                logger.info("Страница %s: %s", page, url)
+
+                status, body, _ = await self._fetch(session, url, kind='listing')
+
+                if status == 404:
+                    logger.info("Страница %s не найдена (404). Прекращаю парсинг.", page)
+                    break
+
+                if status != 200:
+                    logger.warning("Ошибка %s на странице %s. Пропускаю страницу.", status, page)
+                    page += 1
+                    continue
+
+                page_articles, found, has_next = await self._parse(
+                    'parse', parse_listing_page, body, page, self.base_url
+                )
+
+                if not found:
+                    break
+
+                if self.ledger is not None:
+                    known = self.ledger.known_urls(a["url"] for a in page_articles)
+                    if page_articles and len(known) == len(page_articles):
+                        # Дальше идут только уже обработанные статьи
+                        logger.info("На странице %s только известные статьи. Прекращаю.", page)
+                        break
+
+                for article in page_articles:
+                    if article["url"] not in seen:
+                        # Загрузка текста стартует сразу, не дожидаясь конца пагинации
+                        await schedule(article)
+
+                logger.info("Всего собрано: %s/%s", len(seen), target_articles)
+
+                page += 1
+                self._next_page = page
+                if on_page is not None:
+                    on_page()
+
+                if not has_next:
+                    logger.info("Нет следующей страницы или мало статей. Прекращаю.")
+                    break
+
+            while tasks:
+                await asyncio.gather(*list(tasks))
+
+        return len(seen)
+
+    async def _schedule_discovered(self, session: aiohttp.ClientSession, target_articles: int, seen: set, schedule):
+        """Ставит в загрузку статьи из sitemap и фидов вместо обхода листинга"""
+        async def fetch(url):
+            status, body, _ = await self._fetch(session, url, kind='sitemap')
+            return status, body
+
+        async with aclosing(self.discovery.iter_articles(fetch, self.base_url)) as discovered:
+            async for article in discovered:
+                if len(seen) >= target_articles:
+                    break
+                if article["url"] not in seen:
+                    await schedule(article)
+        logger.info("По sitemap собрано: %s/%s", len(seen), target_articles)
+
+    def checkpoint_state(self) -> dict:
+        """Состояние обхода: следующая страница и статьи, ожидающие загрузки текста"""
+        return {
+            "page": self._next_page,
+            "pending": list(self._in_flight.values()),
+        }
+
+    async def crawl_stream(self, target_articles: int, max_pages: int, on_article, confirm: bool = False):
+        """
+        Обходит сайт, отдавая каждую статью с текстом в on_article по мере загрузки
+
+        Статьи не накапливаются. При confirm=False (по умолчанию) получатель
+        сам вызывает mark_done(url), когда статья сохранена: до этого она не
+        отмечается в журнале и при падении загрузится снова.
+
+        Args:
+            on_article: on_article(order, article), может быть корутиной; пока
+                он не завершился, слот max_in_flight занят (backpressure)
+
+        Returns:
+            число найденных ссылок
+        """
+        logger.info("Начинаю потоковый парсинг TechCrunch AI: цель %s статей", target_articles)
+        total_links = await self._crawl(target_articles, max_pages, on_article, confirm=confirm)
+        logger.info("Парсинг завершен: ссылок %s", total_links)
+        return total_links
+
+    async def crawl(self, target_articles: int, max_pages: int):
+        """Обходит листинги и статьи, возвращает список статей с текстом"""
+        collected = []
+
+        logger.info("Начинаю асинхронный парсинг TechCrunch AI: цель %s статей, "
+                    "до %s запросов к хосту одновременно", target_articles, self.max_per_host)
+
+        total_links = await self._crawl(
+            target_articles, max_pages,
+            on_article=lambda order, article: collected.append((order, article))
+        )
+
+        # Сохраняем порядок обнаружения, как в последовательном парсере
+        collected.sort(key=lambda item: item[0])
+        articles_with_text = [article for _, article in collected]
+
+        logger.info("Парсинг завершен: ссылок %s, статей с текстом %s", total_links, len(articles_with_text))
+        log_summary(self.metrics, logger)
+
+        return articles_with_text[:target_articles]
+
+    async def crawl_to_file(self, writer: JsonlArticleWriter, target_articles: int, max_pages: int,
+                            resume: bool = False):
+        """
+        Обходит сайт, сразу дописывая каждую статью в JSONL
+
+        Статьи не накапливаются в памяти. При resume=True обход продолжается
+        со страницы и списка ожидающих статей из последнего checkpoint.
+
+        Returns:
+            число статей, записанных за этот запуск
+        """
+        start_page, pending, skip_urls = 1, None, None
+
+        if resume:
+            state = load_checkpoint(writer.path)
+            if state is None:
+                logger.info("Checkpoint не найден, начинаю с начала")
+            elif state.get("finished"):
+                logger.info("Обход %s уже завершен", writer.path)
+                return 0
+            else:
+                start_page = state["page"]
+                pending = state["pending"]
+                skip_urls = written_urls(writer.path)
+                logger.info("Продолжаю со страницы %s: %s статей уже записано, %s ожидают загрузки",
+                            start_page, len(skip_urls), len(pending))
+
+        def on_article(order, article):
+            writer.write(article)
+            if writer.need_checkpoint():
+                writer.checkpoint(self.checkpoint_state())
+
+        logger.info("Начинаю асинхронный парсинг TechCrunch AI в %s", writer.path)
+
+        total_links = await self._crawl(
+            target_articles, max_pages, on_article,
+            start_page=start_page, pending=pending, skip_urls=skip_urls,
+            on_page=lambda: writer.checkpoint(self.checkpoint_state())
+        )
+
+        writer.checkpoint({**self.checkpoint_state(), "finished": True})
+
+        logger.info("Парсинг завершен: ссылок %s, статей записано за запуск %s", total_links, writer.written)
+        log_summary(self.metrics, logger)
+
+        return writer.written
+
+
+def parse_techcrunch_pagination_async(target_articles, max_pages, **crawler_kwargs):
+    """Синхронная обертка над AsyncTechCrunchCrawler с тем же результатом, что и parse_techcrunch_pagination"""
+    crawler = AsyncTechCrunchCrawler(**crawler_kwargs)
+    return asyncio.run(crawler.crawl(target_articles, max_pages))
+
+
+def crawl_techcrunch_to_jsonl(path, target_articles, max_pages, resume=False,
+                              checkpoint_every=50, **crawler_kwargs):
+    """Синхронная обертка над crawl_to_file: потоковая запись статей в JSONL"""
+    crawler = AsyncTechCrunchCrawler(**crawler_kwargs)
+    with JsonlArticleWriter(path, checkpoint_every=checkpoint_every) as writer:
+        return asyncio.run(crawler.crawl_to_file(writer, target_articles, max_pages, resume=resume))
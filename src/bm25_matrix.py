@@ -0,0 +1,357 @@
+import argparse
+import json
+import math
+import os
+import resource
+import time
+import zipfile
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+from scipy import sparse
+
+from bm25_search import BM25WithPreprocessing
+
+
+def bm25_idf(doc_freq: np.ndarray, num_docs: int) -> np.ndarray:
+    """IDF по массиву DF (та же формула и math.log, что в BM25WithPreprocessing.idf)"""
+    idf = np.zeros(len(doc_freq), dtype=np.float64)
+    for term_id in np.flatnonzero(doc_freq):
+        df_t = int(doc_freq[term_id])
+        numerator = num_docs - df_t + 0.5
+        denominator = df_t + 0.5
+        if numerator > 0 and denominator > 0:
+            idf[term_id] = math.log(numerator / denominator + 1)
+    return idf
+
+
+def bm25_weights(tf: np.ndarray, doc_ids: np.ndarray, term_ids: np.ndarray, idf: np.ndarray,
+                 length_norm: np.ndarray, k1: float) -> np.ndarray:
+    """Веса idf * tf_component для пар (документ, термин) одной арифметикой по массивам"""
+    denominator = tf + k1 * length_norm[doc_ids]
+    return idf[term_ids] * (tf * (k1 + 1) / denominator)
+
+
+def matrix_from_model(bm25: BM25WithPreprocessing) -> sparse.csr_matrix:
+    """
+    CSR матрица BM25 весов (документы x термины) из индекса обученной модели
+
+    Векторный аналог save_embeddings_minimal: столбцы в порядке doc_freq,
+    значения idf * tf_component совпадают до бита.
+    """
+    doc_freq = np.diff(bm25.postings_ptr)
+    term_ids = np.repeat(np.arange(len(doc_freq)), doc_freq)
+    data = bm25_weights(bm25.postings_tf, bm25.postings_docs, term_ids,
+                        bm25.idf_array, bm25.length_norm, bm25.k1)
+    csc = sparse.csc_matrix((data, bm25.postings_docs, bm25.postings_ptr),
+                            shape=(bm25.num_docs, len(doc_freq)))
+    return csc.tocsr()
+
+
+class HashingVocabulary:
+    """Словарь через hashing trick: фиксированная размерность при росте корпуса"""
+
+    def __init__(self, n_features: int = 2 ** 20):
+        self.n_features = n_features
+
+    def __len__(self) -> int:
+        return self.n_features
+
+    def term_id(self, token: str) -> int:
+        # crc32 детерминирован между процессами, в отличие от hash()
+        return zlib.crc32(token.encode('utf-8')) % self.n_features
+
+    def lookup(self, token: str) -> Optional[int]:
+        return self.term_id(token)
+
+    def to_dict(self) -> Dict:
+        return {'type': 'hashing', 'n_features': self.n_features}
+
+
+class GrowingVocabulary:
+    """Обычный словарь термин -> id, id выдаются по порядку появления"""
+
+    def __init__(self):
+        self.term_to_id: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.term_to_id)
+
+    def term_id(self, token: str) -> int:
+        term_id = self.term_to_id.get(token)
+        if term_id is None:
+            term_id = self.term_to_id[token] = len(self.term_to_id)
+        return term_id
+
+    def lookup(self, token: str) -> Optional[int]:
+        return self.term_to_id.get(token)
+
+    def to_dict(self) -> Dict:
+        # Термины в порядке id: порядок вставки словаря совпадает с порядком выдачи id
+        return {'type': 'growing', 'terms': list(self.term_to_id)}
+
+
+Vocabulary = Union[HashingVocabulary, GrowingVocabulary]
+
+
+def vocabulary_from_dict(data: Dict) -> Vocabulary:
+    """Словарь из to_dict()"""
+    if data['type'] == 'hashing':
+        return HashingVocabulary(data['n_features'])
+    vocabulary = GrowingVocabulary()
+    vocabulary.term_to_id = {term: i for i, term in enumerate(data['terms'])}
+    return vocabulary
+
+
+def vocabulary_path(matrix_path: str) -> str:
+    """Файл словаря рядом с матрицей: bm25_matrix.npz -> bm25_matrix.vocab.json"""
+    return os.path.splitext(matrix_path)[0] + '.vocab.json'
+
+
+def query_term_ids(vocabulary: Vocabulary, tokens: List[str]) -> List[int]:
+    """Id терминов запроса в пространстве матрицы (неизвестные отбрасываются)"""
+    term_ids = []
+    for token in tokens:
+        term_id = vocabulary.lookup(token)
+        if term_id is not None and term_id not in term_ids:
+            term_ids.append(term_id)
+    return term_ids
+
+
+def load_bm25_matrix(matrix_path: str) -> Tuple[sparse.csr_matrix, Vocabulary, Dict]:
+    """
+    Матрица BM25MatrixBuilder.finalize вместе с ее словарем
+
+    Returns:
+        (CSR матрица, словарь термин -> столбец, параметры {'k1', 'b', 'num_docs', 'avg_doc_length'})
+    """
+    with open(vocabulary_path(matrix_path), encoding='utf-8') as f:
+        meta = json.load(f)
+    vocabulary = vocabulary_from_dict(meta.pop('vocabulary'))
+    return sparse.load_npz(matrix_path), vocabulary, meta
+
+
+class _AppendFile:
+    """Дописываемый бинарный массив на диске"""
+
+    def __init__(self, path: str, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        self._file = open(path, 'wb')
+
+    def append(self, values: np.ndarray):
+        self._file.write(np.ascontiguousarray(values, dtype=self.dtype).tobytes())
+        self.length += len(values)
+
+    def open_memmap(self, mode: str = 'r') -> np.ndarray:
+        self._file.flush()
+        if self.length == 0:
+            return np.zeros(0, dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode=mode, shape=(self.length,))
+
+    def close(self):
+        self._file.close()
+
+
+class BM25MatrixBuilder:
+    """
+    Потоковое построение BM25 матрицы (документы x термины) вне памяти
+
+    Токенизированные документы обрабатываются кусками: id терминов и tf
+    считаются векторно и сразу дописываются в файлы на диске, в памяти
+    остаются только длины документов и DF. После прохода по корпусу
+    веса idf * tf_component считаются по кускам indptr и результат
+    пишется в .npz, совместимый с scipy.sparse.load_npz.
+    """
+
+    def __init__(self, work_dir: str, k1: float = 1.5, b: float = 0.75,
+                 n_features: Optional[int] = None, chunk_size: int = 2000):
+        """
+        Args:
+            work_dir: директория для временных файлов
+            k1, b: параметры BM25
+            n_features: размерность для hashing trick (None - обычный словарь)
+            chunk_size: документов в куске
+        """
+        os.makedirs(work_dir, exist_ok=True)
+        self.work_dir = work_dir
+        self.k1 = k1
+        self.b = b
+        self.chunk_size = chunk_size
+        self.vocabulary = HashingVocabulary(n_features) if n_features else GrowingVocabulary()
+
+        self.doc_freq = np.zeros(n_features or 1024, dtype=np.int64)
+        self.doc_lengths: List[int] = []
+        self._indices = _AppendFile(os.path.join(work_dir, 'indices.bin'), np.int32)
+        self._tf = _AppendFile(os.path.join(work_dir, 'tf.bin'), np.float64)
+        self._row_nnz: List[np.ndarray] = []
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_lengths)
+
+    def add_documents(self, token_lists: Iterable[List[str]]) -> 'BM25MatrixBuilder':
+        """Добавляет токенизированные документы (итератор читается кусками)"""
+        chunk = []
+        for tokens in token_lists:
+            chunk.append(tokens)
+            if len(chunk) >= self.chunk_size:
+                self._add_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._add_chunk(chunk)
+        return self
+
+    def _add_chunk(self, chunk: List[List[str]]):
+        lengths = np.fromiter((len(tokens) for tokens in chunk), dtype=np.int64, count=len(chunk))
+        term_id = self.vocabulary.term_id
+        term_ids = np.fromiter((term_id(token) for tokens in chunk for token in tokens),
+                               dtype=np.int64, count=int(lengths.sum()))
+        doc_ids = np.repeat(np.arange(len(chunk)), lengths)
+
+        # Уникальные пары (документ, термин) и их tf, отсортированные как в CSR
+        keys = doc_ids * len(self.vocabulary) + term_ids
+        unique_keys, tf = np.unique(keys, return_counts=True)
+        pair_docs = unique_keys // len(self.vocabulary)
+        pair_terms = unique_keys % len(self.vocabulary)
+
+        if len(self.vocabulary) > len(self.doc_freq):
+            self.doc_freq = np.concatenate((
+                self.doc_freq,
+                np.zeros(max(len(self.vocabulary), 2 * len(self.doc_freq)) - len(self.doc_freq), dtype=np.int64)
+            ))
+        self.doc_freq[:len(self.vocabulary)] += np.bincount(pair_terms, minlength=len(self.vocabulary))
+
+        self._indices.append(pair_terms)
+        self._tf.append(tf)
+        self._row_nnz.append(np.bincount(pair_docs, minlength=len(chunk)))
+        self.doc_lengths.extend(lengths.tolist())
+
+    def finalize(self, output_path: str, chunk_nnz: int = 5_000_000) -> str:
+        """
+        Считает веса и пишет CSR матрицу в .npz, а рядом - словарь (vocabulary_path)
+
+        Без словаря столбцы матрицы не сопоставить терминам запроса;
+        обе части читает load_bm25_matrix.
+
+        Args:
+            output_path: путь к .npz (читается через scipy.sparse.load_npz)
+            chunk_nnz: ненулевых элементов в куске при подсчете весов
+        """
+        num_terms = len(self.vocabulary)
+        doc_freq = self.doc_freq[:num_terms]
+        indptr = np.zeros(self.num_docs + 1, dtype=np.int64)
+        if self._row_nnz:
+            np.cumsum(np.concatenate(self._row_nnz), out=indptr[1:])
+
+        doc_lengths = np.asarray(self.doc_lengths, dtype=np.float64)
+        avg_doc_length = sum(self.doc_lengths) / self.num_docs if self.num_docs else 0.0
+        length_norm = (1 - self.b + self.b * (doc_lengths / avg_doc_length)
+                       if avg_doc_length > 0 else np.ones_like(doc_lengths))
+        idf = bm25_idf(doc_freq, self.num_docs)
+
+        indices = self._indices.open_memmap()
+        data = self._tf.open_memmap(mode='r+')
+
+        # Веса по кускам строк: tf в файле заменяется на вес на месте
+        row = 0
+        while row < self.num_docs:
+            end_row = int(np.searchsorted(indptr, indptr[row] + chunk_nnz, side='right')) - 1
+            end_row = min(max(end_row, row + 1), self.num_docs)
+            start, end = indptr[row], indptr[end_row]
+            doc_ids = np.repeat(np.arange(row, end_row), np.diff(indptr[row:end_row + 1]))
+            data[start:end] = bm25_weights(np.asarray(data[start:end]), doc_ids,
+                                           np.asarray(indices[start:end]), idf, length_norm, self.k1)
+            row = end_row
+        if len(data):
+            data.flush()
+
+        self._write_npz(output_path, data, indices, indptr, (self.num_docs, num_terms))
+        with open(vocabulary_path(output_path), 'w', encoding='utf-8') as f:
+            json.dump({'vocabulary': self.vocabulary.to_dict(), 'k1': self.k1, 'b': self.b,
+                       'num_docs': self.num_docs, 'avg_doc_length': avg_doc_length}, f, ensure_ascii=False)
+        self.idf = idf
+        self.avg_doc_length = avg_doc_length
+        return output_path
+
+    @staticmethod
+    def _write_npz(path: str, data: np.ndarray, indices: np.ndarray, indptr: np.ndarray, shape: tuple):
+        """Пишет CSR в формате scipy.sparse.save_npz, массивы копируются кусками"""
+        arrays = {
+            'indices': indices,
+            'indptr': indptr,
+            'format': np.array(b'csr'),
+            'shape': np.array(shape),
+            'data': data,
+        }
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for name, array in arrays.items():
+                with archive.open(name + '.npy', 'w', force_zip64=True) as f:
+                    np.lib.format.write_array(f, np.asanyarray(array), allow_pickle=False)
+
+    def query_term_ids(self, tokens: List[str]) -> List[int]:
+        """Id терминов запроса в пространстве матрицы (неизвестные отбрасываются)"""
+        return query_term_ids(self.vocabulary, tokens)
+
+    def close(self):
+        self._indices.close()
+        self._tf.close()
+
+
+def build_bm25_matrix(token_lists: Iterable[List[str]], output_path: str, work_dir: str,
+                      **builder_kwargs) -> str:
+    """
+    Потоковое построение BM25 матрицы и словаря по итератору токенизированных документов
+
+    Args:
+        token_lists: документы по одному (например, генератор по iter_articles)
+        output_path: путь к .npz; словарь пишется в vocabulary_path(output_path)
+        work_dir: директория для временных файлов
+        builder_kwargs: параметры BM25MatrixBuilder (k1, b, n_features, chunk_size)
+    """
+    builder = BM25MatrixBuilder(work_dir, **builder_kwargs)
+    try:
+        builder.add_documents(token_lists)
+        return builder.finalize(output_path)
+    finally:
+        builder.close()
+
+
+def _synthetic_token_lists(num_docs: int, vocab_size: int = 200000, avg_doc_length: int = 300,
+                           seed: int = 0):
+    rng = np.random.default_rng(seed)
+    ranks = np.arange(1, vocab_size + 1, dtype=np.float64)
+    probs = ranks ** -1.1
+    probs /= probs.sum()
+    words = np.array([f"w{i}" for i in range(vocab_size)], dtype=object)
+    for _ in range(num_docs):
+        length = max(int(rng.poisson(avg_doc_length)), 1)
+        yield words[rng.choice(vocab_size, size=length, p=probs)].tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Потоковое построение BM25 матрицы на синтетическом корпусе")
+    parser.add_argument('--docs', type=int, default=100000)
+    parser.add_argument('--work-dir', default='./temp_embeddings/bm25_builder')
+    parser.add_argument('--output', default='./temp_embeddings/bm25_matrix.npz')
+    parser.add_argument('--n-features', type=int, default=None, help='размерность hashing trick')
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    build_bm25_matrix(_synthetic_token_lists(args.docs), args.output, args.work_dir,
+                      n_features=args.n_features, chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - start
+    # Пик до загрузки результата: сколько памяти потребовало само построение
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    matrix, _, _ = load_bm25_matrix(args.output)
+    matrix_mb = (matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) / 2 ** 20
+    print(f"Документов: {matrix.shape[0]}, терминов: {matrix.shape[1]}, ненулевых: {matrix.nnz}")
+    print(f"Время: {elapsed:.1f} с, размер CSR: {matrix_mb:.1f} МБ, пик памяти процесса: {peak_mb:.0f} МБ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,602 @@
+import itertools
+import math
+import pickle
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import nltk
+import numpy as np
+from scipy import sparse
+from nltk.corpus import stopwords
+from nltk.stem import SnowballStemmer, WordNetLemmatizer
+
+
+def download_nltk_resources():
+    """Скачивает необходимые ресурсы NLTK, если их нет"""
+    try:
+        nltk.data.find('tokenizers/punkt')
+        nltk.data.find('corpora/stopwords')
+        nltk.data.find('corpora/wordnet')
+    except LookupError:
+        nltk.download('punkt')
+        nltk.download('stopwords')
+        nltk.download('wordnet')
+        nltk.download('omw-eng')  # Open Multilingual WordNet
+
+
+# Разбиение слитных форм, которое делает nltk.word_tokenize (Treebank CONTRACTIONS2).
+# После удаления пунктуации в тексте остаются только \w и пробелы, поэтому
+# word_tokenize сводится к split() плюс эти замены.
+TREEBANK_SPLITS = {
+    'cannot': ('can', 'not'),
+    'gimme': ('gim', 'me'),
+    'gonna': ('gon', 'na'),
+    'gotta': ('got', 'ta'),
+    'lemme': ('lem', 'me'),
+    'wanna': ('wan', 'na'),
+}
+
+_MISSING = object()
+
+
+def fast_word_tokenize(text: str) -> List[str]:
+    """
+    Токенизация текста без пунктуации, совпадающая с nltk.word_tokenize
+
+    Ожидает текст после удаления HTML и символов [^\w\s].
+    """
+    tokens = []
+    for token in text.split():
+        split = TREEBANK_SPLITS.get(token.lower())
+        if split:
+            tokens.extend(split)
+        else:
+            tokens.append(token)
+    return tokens
+
+
+# Препроцессор процесса-воркера для preprocess_batch
+_worker_preprocessor = None
+
+
+def _init_preprocess_worker(language: str, cache: Dict):
+    global _worker_preprocessor
+    _worker_preprocessor = TextPreprocessor(language, workers=1)
+    _worker_preprocessor._cache = cache
+
+
+def _preprocess_chunk(texts: List[str], options: Dict):
+    """Препроцессинг куска текстов в воркере; возвращает токены и новые записи кэша"""
+    preprocessor = _worker_preprocessor
+    preprocessor._new_entries = {}
+    tokens = [preprocessor.preprocess(text, **options) for text in texts]
+    return tokens, preprocessor._new_entries
+
+
+class TextPreprocessor:
+    def __init__(self, language='english', max_cache_size: int = 500_000,
+                 workers: int = 1, fast_tokenizer: bool = True):
+        """
+        Инициализация препроцессора текста
+
+        Args:
+            language: язык текста ('english', 'russian')
+            max_cache_size: максимальный размер кэша токен -> нормализованная форма
+            workers: число процессов для preprocess_batch
+            fast_tokenizer: токенизация через split() вместо nltk.word_tokenize (те же токены)
+        """
+        self.language = language
+        self.max_cache_size = max_cache_size
+        self.workers = workers
+        self.fast_tokenizer = fast_tokenizer
+
+        # Кэш по набору опций: токен -> нормализованная форма (None - токен отброшен)
+        self._cache: Dict[tuple, Dict[str, Optional[str]]] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._new_entries: Optional[Dict[str, Optional[str]]] = None  # записи, посчитанные в воркере
+
+        # Инициализируем стеммер и лемматизатор
+        if language == 'english':
+            download_nltk_resources()
+            self.stemmer = SnowballStemmer('english')
+            self.lemmatizer = WordNetLemmatizer()
+            self.stop_words = set(stopwords.words('english'))
+
+    def __getstate__(self):
+        # NLTK объекты не сохраняем - пересоздаются при загрузке, кэш сохраняется вместе с моделью
+        return {
+            'language': self.language,
+            'max_cache_size': self.max_cache_size,
+            'workers': self.workers,
+            'fast_tokenizer': self.fast_tokenizer,
+            '_cache': self._cache,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state['language'], state['max_cache_size'], state['workers'], state['fast_tokenizer'])
+        self._cache = state['_cache']
+
+    @staticmethod
+    def _options_key(use_stemming: bool = True, use_lemmatization: bool = True,
+                     remove_stopwords: bool = True) -> tuple:
+        return (use_stemming, use_lemmatization, remove_stopwords)
+
+    def _normalize_token(self, token: str, use_stemming: bool,
+                         use_lemmatization: bool, remove_stopwords: bool) -> Optional[str]:
+        """Нормализованная форма токена или None, если токен отбрасывается"""
+        # Пропускаем числа и очень короткие токены
+        if token.isdigit() or len(token) < 2:
+            return None
+
+        # Удаление стоп-слов
+        if remove_stopwords and token in self.stop_words:
+            return None
+
+        # Лемматизация (если доступна и включена)
+        if use_lemmatization and self.lemmatizer:
+            if self.language == 'english':
+                # Для английского определяем часть речи
+                token = self.lemmatizer.lemmatize(token, pos='v')  # глагол
+                token = self.lemmatizer.lemmatize(token, pos='n')  # существительное
+                token = self.lemmatizer.lemmatize(token, pos='a')  # прилагательное
+                token = self.lemmatizer.lemmatize(token, pos='r')  # наречие
+
+        # Стемминг
+        if use_stemming:
+            token = self.stemmer.stem(token)
+
+        return token
+
+    def _remember(self, cache: Dict, token: str, form: Optional[str]):
+        if len(cache) >= self.max_cache_size:
+            # Вытесняем самую старую десятую часть записей
+            for old_token in list(itertools.islice(cache, max(1, self.max_cache_size // 10))):
+                del cache[old_token]
+        cache[token] = form
+        if self._new_entries is not None:
+            self._new_entries[token] = form
+
+    def preprocess(self, text: str, use_stemming: bool = True,
+                   use_lemmatization: bool = True, remove_stopwords: bool = True) -> List[str]:
+        """
+        Препроцессинг текста
+
+        Args:
+            text: исходный текст
+            use_stemming: применять стемминг
+            use_lemmatization: применять лемматизацию
+            remove_stopwords: удалять стоп-слова
+
+        Returns:
+            Список обработанных токенов
+        """
+        if not text:
+            return []
+
+        # 1. Приведение к нижнему регистру
+        text = text.lower()
+
+        # 2. Удаление HTML-тегов и специальных символов
+        text = re.sub(r'<[^>]+>', ' ', text)
+        text = re.sub(r'[^\w\s]', ' ', text)
+
+        # 3. Токенизация
+        tokens = fast_word_tokenize(text) if self.fast_tokenizer else nltk.word_tokenize(text)
+
+        # 4. Нормализация токенов через кэш
+        cache = self._cache.setdefault(
+            self._options_key(use_stemming, use_lemmatization, remove_stopwords), {}
+        )
+        processed_tokens = []
+        for token in tokens:
+            form = cache.get(token, _MISSING)
+            if form is _MISSING:
+                self.cache_misses += 1
+                form = self._normalize_token(token, use_stemming, use_lemmatization, remove_stopwords)
+                self._remember(cache, token, form)
+            else:
+                self.cache_hits += 1
+
+            if form is not None:
+                processed_tokens.append(form)
+
+        return processed_tokens
+
+    def preprocess_batch(self, texts: List[str], workers: int = None,
+                         chunk_size: int = 200, **kwargs) -> List[List[str]]:
+        """
+        Препроцессинг батча текстов
+
+        Args:
+            workers: число процессов (по умолчанию self.workers); куски по chunk_size
+                текстов обрабатываются в пуле, новые записи кэша сливаются обратно
+        """
+        workers = workers or self.workers
+        if workers <= 1 or len(texts) <= chunk_size:
+            return [self.preprocess(text, **kwargs) for text in texts]
+
+        key = self._options_key(**kwargs)
+        cache = self._cache.setdefault(key, {})
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+
+        results = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_preprocess_worker,
+                                 initargs=(self.language, self._cache)) as pool:
+            for tokens, new_entries in pool.map(_preprocess_chunk, chunks, [kwargs] * len(chunks)):
+                results.extend(tokens)
+                for token, form in new_entries.items():
+                    if token not in cache:
+                        self._remember(cache, token, form)
+
+        return results
+
+    def cache_size(self) -> int:
+        return sum(len(cache) for cache in self._cache.values())
+
+
+class BM25WithPreprocessing:
+    """
+    BM25 с препроцессингом текста на инвертированном индексе
+
+    Для каждого термина хранится posting list (id документов и tf) в
+    NumPy массивах, IDF и нормировка длины документов считаются один раз
+    при обучении. Поиск складывает скоры только по документам из
+    posting lists терминов запроса.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, language: str = 'english',
+                 preprocess_workers: int = 1):
+        """
+        BM25 с препроцессингом текста
+
+        Args:
+            k1: параметр регулирования частоты термина
+            b: параметр регулирования длины документа
+            language: язык текста
+            preprocess_workers: число процессов для препроцессинга корпуса
+        """
+        self.k1 = k1
+        self.b = b
+        self.preprocessor = TextPreprocessor(language, workers=preprocess_workers)
+
+        # Статистики корпуса
+        self.doc_freq = {}  # DF(t)
+        self.term_freq = []  # TF(t, d)
+        self.doc_lengths = []  # |d|
+        self.avg_doc_length = 0.0
+        self.num_docs = 0
+        self.vocab = set()
+
+        # Инвертированный индекс
+        self.term_to_id: Dict[str, int] = {}
+        self.postings_ptr = np.zeros(1, dtype=np.int64)  # границы posting list термина
+        self.postings_docs = np.zeros(0, dtype=np.int32)  # id документов
+        self.postings_tf = np.zeros(0, dtype=np.float64)  # tf термина в документе
+        self.idf_array = np.zeros(0, dtype=np.float64)
+        self.length_norm = np.zeros(0, dtype=np.float64)  # 1 - b + b * |d| / avgdl
+
+        # Настройки препроцессинга
+        self.use_stemming = True
+        self.use_lemmatization = True
+        self.remove_stopwords = True
+
+    def set_preprocessing_options(self, use_stemming: bool = True,
+                                  use_lemmatization: bool = True,
+                                  remove_stopwords: bool = True):
+        """Настройка опций препроцессинга"""
+        self.use_stemming = use_stemming
+        self.use_lemmatization = use_lemmatization
+        self.remove_stopwords = remove_stopwords
+
+    def fit(self, documents: List[str]) -> 'BM25WithPreprocessing':
+        """
+        Обучение BM25 на корпусе документов с препроцессингом
+        """
+        print(f"Обучение BM25 с препроцессингом на {len(documents)} документах...")
+
+        # Препроцессинг всех документов
+        print("Препроцессинг документов...")
+        processed_docs = self.preprocessor.preprocess_batch(
+            documents,
+            use_stemming=self.use_stemming,
+            use_lemmatization=self.use_lemmatization,
+            remove_stopwords=self.remove_stopwords
+        )
+
+        return self.fit_tokens(processed_docs)
+
+    def fit_tokens(self, processed_docs: List[List[str]]) -> 'BM25WithPreprocessing':
+        """Обучение на уже препроцессированных документах"""
+        self.num_docs = len(processed_docs)
+        self.doc_freq = {}
+        self.term_freq = []
+        self.doc_lengths = []
+        self.vocab = set()
+
+        total_length = 0
+
+        for doc_tokens in processed_docs:
+            # Длина документа
+            doc_len = len(doc_tokens)
+            self.doc_lengths.append(doc_len)
+            total_length += doc_len
+
+            # Частоты терминов в документе
+            term_counts = {}
+            for token in doc_tokens:
+                term_counts[token] = term_counts.get(token, 0) + 1
+            self.term_freq.append(term_counts)
+
+            # Обновляем document frequency
+            for term in term_counts.keys():
+                self.doc_freq[term] = self.doc_freq.get(term, 0) + 1
+                self.vocab.add(term)
+
+        # Средняя длина документа
+        self.avg_doc_length = total_length / self.num_docs if self.num_docs > 0 else 0
+
+        self.term_to_id = {term: i for i, term in enumerate(self.doc_freq)}
+        self._build_index(self._count_matrix())
+
+        print(f"Обучение завершено:")
+        print(f"  - Документов: {self.num_docs}")
+        print(f"  - Уникальных терминов (после препроцессинга): {len(self.vocab)}")
+        print(f"  - Средняя длина документа: {self.avg_doc_length:.1f} токенов")
+
+        return self
+
+    def fit_count_matrix(self, counts: sparse.spmatrix, terms: List[str]) -> 'BM25WithPreprocessing':
+        """
+        Обучение по готовой матрице частот (документы x термины)
+
+        Словари term_freq при этом не заполняются - скоринг идет только по индексу.
+        """
+        counts = sparse.csr_matrix(counts)
+        self.num_docs = counts.shape[0]
+        self.doc_lengths = np.asarray(counts.sum(axis=1)).ravel().tolist()
+        self.avg_doc_length = sum(self.doc_lengths) / self.num_docs if self.num_docs > 0 else 0
+        self.term_freq = []
+
+        doc_freq = np.diff(counts.tocsc().indptr)
+        self.doc_freq = dict(zip(terms, doc_freq.tolist()))
+        self.vocab = set(terms)
+        self.term_to_id = {term: i for i, term in enumerate(terms)}
+
+        self._build_index(counts)
+        return self
+
+    def _count_matrix(self) -> sparse.csr_matrix:
+        """CSR матрица частот (документы x термины) из словарей term_freq"""
+        nnz = sum(len(term_counts) for term_counts in self.term_freq)
+        indptr = np.zeros(self.num_docs + 1, dtype=np.int64)
+        indices = np.empty(nnz, dtype=np.int32)
+        data = np.empty(nnz, dtype=np.float64)
+
+        pos = 0
+        for doc_idx, term_counts in enumerate(self.term_freq):
+            n = len(term_counts)
+            indices[pos:pos + n] = [self.term_to_id[t] for t in term_counts]
+            data[pos:pos + n] = list(term_counts.values())
+            pos += n
+            indptr[doc_idx + 1] = pos
+
+        return sparse.csr_matrix((data, indices, indptr), shape=(self.num_docs, len(self.term_to_id)))
+
+    def _build_index(self, counts: sparse.csr_matrix):
+        """Строит posting lists, массив IDF и нормировку длины документов"""
+        # CSC по терминам = posting lists, документы внутри отсортированы по id
+        csc = sparse.csc_matrix(counts, dtype=np.float64)
+        csc.sort_indices()
+        self.postings_ptr = csc.indptr.astype(np.int64)
+        self.postings_docs = csc.indices.astype(np.int32)
+        self.postings_tf = csc.data
+
+        doc_freq = np.diff(self.postings_ptr)
+        self.idf_array = np.array([self._idf_from_df(int(df)) for df in doc_freq], dtype=np.float64)
+
+        doc_lengths = np.asarray(self.doc_lengths, dtype=np.float64)
+        if self.avg_doc_length > 0:
+            self.length_norm = 1 - self.b + self.b * (doc_lengths / self.avg_doc_length)
+        else:
+            self.length_norm = np.ones_like(doc_lengths)
+
+    def save(self, path: str):
+        """Сохраняет модель вместе с индексом и кэшем препроцессора"""
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> 'BM25WithPreprocessing':
+        """Загружает модель, сохраненную через save"""
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def tokenize_query(self, query: str) -> List[str]:
+        """Токенизация запроса с тем же препроцессингом"""
+        return self.preprocessor.preprocess(
+            query,
+            use_stemming=self.use_stemming,
+            use_lemmatization=self.use_lemmatization,
+            remove_stopwords=self.remove_stopwords
+        )
+
+    def idf(self, term: str) -> float:
+        """Inverse Document Frequency"""
+        if term not in self.doc_freq:
+            return 0.0
+
+        return self._idf_from_df(self.doc_freq[term])
+
+    def _idf_from_df(self, df_t: int) -> float:
+        numerator = self.num_docs - df_t + 0.5
+        denominator = df_t + 0.5
+
+        if denominator <= 0 or numerator <= 0:
+            return 0.0
+
+        return math.log(numerator / denominator + 1)
+
+    def tf_component(self, tf: int, doc_len: int) -> float:
+        """Term Frequency компонент"""
+        length_norm = 1 - self.b + self.b * (doc_len / self.avg_doc_length)
+        numerator = tf * (self.k1 + 1)
+        denominator = tf + self.k1 * length_norm
+        return numerator / denominator if denominator > 0 else 0.0
+
+    def postings(self, term_id: int):
+        """(id документов, tf) для термина"""
+        start, end = self.postings_ptr[term_id], self.postings_ptr[term_id + 1]
+        return self.postings_docs[start:end], self.postings_tf[start:end]
+
+    def query_term_ids(self, query_tokens: List[str]) -> List[int]:
+        """Уникальные id терминов запроса из словаря (в порядке появления)"""
+        term_ids = []
+        for token in query_tokens:
+            term_id = self.term_to_id.get(token)
+            if term_id is not None and term_id not in term_ids:
+                term_ids.append(term_id)
+        return term_ids
+
+    def _contribution(self, term_id: int, docs: np.ndarray, tf: np.ndarray) -> np.ndarray:
+        # Те же операции, что в tf_component, поэтому скоры совпадают с точностью до бита
+        denominator = tf + self.k1 * self.length_norm[docs]
+        return self.idf_array[term_id] * (tf * (self.k1 + 1) / denominator)
+
+    def score_all(self, term_ids: List[int]) -> np.ndarray:
+        """Скоры всех документов: накопление только по posting lists терминов запроса"""
+        scores = np.zeros(self.num_docs)
+
+        for term_id in term_ids:
+            if self.idf_array[term_id] <= 0:
+                continue
+
+            docs, tf = self.postings(term_id)
+            scores[docs] += self._contribution(term_id, docs, tf)
+
+        return scores
+
+    def search(self, query: str, k: int = 10) -> tuple:
+        """
+        Поиск по запросу с препроцессингом
+        """
+        # Токенизация запроса
+        query_tokens = self.tokenize_query(query)
+
+        if not query_tokens:
+            return [], []
+
+        scores = self.score_all(self.query_term_ids(query_tokens))
+
+        return self._top_k(scores, k)
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> tuple:
+        """Топ-K индексов и скоров: по убыванию скора, при равенстве - по индексу"""
+        k = min(k, len(scores))
+        if k <= 0:
+            return [], []
+
+        if k < len(scores):
+            kth_score = np.partition(scores, len(scores) - k)[len(scores) - k]
+            candidates = np.flatnonzero(scores >= kth_score)
+        else:
+            candidates = np.arange(len(scores))
+
+        order = np.lexsort((candidates, -scores[candidates]))[:k]
+        sorted_indices = candidates[order]
+
+        return sorted_indices.tolist(), scores[sorted_indices].tolist()
+
+
+class BM25SearchSystem:
+    def __init__(self, bm25_model, article_metadata, article_id_to_idx):
+        """
+        Система поиска на основе BM25
+
+        Args:
+            bm25_model: обученная модель BM25
+            article_metadata: метаданные статей
+            article_id_to_idx: маппинг ID -> индекс
+        """
+        self.bm25 = bm25_model
+        self.article_metadata = article_metadata
+        self.id_to_idx = article_id_to_idx
+        self.idx_to_id = {idx: aid for aid, idx in article_id_to_idx.items()}
+
+    def search(self, query: str, k: int = 10) -> List[Dict]:
+        """
+        Поиск статей по запросу
+
+        Args:
+            query: поисковый запрос
+            k: количество результатов
+
+        Returns:
+            Список найденных статей с метаданными
+        """
+        indices, scores = self.bm25.search(query, k)
+
+        results = []
+        for idx, score in zip(indices, scores):
+            if idx < len(self.article_metadata):
+                metadata = self.article_metadata[idx]
+                result = {
+                    'id': metadata['id'],
+                    'title': metadata['title'],
+                    'score': float(score),
+                    'published_time': metadata.get('published_time', ''),
+                    'rank': len(results) + 1
+                }
+                results.append(result)
+
+        return results
+
+    def search_ids(self, query: str, k: int = 10) -> List[str]:
+        """
+        Поиск только ID статей
+
+        Args:
+            query: поисковый запрос
+            k: количество результатов
+
+        Returns:
+            Список ID статей
+        """
+        indices, _ = self.bm25.search(query, k)
+        article_ids = []
+
+        for idx in indices:
+            if idx in self.idx_to_id:
+                article_ids.append(self.idx_to_id[idx])
+            elif 0 <= idx < len(self.article_metadata):
+                article_ids.append(self.article_metadata[idx]['id'])
+
+        return article_ids
+
+
+def synthetic_count_matrix(num_docs: int, vocab_size: int = 50000, avg_doc_length: int = 300,
+                           zipf_a: float = 1.1, seed: int = 0,
+                           chunk_size: int = 20000) -> sparse.csr_matrix:
+    """Матрица частот синтетического корпуса: термины по закону Ципфа, длины ~ Пуассон"""
+    rng = np.random.default_rng(seed)
+    lengths = np.maximum(rng.poisson(avg_doc_length, num_docs), 1)
+    ranks = np.arange(1, vocab_size + 1, dtype=np.float64)
+    probs = ranks ** -zipf_a
+    probs /= probs.sum()
+
+    # Генерируем по частям, чтобы не держать в памяти все токены корпуса
+    chunks = []
+    for start in range(0, num_docs, chunk_size):
+        chunk_lengths = lengths[start:start + chunk_size]
+        term_ids = rng.choice(vocab_size, size=int(chunk_lengths.sum()), p=probs)
+        doc_ids = np.repeat(np.arange(len(chunk_lengths)), chunk_lengths)
+        chunk = sparse.csr_matrix(
+            (np.ones(len(term_ids)), (doc_ids, term_ids)), shape=(len(chunk_lengths), vocab_size)
+        )
+        chunk.sum_duplicates()
+        chunks.append(chunk)
+
+    counts = sparse.vstack(chunks, format='csr')
+    return counts
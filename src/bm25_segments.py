@@ -0,0 +1,347 @@
+import math
+import pickle
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from bm25_search import TextPreprocessor
+
+
+class Segment:
+    """
+    Неизменяемый сегмент индекса: матрица tf (документы x термины) и posting lists
+
+    Удаление документа только ставит отметку в deleted.
+    """
+
+    def __init__(self, keys: Sequence[str], seq: np.ndarray, counts: sparse.csr_matrix):
+        self.keys = list(keys)
+        self.seq = np.asarray(seq, dtype=np.int64)  # глобальный порядок добавления
+        self.counts = sparse.csr_matrix(counts, dtype=np.float64)
+        self.counts.sort_indices()
+        self.doc_lengths = np.asarray(self.counts.sum(axis=1), dtype=np.float64).ravel()
+        self.deleted = np.zeros(len(self.keys), dtype=bool)
+
+        csc = self.counts.tocsc()
+        csc.sort_indices()
+        self.postings_ptr = csc.indptr.astype(np.int64)
+        self.postings_docs = csc.indices.astype(np.int32)
+        self.postings_tf = csc.data
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def live_count(self) -> int:
+        return len(self.keys) - int(self.deleted.sum())
+
+    def postings(self, term_id: int):
+        """(строки сегмента, tf) для термина; пусто, если термин появился позже сегмента"""
+        if term_id + 1 >= len(self.postings_ptr):
+            return self.postings_docs[:0], self.postings_tf[:0]
+        start, end = self.postings_ptr[term_id], self.postings_ptr[term_id + 1]
+        return self.postings_docs[start:end], self.postings_tf[start:end]
+
+    def row_terms(self, row: int) -> np.ndarray:
+        return self.counts.indices[self.counts.indptr[row]:self.counts.indptr[row + 1]]
+
+
+class SegmentedBM25Index:
+    """
+    Инкрементально обновляемый BM25 индекс из сегментов
+
+    Новые документы попадают в небольшие неизменяемые сегменты, удаление -
+    отметка (tombstone). Глобальные DF, число документов и суммарная длина
+    поддерживаются при каждом добавлении и удалении, а IDF и нормировка
+    длины считаются во время запроса, поэтому скоры совпадают с полным
+    переобучением на живых документах. Мелкие сегменты сливаются
+    (в том числе в фоновом потоке), заодно вычищаются удаленные документы.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75,
+                 preprocessor: Optional[TextPreprocessor] = None,
+                 merge_factor: int = 4, max_deleted_ratio: float = 0.5):
+        """
+        Args:
+            k1, b: параметры BM25
+            preprocessor: препроцессор для add_texts / search (как у BM25WithPreprocessing)
+            merge_factor: сколько сегментов одного размера сливаются в один
+            max_deleted_ratio: доля удаленных, после которой сегмент переписывается
+        """
+        self.k1 = k1
+        self.b = b
+        self.preprocessor = preprocessor
+        self.merge_factor = merge_factor
+        self.max_deleted_ratio = max_deleted_ratio
+
+        self.segments: List[Segment] = []
+        self.term_to_id: Dict[str, int] = {}
+        self.doc_freq = np.zeros(0, dtype=np.int64)  # DF по живым документам
+        self.num_docs = 0
+        self.total_length = 0
+        self._locations: Dict[str, Tuple[Segment, int]] = {}
+        self._next_seq = 0
+
+        self._lock = threading.RLock()
+        # Слияния идут по одному: иначе два слияния могут взять одни и те же сегменты
+        self._merge_lock = threading.Lock()
+        self._merge_thread: Optional[threading.Thread] = None
+        self._stop_merging = threading.Event()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('_lock', '_merge_lock', '_merge_thread', '_stop_merging'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+        self._merge_lock = threading.Lock()
+        self._merge_thread = None
+        self._stop_merging = threading.Event()
+
+    @property
+    def avg_doc_length(self) -> float:
+        return self.total_length / self.num_docs if self.num_docs > 0 else 0
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def _preprocess(self, text: str) -> List[str]:
+        if self.preprocessor is None:
+            raise ValueError("Индекс создан без препроцессора - передавайте токены")
+        return self.preprocessor.preprocess(text)
+
+    def add_texts(self, keys: Sequence[str], texts: Sequence[str]) -> Segment:
+        """Препроцессинг и добавление документов"""
+        return self.add_documents(keys, self.preprocessor.preprocess_batch(list(texts)))
+
+    def add_documents(self, keys: Sequence[str], token_lists: Sequence[List[str]]) -> Segment:
+        """
+        Добавляет документы новым сегментом
+
+        Документ с уже существующим ключом заменяется (старая версия удаляется).
+        """
+        with self._lock:
+            for key in keys:
+                if key in self._locations:
+                    self.delete(key)
+
+            indptr = [0]
+            indices = []
+            data = []
+            for tokens in token_lists:
+                term_counts = {}
+                for token in tokens:
+                    term_id = self.term_to_id.get(token)
+                    if term_id is None:
+                        term_id = self.term_to_id[token] = len(self.term_to_id)
+                    term_counts[term_id] = term_counts.get(term_id, 0) + 1
+                indices.extend(term_counts.keys())
+                data.extend(term_counts.values())
+                indptr.append(len(indices))
+
+            counts = sparse.csr_matrix((data, indices, indptr), shape=(len(keys), len(self.term_to_id)))
+            seq = np.arange(self._next_seq, self._next_seq + len(keys))
+            self._next_seq += len(keys)
+            segment = Segment(keys, seq, counts)
+
+            if len(self.doc_freq) < len(self.term_to_id):
+                self.doc_freq = np.concatenate((
+                    self.doc_freq, np.zeros(len(self.term_to_id) - len(self.doc_freq), dtype=np.int64)
+                ))
+            self.doc_freq += np.diff(segment.postings_ptr)
+            self.num_docs += len(keys)
+            self.total_length += int(segment.doc_lengths.sum())
+
+            self.segments.append(segment)
+            for row, key in enumerate(keys):
+                self._locations[key] = (segment, row)
+            return segment
+
+    def delete(self, key: str) -> bool:
+        """Удаляет документ (tombstone), глобальная статистика пересчитывается сразу"""
+        with self._lock:
+            location = self._locations.pop(key, None)
+            if location is None:
+                return False
+            segment, row = location
+            segment.deleted[row] = True
+            self.doc_freq[segment.row_terms(row)] -= 1
+            self.num_docs -= 1
+            self.total_length -= int(segment.doc_lengths[row])
+            return True
+
+    def idf(self, term_id: int) -> float:
+        """IDF по живым документам (формула BM25WithPreprocessing.idf)"""
+        df_t = int(self.doc_freq[term_id])
+        if df_t == 0:
+            return 0.0
+        numerator = self.num_docs - df_t + 0.5
+        denominator = df_t + 0.5
+        if denominator <= 0 or numerator <= 0:
+            return 0.0
+        return math.log(numerator / denominator + 1)
+
+    def search(self, query: str, k: int = 10) -> Tuple[List[str], List[float]]:
+        """Поиск по тексту запроса"""
+        return self.search_tokens(self._preprocess(query), k)
+
+    def search_tokens(self, query_tokens: List[str], k: int = 10) -> Tuple[List[str], List[float]]:
+        """
+        Поиск по токенам запроса
+
+        Returns:
+            (ключи документов, скоры) по убыванию скора; только документы с ненулевым скором
+        """
+        with self._lock:
+            term_ids = []
+            for token in query_tokens:
+                term_id = self.term_to_id.get(token)
+                if term_id is not None and term_id not in term_ids:
+                    term_ids.append(term_id)
+
+            idf = {term_id: self.idf(term_id) for term_id in term_ids}
+            avg_doc_length = self.avg_doc_length
+
+            all_scores, all_seq, all_keys = [], [], []
+            for segment in self.segments:
+                scores = np.zeros(len(segment))
+                for term_id in term_ids:
+                    if idf[term_id] <= 0:
+                        continue
+                    docs, tf = segment.postings(term_id)
+                    # Те же операции, что в BM25WithPreprocessing: скоры совпадают с полным переобучением
+                    length_norm = 1 - self.b + self.b * (segment.doc_lengths[docs] / avg_doc_length)
+                    scores[docs] += idf[term_id] * (tf * (self.k1 + 1) / (tf + self.k1 * length_norm))
+
+                matched = np.flatnonzero((scores > 0) & ~segment.deleted)
+                if len(matched) > k:
+                    kth = np.partition(scores[matched], len(matched) - k)[len(matched) - k]
+                    matched = matched[scores[matched] >= kth]
+                all_scores.append(scores[matched])
+                all_seq.append(segment.seq[matched])
+                all_keys.extend(segment.keys[row] for row in matched)
+
+        if not all_keys:
+            return [], []
+        scores = np.concatenate(all_scores)
+        seq = np.concatenate(all_seq)
+        # По убыванию скора, при равенстве - в порядке добавления
+        order = np.lexsort((seq, -scores))[:k]
+        return [all_keys[i] for i in order], scores[order].tolist()
+
+    def _merge_candidates(self) -> List[Segment]:
+        """Сегменты для слияния: merge_factor сегментов одного уровня размера или сегмент с массой удаленных"""
+        by_tier: Dict[int, List[Segment]] = {}
+        for segment in self.segments:
+            if segment.live_count == 0 or segment.live_count < len(segment) * (1 - self.max_deleted_ratio):
+                return [segment]
+            tier = int(math.log(max(segment.live_count, 1), self.merge_factor))
+            by_tier.setdefault(tier, []).append(segment)
+
+        for tier in sorted(by_tier):
+            if len(by_tier[tier]) >= self.merge_factor:
+                return by_tier[tier][:self.merge_factor]
+        return []
+
+    def _merge(self, sources: List[Segment]) -> Optional[Segment]:
+        """Сливает сегменты в один, вычищая удаленные документы"""
+        with self._lock:
+            num_terms = len(self.term_to_id)
+            snapshot = [(segment, np.flatnonzero(~segment.deleted)) for segment in sources]
+
+        # Тяжелая часть - вне блокировки: поиск и добавление продолжают работать
+        blocks, keys, seq, origins = [], [], [], []
+        for segment, rows in snapshot:
+            counts = segment.counts[rows]
+            counts.resize((len(rows), num_terms))
+            blocks.append(counts)
+            keys.extend(segment.keys[row] for row in rows)
+            seq.append(segment.seq[rows])
+            origins.extend((segment, row) for row in rows)
+
+        merged = None
+        if keys:
+            merged = Segment(keys, np.concatenate(seq), sparse.vstack(blocks, format='csr'))
+
+        with self._lock:
+            if merged is not None:
+                for new_row, (segment, row) in enumerate(origins):
+                    if segment.deleted[row]:
+                        # Удален во время слияния: статистика уже пересчитана в delete
+                        merged.deleted[new_row] = True
+                    else:
+                        self._locations[merged.keys[new_row]] = (merged, new_row)
+
+            position = min(self.segments.index(segment) for segment in sources)
+            self.segments = [segment for segment in self.segments if segment not in sources]
+            if merged is not None:
+                self.segments.insert(position, merged)
+        return merged
+
+    def maybe_merge(self) -> bool:
+        """Одно слияние, если есть что сливать"""
+        with self._merge_lock:
+            with self._lock:
+                sources = self._merge_candidates()
+            if not sources:
+                return False
+            self._merge(sources)
+            return True
+
+    def optimize(self):
+        """Сливает все сегменты в один"""
+        with self._merge_lock:
+            with self._lock:
+                sources = list(self.segments)
+            if sources:
+                self._merge(sources)
+
+    def start_background_merging(self, interval: float = 5.0):
+        """Фоновый поток, периодически сливающий сегменты"""
+        if self._merge_thread is not None:
+            return
+        self._stop_merging.clear()
+
+        def loop():
+            while not self._stop_merging.wait(interval):
+                while self.maybe_merge():
+                    pass
+
+        self._merge_thread = threading.Thread(target=loop, daemon=True)
+        self._merge_thread.start()
+
+    def stop_background_merging(self):
+        if self._merge_thread is None:
+            return
+        self._stop_merging.set()
+        self._merge_thread.join()
+        self._merge_thread = None
+
+    def tf_matrix(self, segment: Segment, avg_doc_length: float = None) -> sparse.csr_matrix:
+        """
+        Веса tf_component сегмента без IDF - для sparse векторов Qdrant с Modifier.IDF
+
+        IDF тогда применяет Qdrant во время запроса, и старые точки не нужно
+        переписывать при росте корпуса. Средняя длина фиксируется (по умолчанию
+        текущая), поэтому нормировка длины у старых точек - приближение.
+        """
+        avg_doc_length = avg_doc_length or self.avg_doc_length
+        counts = segment.counts.tocoo()
+        length_norm = 1 - self.b + self.b * (segment.doc_lengths[counts.row] / avg_doc_length)
+        weights = counts.data * (self.k1 + 1) / (counts.data + self.k1 * length_norm)
+        return sparse.csr_matrix((weights, (counts.row, counts.col)), shape=counts.shape)
+
+    def save(self, path: str):
+        """Сохраняет индекс (сегменты, статистику и кэш препроцессора)"""
+        with self._lock, open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> 'SegmentedBM25Index':
+        with open(path, 'rb') as f:
+            return pickle.load(f)
@@ -0,0 +1,147 @@
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Iterable, Optional, Set, Tuple
+
+
+def content_hash(text: str) -> str:
+    """Хэш извлеченного текста статьи"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class CrawlLedger:
+    """
+    Персистентный журнал просмотренных URL (SQLite)
+
+    Хранит для каждой статьи хэш текста и валидаторы HTTP кэша
+    (ETag / Last-Modified), чтобы повторный обход скачивал и отдавал
+    дальше только новые или измененные статьи.
+
+    Статья, которую краулер отдает дальше, должна попадать в журнал только
+    после того, как получатель ее сохранил (mark_done краулера): иначе
+    падение между записью в журнал и записью в JSONL / Qdrant теряет ее
+    навсегда - при следующем обходе она UNCHANGED. Поэтому проверка
+    (status) и запись (record) разделены. Журналом можно пользоваться из
+    нескольких потоков.
+    """
+
+    NEW = "new"
+    CHANGED = "changed"
+    UNCHANGED = "unchanged"
+
+    def __init__(self, path: str = "crawl_ledger.sqlite"):
+        self.path = path
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS articles (
+                url TEXT PRIMARY KEY,
+                article_id TEXT,
+                content_hash TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                first_seen TEXT,
+                last_checked TEXT
+            )
+        """)
+        self.conn.commit()
+
+    def known_urls(self, urls: Iterable[str]) -> Set[str]:
+        """Возвращает подмножество URL, которые уже есть в журнале"""
+        urls = list(urls)
+        known = set()
+        # Ограничение SQLite на число параметров в запросе
+        with self._lock:
+            for i in range(0, len(urls), 500):
+                chunk = urls[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT url FROM articles WHERE url IN ({placeholders})", chunk
+                ).fetchall()
+                known.update(row[0] for row in rows)
+        return known
+
+    def validators(self, url: str) -> Tuple[Optional[str], Optional[str]]:
+        """(etag, last_modified) для условного GET"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT etag, last_modified FROM articles WHERE url = ?", (url,)
+            ).fetchone()
+        return row if row else (None, None)
+
+    def conditional_headers(self, url: str) -> dict:
+        """Заголовки If-None-Match / If-Modified-Since для известного URL"""
+        etag, last_modified = self.validators(url)
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def touch(self, url: str):
+        """Отмечает, что URL проверен (например, сервер ответил 304)"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE articles SET last_checked = ? WHERE url = ?",
+                (datetime.now().isoformat(), url)
+            )
+            self.conn.commit()
+
+    def status(self, url: str, text: Optional[str]) -> str:
+        """NEW, CHANGED или UNCHANGED для текста статьи - без записи в журнал"""
+        new_hash = content_hash(text) if text else None
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT content_hash FROM articles WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return self.NEW
+        return self.UNCHANGED if row[0] == new_hash else self.CHANGED
+
+    def record(self,
+               url: str,
+               article_id: str,
+               text: Optional[str],
+               etag: Optional[str] = None,
+               last_modified: Optional[str] = None) -> str:
+        """
+        Записывает результат загрузки статьи
+
+        Returns:
+            NEW, CHANGED или UNCHANGED в зависимости от хэша текста
+        """
+        new_hash = content_hash(text) if text else None
+        now = datetime.now().isoformat()
+
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT content_hash FROM articles WHERE url = ?", (url,)
+            ).fetchone()
+
+            if row is None:
+                status = self.NEW
+                self.conn.execute(
+                    "INSERT INTO articles VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (url, article_id, new_hash, etag, last_modified, now, now)
+                )
+            else:
+                status = self.UNCHANGED if row[0] == new_hash else self.CHANGED
+                self.conn.execute(
+                    """UPDATE articles
+                       SET content_hash = ?, etag = ?, last_modified = ?, last_checked = ?
+                       WHERE url = ?""",
+                    (new_hash, etag, last_modified, now, url)
+                )
+
+            self.conn.commit()
+        return status
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,195 @@
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+from article_store import parse_published_time
+from vector_store import QuantizedVectorStore, top_k_indices
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2 нормализация строк (нулевые строки остаются нулевыми, как в sklearn normalize)"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def published_timestamps(published_times: Sequence) -> np.ndarray:
+    """
+    Unix-время публикации (секунды, UTC) для каждой статьи, NaN - дата не распознана
+
+    Разбирается только каждое уникальное значение: у статей одного
+    дня строки дат совпадают.
+    """
+    parsed = {}
+    for value in published_times:
+        key = value if isinstance(value, (str, datetime)) else str(value)
+        if key not in parsed:
+            moment = parse_published_time(value)
+            parsed[key] = moment.timestamp() if moment else np.nan
+    return np.fromiter((parsed[value if isinstance(value, (str, datetime)) else str(value)]
+                        for value in published_times), dtype=np.float64, count=len(published_times))
+
+
+def to_timestamp(moment) -> float:
+    """Unix-время для datetime / date / строки ISO (время без зоны - UTC)"""
+    parsed = parse_published_time(moment)
+    if parsed is None:
+        raise ValueError(f"Не удалось разобрать дату: {moment!r}")
+    return parsed.timestamp()
+
+
+def recency_scores(published_times: Sequence[str], time_decay_days: int = 365,
+                   now: datetime = None) -> np.ndarray:
+    """
+    Временной скор статей, нормированный к [0, 1]
+
+    Экспоненциальный затухающий буст exp(-дней / time_decay_days),
+    статьи без корректной даты получают минимальный скор 0.1.
+    """
+    current_time = to_timestamp(now or datetime.now(timezone.utc))
+    timestamps = published_timestamps(published_times)
+
+    # Целое число прошедших дней, как timedelta.days
+    days_diff = np.floor((current_time - timestamps) / 86400.0)
+    with np.errstate(invalid='ignore'):
+        time_scores = np.exp(-days_diff / time_decay_days).astype(np.float32)
+    time_scores[np.isnan(timestamps)] = 0.1  # Минимальный скор для статей без даты
+
+    if len(time_scores) and time_scores.max() > 0:
+        time_scores /= time_scores.max()
+    return time_scores
+
+
+class DenseSearchIndex:
+    """
+    Индекс для поиска по dense эмбеддингам
+
+    Хранит нормализованные матрицы текстов и названий, массив
+    индекс -> ID и заранее посчитанный временной скор. Запросы можно
+    передавать батчем: скоры считаются одним матричным произведением,
+    top-K выбирается через argpartition.
+
+    Вместо матриц можно передать QuantizedVectorStore: тогда скоры
+    считаются по квантованным векторам, а top-K * oversample кандидатов
+    пересчитываются по полной точности.
+    """
+
+    def __init__(self, text_embeddings: Union[np.ndarray, QuantizedVectorStore], article_ids: Sequence[str],
+                 title_embeddings: Union[np.ndarray, QuantizedVectorStore, None] = None,
+                 published_times: Optional[Sequence[str]] = None,
+                 time_decay_days: int = 365, now: datetime = None, oversample: int = 4):
+        """
+        Args:
+            text_embeddings: эмбеддинги текстов статей (N x d) или квантованное хранилище
+            article_ids: ID статей в том же порядке
+            title_embeddings: эмбеддинги названий (N x d) или хранилище, опционально
+            published_times: даты публикации в ISO формате, опционально
+            time_decay_days: масштаб затухания временного буста в днях
+            now: момент, от которого считается свежесть (по умолчанию - сейчас)
+            oversample: во сколько раз больше кандидатов пересчитывать для хранилищ
+        """
+        if len(article_ids) != len(text_embeddings):
+            raise ValueError(f"Число ID ({len(article_ids)}) не совпадает "
+                             f"с числом эмбеддингов ({len(text_embeddings)})")
+
+        self.text_embeddings = self._prepare(text_embeddings)
+        self.title_embeddings = self._prepare(title_embeddings) if title_embeddings is not None else None
+        self.article_ids = np.asarray(article_ids, dtype=object)
+        self.recency = (recency_scores(published_times, time_decay_days, now)
+                        if published_times is not None else None)
+        self.oversample = oversample
+
+    @staticmethod
+    def _prepare(embeddings):
+        if isinstance(embeddings, QuantizedVectorStore):
+            return embeddings
+        return normalize_rows(embeddings)
+
+    @property
+    def quantized(self) -> bool:
+        return any(isinstance(source, QuantizedVectorStore)
+                   for source in (self.text_embeddings, self.title_embeddings))
+
+    def __len__(self) -> int:
+        return len(self.article_ids)
+
+    @staticmethod
+    def _similarities(source, queries: np.ndarray, candidates: np.ndarray = None) -> np.ndarray:
+        """Скоры по матрице или хранилищу: по всем статьям или только по кандидатам (Q x C)"""
+        if isinstance(source, QuantizedVectorStore):
+            if candidates is None:
+                return source.scores(queries)
+            return source.rescore(queries, candidates)
+        if candidates is None:
+            return queries @ source.T
+        return np.einsum('qcd,qd->qc', source[candidates], queries)
+
+    def scores(self, query_embeddings: np.ndarray, text_weight: float = 1.0,
+               title_weight: float = 0.0, recency_weight: float = 0.0,
+               candidates: np.ndarray = None) -> np.ndarray:
+        """
+        Комбинированные скоры для батча запросов
+
+        Args:
+            query_embeddings: нормализованные эмбеддинги запросов (Q x d) или один запрос (d,)
+            candidates: если задано (Q x C) - точные скоры только этих статей
+
+        Returns:
+            матрица скоров (Q x N) или (Q x C)
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+
+        if text_weight:
+            combined = self._similarities(self.text_embeddings, queries, candidates)
+            if text_weight != 1.0:
+                combined *= text_weight
+        else:
+            shape = (len(queries), len(self)) if candidates is None else candidates.shape
+            combined = np.zeros(shape, dtype=np.float32)
+
+        if title_weight:
+            if self.title_embeddings is None:
+                raise ValueError("Индекс создан без эмбеддингов названий")
+            combined += title_weight * self._similarities(self.title_embeddings, queries, candidates)
+
+        if recency_weight:
+            if self.recency is None:
+                raise ValueError("Индекс создан без дат публикации")
+            combined += recency_weight * (self.recency if candidates is None else self.recency[candidates])
+
+        return combined
+
+    @staticmethod
+    def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """Индексы top-K по убыванию скора для каждой строки (Q x k)"""
+        return top_k_indices(scores, k)
+
+    def search_batch(self, query_embeddings: np.ndarray, k: int = 10, **weights) -> List[List[str]]:
+        """
+        Поиск для батча запросов
+
+        Args:
+            query_embeddings: нормализованные эмбеддинги запросов (Q x d)
+            k: количество результатов
+            **weights: text_weight, title_weight, recency_weight
+
+        Returns:
+            список ID статей для каждого запроса
+        """
+        scores = self.scores(query_embeddings, **weights)
+
+        if self.quantized:
+            # Кандидаты по квантованным скорам, итоговый порядок - по полной точности
+            candidates = self.top_k(scores, k * self.oversample)
+            exact = self.scores(query_embeddings, candidates=candidates, **weights)
+            top_indices = np.take_along_axis(candidates, self.top_k(exact, k), axis=1)
+        else:
+            top_indices = self.top_k(scores, k)
+
+        return [self.article_ids[row].tolist() for row in top_indices]
+
+    def search(self, query_embedding: np.ndarray, k: int = 10, **weights) -> List[str]:
+        """Поиск для одного запроса"""
+        return self.search_batch(np.atleast_2d(query_embedding), k, **weights)[0]
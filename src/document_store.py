@@ -0,0 +1,365 @@
+import argparse
+import json
+import shutil
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from article_store import iter_articles
+from instrumentation import METRICS
+
+COMPRESSIONS = ('none', 'zlib', 'zstd')
+
+# Расположение документа: блок и срез внутри распакованного блока
+LOCATION_DTYPE = np.dtype([('block', np.int64), ('start', np.int64), ('length', np.int64)])
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Для сжатия 'zstd' нужен пакет zstandard (pip install zstandard), "
+                          "либо используйте compression='zlib'")
+    return zstandard
+
+
+def _make_compressor(compression: str, level: int):
+    if compression == 'zstd':
+        return _zstd().ZstdCompressor(level=level).compress
+    if compression == 'zlib':
+        return lambda data: zlib.compress(data, level)
+    return bytes
+
+
+def _make_decompressor(compression: str):
+    if compression == 'zstd':
+        return _zstd().ZstdDecompressor().decompress
+    if compression == 'zlib':
+        return zlib.decompress
+    return bytes
+
+
+class DocumentStoreWriter:
+    """
+    Потоковая запись документов в хранилище DocumentStore
+
+    Документы сериализуются в JSON и копятся в блоке; заполненный блок
+    сжимается целиком (соседние статьи сжимаются лучше, чем по одной)
+    и дописывается в data.bin. Индекс id -> (блок, смещение, длина)
+    сортируется по id и сохраняется при закрытии. Повторный id
+    перезаписывает предыдущую версию документа.
+    """
+
+    def __init__(self, path: str, compression: str = 'zlib', block_bytes: int = 16 * 1024, level: int = 3):
+        """
+        Args:
+            path: директория хранилища (перезаписывается)
+            compression: 'none', 'zlib' или 'zstd' (нужен пакет zstandard)
+            block_bytes: размер несжатого блока; больше - лучше сжатие, дороже чтение одного документа
+            level: уровень сжатия
+        """
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Неизвестное сжатие '{compression}', доступны: {COMPRESSIONS}")
+
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.compression = compression
+        self.block_bytes = block_bytes
+        self._compress = _make_compressor(compression, level)
+
+        self._data = open(self.path / DocumentStore.DATA_FILE, 'wb')
+        self._block_offsets = [0]
+        self._buffer = bytearray()
+        self._locations: Dict[str, tuple] = {}
+        self.raw_bytes = 0
+
+    def add(self, doc_id: str, document: Dict):
+        """Добавляет документ под ключом doc_id"""
+        data = json.dumps(document, ensure_ascii=False).encode('utf-8')
+        block = len(self._block_offsets) - 1
+        self._locations[str(doc_id)] = (block, len(self._buffer), len(data))
+        self._buffer += data
+        self.raw_bytes += len(data)
+        if len(self._buffer) >= self.block_bytes:
+            self._flush_block()
+
+    def add_articles(self, articles: Iterable[Dict]) -> Iterator[Dict]:
+        """
+        Записывает статьи по ключу 'id' и отдает их дальше без изменений
+
+        Позволяет заполнить хранилище за тот же проход по ленивому
+        итератору статей, что и загрузку точек в Qdrant.
+        """
+        for i, article in enumerate(articles):
+            self.add(article.get('id', str(i)), article)
+            yield article
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def _flush_block(self):
+        if not self._buffer:
+            return
+        self._data.write(self._compress(bytes(self._buffer)))
+        self._block_offsets.append(self._data.tell())
+        self._buffer = bytearray()
+
+    def close(self):
+        """Дописывает последний блок и сохраняет индекс"""
+        if self._data.closed:
+            return
+        self._flush_block()
+        self._data.close()
+
+        keys = sorted(self._locations)
+        key_dtype = f"S{max((len(key.encode('utf-8')) for key in keys), default=1)}"
+        np.save(self.path / "keys.npy", np.array([key.encode('utf-8') for key in keys], dtype=key_dtype))
+        np.save(self.path / "locations.npy", np.array([self._locations[key] for key in keys], dtype=LOCATION_DTYPE))
+        np.save(self.path / "blocks.npy", np.asarray(self._block_offsets, dtype=np.int64))
+
+        with open(self.path / DocumentStore.META_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'compression': self.compression, 'count': len(keys), 'block_bytes': self.block_bytes,
+                       'raw_bytes': self.raw_bytes, 'stored_bytes': self._block_offsets[-1]}, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class DocumentStore:
+    """
+    Локальное хранилище полных документов вне Qdrant
+
+    Qdrant хранит в payload только поля для фильтрации, а полные
+    статьи (с неурезанным текстом) лежат здесь: data.bin читается
+    через memory-map, отсортированные ключи keys.npy и их расположения
+    locations.npy тоже открываются через mmap, поиск ключей - бинарный
+    (np.searchsorted) без словаря в памяти. Распакованные блоки
+    кэшируются (LRU на cache_blocks блоков).
+    """
+
+    META_FILE = "meta.json"
+    DATA_FILE = "data.bin"
+
+    def __init__(self, path: str, cache_blocks: int = 64):
+        """
+        Args:
+            path: директория, созданная DocumentStoreWriter / build
+            cache_blocks: сколько распакованных блоков держать в памяти
+        """
+        self.path = Path(path)
+        with open(self.path / self.META_FILE, 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+
+        self.compression = self.meta['compression']
+        self._decompress = _make_decompressor(self.compression)
+        self.keys = np.load(self.path / "keys.npy", mmap_mode='r')
+        self.locations = np.load(self.path / "locations.npy", mmap_mode='r')
+        self.block_offsets = np.load(self.path / "blocks.npy")
+        data_path = self.path / self.DATA_FILE
+        # np.memmap не умеет отображать пустой файл
+        self.data = np.memmap(data_path, dtype=np.uint8, mode='r') if data_path.stat().st_size else np.empty(0, np.uint8)
+
+        self.cache_blocks = cache_blocks
+        self._cache: OrderedDict = OrderedDict()
+
+    @classmethod
+    def build(cls, articles: Iterable[Dict], path: str, **writer_kwargs) -> 'DocumentStore':
+        """Создает хранилище из статей (ключ - поле 'id') и открывает его"""
+        with DocumentStoreWriter(path, **writer_kwargs) as writer:
+            for _ in writer.add_articles(articles):
+                pass
+        return cls(path)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, doc_id) -> bool:
+        return self._rows([doc_id])[0] >= 0
+
+    @property
+    def nbytes(self) -> int:
+        """Размер хранилища на диске"""
+        return sum(f.stat().st_size for f in self.path.iterdir() if f.is_file())
+
+    def _rows(self, doc_ids: Sequence) -> np.ndarray:
+        """Строки индекса для ключей (-1 для отсутствующих)"""
+        if len(self.keys) == 0:
+            return np.full(len(doc_ids), -1, dtype=np.int64)
+        wanted = np.array([str(doc_id).encode('utf-8') for doc_id in doc_ids], dtype=self.keys.dtype)
+        rows = np.minimum(np.searchsorted(self.keys, wanted), len(self.keys) - 1)
+        # Ключ длиннее ширины dtype обрезается при приведении - сравниваем исходные байты
+        found = np.array([self.keys[row] == str(doc_id).encode('utf-8') for row, doc_id in zip(rows, doc_ids)],
+                         dtype=bool)
+        return np.where(found, rows, -1)
+
+    def _block(self, block: int) -> bytes:
+        cached = self._cache.get(block)
+        if cached is not None:
+            self._cache.move_to_end(block)
+            return cached
+
+        start, end = self.block_offsets[block], self.block_offsets[block + 1]
+        data = self._decompress(self.data[start:end].tobytes())
+        self._cache[block] = data
+        if len(self._cache) > self.cache_blocks:
+            self._cache.popitem(last=False)
+        return data
+
+    def get_many(self, doc_ids: Sequence, fields: Sequence[str] = None) -> List[Optional[Dict]]:
+        """
+        Документы по списку id одним батчем
+
+        Каждый нужный блок читается и распаковывается один раз, в
+        порядке расположения на диске; без сжатия документы читаются
+        срезом memory-map без чтения всего блока.
+
+        Args:
+            doc_ids: id документов (например, результат поиска)
+            fields: оставить только эти поля (None - документ целиком)
+
+        Returns:
+            документы в порядке doc_ids, None для отсутствующих id
+        """
+        doc_ids = list(doc_ids)
+        with METRICS.timer('hydrate'):
+            rows = self._rows(doc_ids)
+            result: List[Optional[Dict]] = [None] * len(doc_ids)
+
+            found = np.flatnonzero(rows >= 0)
+            locations = self.locations[rows[found]]
+            order = np.lexsort((locations['start'], locations['block']))
+            for position in order:
+                block, start, length = (int(value) for value in locations[position])
+                if self.compression == 'none':
+                    offset = self.block_offsets[block] + start
+                    raw = self.data[offset:offset + length].tobytes()
+                else:
+                    raw = self._block(block)[start:start + length]
+
+                document = json.loads(raw)
+                if fields is not None:
+                    document = {field: document[field] for field in fields if field in document}
+                result[found[position]] = document
+
+            METRICS.inc('stage_items_total', len(found), stage='hydrate')
+        return result
+
+    def get(self, doc_id, fields: Sequence[str] = None) -> Optional[Dict]:
+        """Один документ по id (None, если его нет)"""
+        return self.get_many([doc_id], fields)[0]
+
+
+def _dir_bytes(path: Path) -> int:
+    return sum(f.stat().st_size for f in Path(path).rglob('*') if f.is_file())
+
+
+def compare_payload_modes(articles: List[Dict], work_dir: str, dim: int = 64, k: int = 10,
+                          queries: int = 200, compression: str = 'zlib') -> List[Dict]:
+    """
+    Сравнение полного payload в Qdrant с урезанным payload + DocumentStore
+
+    Обе коллекции создаются в локальном Qdrant со случайными векторами
+    одинаковой размерности, поэтому разница в размере и задержке
+    обусловлена только payload. Задержка - поиск top-k вместе с
+    получением текстов статей (из payload или из хранилища).
+
+    Returns:
+        список словарей с режимом, размером на диске, мс/запрос
+    """
+    from qdrant_client import QdrantClient, models
+
+    from setup_qdrant import FILTER_FIELDS, iter_dense_points
+
+    work_dir = Path(work_dir)
+    if work_dir.exists():
+        shutil.rmtree(work_dir)
+
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((len(articles), dim)).astype(np.float32)
+    query_vectors = rng.standard_normal((queries, dim)).astype(np.float32)
+
+    results = []
+    for mode in ('full_payload', 'document_store'):
+        client = QdrantClient(path=str(work_dir / mode / 'qdrant'))
+        client.create_collection(mode, vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE))
+
+        store = None
+        source = articles
+        if mode == 'document_store':
+            writer = DocumentStoreWriter(work_dir / mode / 'docs', compression=compression)
+            source = writer.add_articles(articles)
+        payload_fields = FILTER_FIELDS if mode == 'document_store' else None
+        points = list(iter_dense_points(embeddings, source, payload_fields=payload_fields))
+        for start in range(0, len(points), 256):
+            client.upsert(mode, points[start:start + 256], wait=True)
+        if mode == 'document_store':
+            writer.close()
+            store = DocumentStore(work_dir / mode / 'docs')
+
+        payload_bytes = sum(len(json.dumps(point.payload, ensure_ascii=False)) for point in points)
+        start = time.perf_counter()
+        for vector in query_vectors:
+            if store is None:
+                hits = client.query_points(mode, query=vector.tolist(), limit=k, with_payload=True).points
+                texts = [hit.payload.get('text', '') for hit in hits]
+            else:
+                hits = client.query_points(mode, query=vector.tolist(), limit=k, with_payload=['id']).points
+                texts = [doc['text'] if doc else '' for doc in store.get_many([hit.payload['id'] for hit in hits])]
+        ms = (time.perf_counter() - start) / queries * 1000
+        client.close()
+
+        results.append({
+            'mode': mode,
+            'payload_mb': payload_bytes / 2**20,
+            'qdrant_mb': _dir_bytes(work_dir / mode / 'qdrant') / 2**20,
+            'store_mb': store.nbytes / 2**20 if store is not None else 0.0,
+            'text_chars': len(texts[0]) if texts else 0,
+            'ms': ms,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Хранилище документов вне Qdrant: размер и задержка")
+    parser.add_argument('articles', help='файл со статьями (.json или .jsonl)')
+    parser.add_argument('--store-dir', default='./temp_embeddings/document_store')
+    parser.add_argument('--compression', default='zlib', choices=COMPRESSIONS)
+    parser.add_argument('--block-kb', type=int, default=16)
+    parser.add_argument('--compare', action='store_true',
+                        help='сравнить с полным payload в локальном Qdrant')
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    store = DocumentStore.build(iter_articles(args.articles), args.store_dir,
+                                compression=args.compression, block_bytes=args.block_kb * 1024)
+    raw_mb = store.meta['raw_bytes'] / 2**20
+    print(f"Документов: {len(store)}, JSON {raw_mb:.1f} МБ -> на диске {store.nbytes / 2**20:.1f} МБ "
+          f"({args.compression}), сборка {time.perf_counter() - start:.1f} с")
+
+    ids = [key.decode('utf-8') for key in store.keys[np.random.default_rng(0).integers(0, len(store), 1000)]]
+    start = time.perf_counter()
+    for i in range(0, len(ids), 10):
+        store.get_many(ids[i:i + 10])
+    print(f"Чтение батчами по 10: {(time.perf_counter() - start) / (len(ids) / 10) * 1000:.2f} мс/батч")
+
+    if args.compare:
+        results = compare_payload_modes(list(iter_articles(args.articles)), args.store_dir + '_compare',
+                                        queries=args.queries, compression=args.compression)
+        print(f"\n{'Режим':<18} {'payload, МБ':>12} {'Qdrant, МБ':>11} {'хранилище, МБ':>14} "
+              f"{'символов текста':>16} {'мс/запрос':>10}")
+        print("-" * 86)
+        for res in results:
+            print(f"{res['mode']:<18} {res['payload_mb']:>12.2f} {res['qdrant_mb']:>11.2f} {res['store_mb']:>14.2f} "
+                  f"{res['text_chars']:>16} {res['ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
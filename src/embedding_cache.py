@@ -0,0 +1,275 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+
+def embedding_key(model_name: str, normalize: bool, text: str) -> str:
+    """Ключ кэша: модель, флаг нормализации и хэш очищенного текста"""
+    payload = f"{model_name}\x00{int(bool(normalize))}\x00{text}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Дисковый кэш эмбеддингов с адресацией по содержимому
+
+    Векторы дописываются в конец бинарного файла (float32) и читаются
+    через memory-map, индекс ключ -> строка файла хранится в SQLite.
+    При превышении max_entries вытесняются давно не использованные
+    ключи; когда мертвых строк в файле становится больше живых, живые
+    строки переписываются в файл следующего поколения.
+
+    Кэшем можно пользоваться из нескольких потоков (например, из потока
+    эмбеддинга конвейера загрузки): соединение SQLite общее, операции
+    сериализуются блокировкой.
+    """
+
+    INDEX_FILE = "index.sqlite"
+
+    def __init__(self, directory: str, max_entries: int = 1_000_000):
+        """
+        Args:
+            directory: директория кэша (создается при необходимости)
+            max_entries: максимальное число хранимых векторов
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(str(self.directory / self.INDEX_FILE), check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                row INTEGER,
+                last_used REAL
+            )
+        """)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+        meta = dict(self.conn.execute("SELECT name, value FROM meta").fetchall())
+        self.dim: Optional[int] = int(meta['dim']) if 'dim' in meta else None
+        self.generation = int(meta.get('generation', 0))
+        self._mmap = None
+        self._remove_stale_generations()
+        self._truncate_partial_row()
+
+    @property
+    def vectors_path(self) -> Path:
+        return self.directory / f"vectors.{self.generation}.f32"
+
+    def _remove_stale_generations(self):
+        """Удаляет файлы векторов других поколений (остаются после прерванного сжатия)"""
+        for path in self.directory.glob("vectors.*.f32"):
+            if path != self.vectors_path:
+                path.unlink()
+
+    @property
+    def _row_bytes(self) -> int:
+        return self.dim * np.dtype(np.float32).itemsize
+
+    def _file_rows(self) -> int:
+        if self.dim is None or not self.vectors_path.exists():
+            return 0
+        return self.vectors_path.stat().st_size // self._row_bytes
+
+    def _truncate_partial_row(self):
+        """Обрезает недописанную строку, если прошлый запуск оборвался посреди записи"""
+        if self.dim is None or not self.vectors_path.exists():
+            return
+        size = self.vectors_path.stat().st_size
+        if size % self._row_bytes:
+            os.truncate(self.vectors_path, self._file_rows() * self._row_bytes)
+
+    def _vectors(self) -> np.ndarray:
+        """Memory-map файла векторов (переоткрывается после дозаписи)"""
+        rows = self._file_rows()
+        if self._mmap is None or len(self._mmap) != rows:
+            if rows == 0:
+                return np.zeros((0, self.dim or 0), dtype=np.float32)
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+        return self._mmap
+
+    def _rows_for(self, keys: Sequence[str]) -> dict:
+        rows = {}
+        # Ограничение SQLite на число параметров в запросе
+        for i in range(0, len(keys), 500):
+            chunk = list(keys[i:i + 500])
+            placeholders = ','.join('?' * len(chunk))
+            rows.update(self.conn.execute(
+                f"SELECT key, row FROM entries WHERE key IN ({placeholders})", chunk
+            ).fetchall())
+        return rows
+
+    def get_many(self, keys: Sequence[str]):
+        """
+        Ищет векторы по ключам
+
+        Returns:
+            (векторы найденных ключей (M x dim), позиции найденных ключей в keys)
+        """
+        with self._lock:
+            return self._get_many(keys)
+
+    def _get_many(self, keys: Sequence[str]):
+        rows = self._rows_for(keys)
+        positions = [i for i, key in enumerate(keys) if key in rows]
+        self.hits += len(positions)
+        self.misses += len(keys) - len(positions)
+
+        if not positions:
+            return np.zeros((0, self.dim or 0), dtype=np.float32), positions
+
+        now = time.time()
+        self.conn.executemany(
+            "UPDATE entries SET last_used = ? WHERE key = ?",
+            [(now, keys[i]) for i in positions]
+        )
+        self.conn.commit()
+
+        vectors = np.asarray(self._vectors()[[rows[keys[i]] for i in positions]])
+        return vectors, positions
+
+    def put_many(self, keys: Sequence[str], vectors: np.ndarray):
+        """Дописывает векторы в кэш"""
+        if len(keys) == 0:
+            return
+        with self._lock:
+            self._put_many(keys, vectors)
+
+    def _put_many(self, keys: Sequence[str], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self.conn.execute("INSERT INTO meta VALUES ('dim', ?)", (str(self.dim),))
+            self.conn.commit()
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Размерность {vectors.shape[1]} не совпадает с размерностью кэша {self.dim}")
+
+        # Сначала данные, потом индекс: индекс не ссылается на недописанные строки
+        start_row = self._file_rows()
+        with open(self.vectors_path, 'ab') as f:
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+            [(key, start_row + i, now) for i, key in enumerate(keys)]
+        )
+        self.conn.commit()
+
+        self._evict()
+
+    def _evict(self):
+        """Вытеснение по LRU и сжатие файла, если мертвых строк стало больше живых"""
+        live = len(self)
+        if live > self.max_entries:
+            self.conn.execute(
+                """DELETE FROM entries WHERE key IN (
+                       SELECT key FROM entries ORDER BY last_used, row LIMIT ?)""",
+                (live - self.max_entries,)
+            )
+            self.conn.commit()
+            live = self.max_entries
+
+        if self._file_rows() > 2 * live:
+            self._compact()
+
+    def compact(self):
+        """Переписывает файл векторов, оставляя только живые строки"""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        entries = self.conn.execute("SELECT key, row FROM entries ORDER BY row").fetchall()
+        vectors = self._vectors()
+        old_path = self.vectors_path
+        new_path = self.directory / f"vectors.{self.generation + 1}.f32"
+
+        with open(new_path, 'wb') as f:
+            for i in range(0, len(entries), 10000):
+                chunk = [row for _, row in entries[i:i + 10000]]
+                f.write(np.ascontiguousarray(vectors[chunk]).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Новые номера строк и поколение фиксируются одной транзакцией
+        self.conn.executemany(
+            "UPDATE entries SET row = ? WHERE key = ?",
+            [(new_row, key) for new_row, (key, _) in enumerate(entries)]
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('generation', ?)", (str(self.generation + 1),)
+        )
+        self.conn.commit()
+
+        self._mmap = None
+        del vectors
+        self.generation += 1
+        old_path.unlink()
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._mmap = None
+            self.conn.close()
+
+
+def cached_encode(cache: Optional[EmbeddingCache], model_name: str, normalize: bool,
+                  texts: List[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+    """
+    Эмбеддинги текстов с кэшем: encode вызывается только для промахов
+
+    Args:
+        cache: кэш (None - кодировать все тексты)
+        model_name: имя модели (часть ключа)
+        normalize: нормализуются ли эмбеддинги (часть ключа)
+        texts: тексты для кодирования
+        encode: функция кодирования списка текстов
+
+    Returns:
+        матрица эмбеддингов в порядке texts
+    """
+    if cache is None or not texts:
+        return encode(texts)
+
+    keys = [embedding_key(model_name, normalize, text) for text in texts]
+    hit_vectors, hit_positions = cache.get_many(keys)
+
+    hit_set = set(hit_positions)
+    miss_positions = [i for i in range(len(texts)) if i not in hit_set]
+
+    # Повторы одного текста среди промахов кодируем один раз
+    unique_miss = {}
+    for i in miss_positions:
+        unique_miss.setdefault(keys[i], i)
+
+    miss_vectors = None
+    if unique_miss:
+        miss_vectors = np.asarray(encode([texts[i] for i in unique_miss.values()]), dtype=np.float32)
+        cache.put_many(list(unique_miss), miss_vectors)
+
+    dim = hit_vectors.shape[1] if len(hit_positions) else miss_vectors.shape[1]
+    embeddings = np.empty((len(texts), dim), dtype=np.float32)
+    if hit_positions:
+        embeddings[hit_positions] = hit_vectors
+    if unique_miss:
+        miss_row = {key: row for row, key in enumerate(unique_miss)}
+        embeddings[miss_positions] = miss_vectors[[miss_row[keys[i]] for i in miss_positions]]
+
+    return embeddings
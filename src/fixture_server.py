@@ -0,0 +1,55 @@
+import hashlib
+from pathlib import Path
+
+from aiohttp import web
+
+
+def fixture_path(fixtures_dir, url_path: str, query: str = '') -> Path:
+    """
+    Путь к сохраненному HTML для URL
+
+    /category/artificial-intelligence/page/2/ -> <fixtures_dir>/category/artificial-intelligence/page/2/index.html
+    /category/artificial-intelligence/feed/?paged=2 -> <fixtures_dir>/.../feed/index.paged-2.html
+    """
+    relative = url_path.strip('/')
+    path = Path(fixtures_dir) / relative
+    if url_path.endswith('/') or not path.suffix:
+        path = path / 'index.html'
+    if query:
+        path = path.with_name(f"{path.stem}.{query.replace('=', '-').replace('&', '.')}{path.suffix}")
+    return path
+
+
+def make_fixture_app(fixtures_dir) -> web.Application:
+    """Локальная замена сайта: отдает сохраненные HTML фикстуры по путям URL"""
+
+    async def handle(request: web.Request) -> web.Response:
+        path = fixture_path(fixtures_dir, request.path, request.query_string)
+        if not path.is_file():
+            return web.Response(status=404)
+
+        body = path.read_bytes()
+        # ETag позволяет проверять условные GET краулера
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(body=body, content_type='text/html', headers={'ETag': etag})
+
+    app = web.Application()
+    app.router.add_route('GET', '/{tail:.*}', handle)
+    return app
+
+
+async def start_fixture_server(fixtures_dir, host: str = '127.0.0.1', port: int = 0):
+    """
+    Запускает сервер фикстур в текущем event loop
+
+    Returns:
+        (runner, base_url) - runner нужно остановить через await runner.cleanup()
+    """
+    runner = web.AppRunner(make_fixture_app(fixtures_dir))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{bound_port}"
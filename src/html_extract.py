@@ -0,0 +1,236 @@
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from lxml import etree, html as lxml_html
+
+from new_parser import CONTENT_SELECTORS, extract_article_text
+
+
+def _has_class(name: str) -> str:
+    """XPath условие, эквивалентное CSS селектору .name"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# XPath эквиваленты CSS селекторов из new_parser.CONTENT_SELECTORS
+SELECTOR_XPATHS = {
+    '.article-content': f"//*[{_has_class('article-content')}]",
+    '.entry-content': f"//*[{_has_class('entry-content')}]",
+    '.single-post-content': f"//*[{_has_class('single-post-content')}]",
+    'article .content': f"//article//*[{_has_class('content')}]",
+    '.article__content': f"//*[{_has_class('article__content')}]",
+    '.article-body': f"//*[{_has_class('article-body')}]",
+    '.post-content': f"//*[{_has_class('post-content')}]",
+    'article > div': "//article/div",
+    '[class*="content"]': "//*[contains(@class, 'content')]",
+    '.rich-text': f"//*[{_has_class('rich-text')}]",
+}
+
+# XPath эквивалент new_parser.REMOVE_SELECTOR
+REMOVE_XPATH = etree.XPath(
+    "//script | //style | //iframe | //nav | //footer"
+    f" | //*[{_has_class('advertisement')}]"
+    f" | //*[{_has_class('share-buttons')}]"
+    f" | //*[{_has_class('comments')}]"
+)
+
+TEXT_TAGS = ('p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+
+
+def _get_text(element) -> str:
+    """Аналог BeautifulSoup get_text(strip=True): склейка непустых обрезанных строк (без комментариев)"""
+    return ''.join(part.strip() for part in element.itertext() if part.strip())
+
+
+def _parse_html(html):
+    """Разбор HTML; байты по умолчанию декодируются как UTF-8, как у BeautifulSoup"""
+    if isinstance(html, bytes):
+        try:
+            html = html.decode('utf-8')
+        except UnicodeDecodeError:
+            pass
+    return lxml_html.fromstring(html)
+
+
+class LxmlArticleExtractor:
+    """
+    Извлечение текста статьи на lxml (C парсер)
+
+    Результат совпадает с new_parser.extract_article_text, кроме разметки
+    с незакрытыми <p>: html.parser вкладывает их друг в друга (и bs4
+    повторяет текст), а lxml закрывает по правилам HTML. Запоминает,
+    какой селектор контента сработал на предыдущих страницах: если
+    у следующей страницы та же разметка, остальные селекторы не перебираются.
+    """
+
+    def __init__(self, selectors: List[str] = None):
+        self.selectors = selectors or CONTENT_SELECTORS
+        self._compiled = [etree.XPath(f"({SELECTOR_XPATHS[s]})[1]") for s in self.selectors]
+        # Для каждого селектора - объединенный XPath всех более приоритетных
+        self._higher_priority = [
+            etree.XPath(f"boolean({' | '.join(SELECTOR_XPATHS[s] for s in self.selectors[:i])})")
+            if i else None
+            for i in range(len(self.selectors))
+        ]
+        self.cached_index: Optional[int] = None
+        self.cache_hits = 0
+
+    def _text_from(self, content_div) -> Optional[str]:
+        text_parts = []
+        # Как find_all в bs4: только потомки, сам контейнер не входит
+        for element in content_div.iterdescendants(*TEXT_TAGS):
+            text = _get_text(element)
+            if text and len(text) > 30:  # Игнорируем короткие элементы
+                text_parts.append(text)
+
+        if text_parts:
+            full_text = '\n\n'.join(text_parts)
+            if len(full_text) > 300:
+                return full_text
+        return None
+
+    def _try_selector(self, root, index: int) -> Optional[str]:
+        found = self._compiled[index](root)
+        if not found:
+            return None
+        return self._text_from(found[0])
+
+    def extract(self, html) -> Optional[str]:
+        """Извлекает полный текст статьи из HTML страницы"""
+        if not html:
+            return None
+        root = _parse_html(html)
+
+        # Удаляем ненужные элементы (tail сохраняется, как при decompose в bs4)
+        for element in REMOVE_XPATH(root):
+            if element.getparent() is not None:
+                element.drop_tree()
+
+        # Быстрый путь: селектор, сработавший в прошлый раз. Результат верен,
+        # только если ни один более приоритетный селектор ничего не находит.
+        index = self.cached_index
+        if index is not None:
+            higher = self._higher_priority[index]
+            if higher is None or not higher(root):
+                full_text = self._try_selector(root, index)
+                if full_text:
+                    self.cache_hits += 1
+                    return full_text
+
+        for index in range(len(self.selectors)):
+            full_text = self._try_selector(root, index)
+            if full_text:
+                self.cached_index = index
+                return full_text
+
+        # Резервный метод: все параграфы в статье
+        articles = root.xpath('(//article)[1]')
+        if articles:
+            texts = [_get_text(p) for p in articles[0].iter('p')]
+            text_parts = [text for text in texts if len(text) > 50]
+            if text_parts:
+                full_text = '\n\n'.join(text_parts)
+                if len(full_text) > 300:
+                    return full_text
+
+        return None
+
+
+BACKENDS = {
+    'bs4': extract_article_text,
+    'lxml': LxmlArticleExtractor().extract,
+}
+
+
+def get_extractor(backend: str = 'lxml'):
+    """Функция извлечения текста для выбранного бэкенда"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд '{backend}', доступны: {list(BACKENDS)}")
+    return BACKENDS[backend]
+
+
+def extract_with_backend(html, backend: str = 'lxml') -> Optional[str]:
+    """Точка входа для пула процессов (функция должна быть picklable)"""
+    return BACKENDS[backend](html)
+
+
+def make_parse_pool(workers: int = None) -> ProcessPoolExecutor:
+    """Пул процессов для разбора HTML вне event loop краулера"""
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def load_fixtures(fixtures_dir: str) -> Dict[str, bytes]:
+    """Все сохраненные HTML страницы из директории (рекурсивно)"""
+    return {
+        str(path): path.read_bytes()
+        for path in sorted(Path(fixtures_dir).rglob('*.html'))
+    }
+
+
+def benchmark_backends(pages: Dict[str, bytes], backends: List[str], repeat: int = 3,
+                       workers: int = None) -> List[Dict]:
+    """
+    Замер скорости извлечения (страниц/сек) для каждого бэкенда
+
+    Возвращает результаты последовательного прогона и прогона в пуле процессов,
+    а также число страниц, где результат бэкенда расходится с bs4.
+    """
+    htmls = list(pages.values())
+    reference = [extract_article_text(html) for html in htmls]
+    results = []
+
+    for backend in backends:
+        extract = get_extractor(backend)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            outputs = [extract(html) for html in htmls]
+        elapsed = time.perf_counter() - start
+
+        mismatches = sum(1 for out, ref in zip(outputs, reference) if out != ref)
+        results.append({
+            'backend': backend,
+            'mode': 'serial',
+            'pages_per_sec': len(htmls) * repeat / elapsed,
+            'mismatches': mismatches,
+        })
+
+        with make_parse_pool(workers) as pool:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                list(pool.map(extract_with_backend, htmls, [backend] * len(htmls), chunksize=8))
+            elapsed = time.perf_counter() - start
+
+        results.append({
+            'backend': backend,
+            'mode': f'pool({pool._max_workers})',
+            'pages_per_sec': len(htmls) * repeat / elapsed,
+            'mismatches': mismatches,
+        })
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк бэкендов извлечения текста статей")
+    parser.add_argument('fixtures_dir', help='директория с сохраненными HTML страницами статей')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    pages = load_fixtures(args.fixtures_dir)
+    print(f"Страниц: {len(pages)}")
+
+    results = benchmark_backends(pages, args.backends, args.repeat, args.workers)
+
+    print(f"{'Бэкенд':<8} {'Режим':<10} {'Стр/сек':>10} {'Расхождений':>12}")
+    print("-" * 44)
+    for res in results:
+        print(f"{res['backend']:<8} {res['mode']:<10} {res['pages_per_sec']:>10.1f} {res['mismatches']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from bm25_search import BM25WithPreprocessing
+from dense_search import DenseSearchIndex
+from query_cache import QueryResultCache
+from setup_qdrant import date_range_filter
+
+FUSIONS = ('rrf', 'weighted')
+
+
+@dataclass
+class HybridConfig:
+    """Настройки гибридного поиска"""
+    oversample: int = 5  # каждая ветка возвращает k * oversample кандидатов
+    fusion: str = 'rrf'  # 'rrf' или 'weighted' (min-max нормализованные скоры)
+    rrf_k: int = 60
+    sparse_weight: float = 0.5
+    dense_weight: float = 0.5
+    # Те же веса, что в enhanced_time_dense_search: релевантность, название, свежесть
+    text_weight: float = 0.6
+    title_weight: float = 0.2
+    recency_weight: float = 0.2
+
+
+def bm25_query_vector(bm25: BM25WithPreprocessing, query: str) -> Tuple[List[int], List[float]]:
+    """
+    Sparse вектор запроса для коллекции с BM25 матрицей
+
+    В документах хранится idf * tf_component, поэтому скалярное
+    произведение с единицами по терминам запроса равно BM25 скору.
+    """
+    term_ids = bm25.query_term_ids(bm25.tokenize_query(query))
+    return term_ids, [1.0] * len(term_ids)
+
+
+def fuse_rankings(sparse_indices: np.ndarray, sparse_scores: np.ndarray,
+                  dense_indices: np.ndarray, dense_scores: np.ndarray,
+                  config: HybridConfig) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Слияние двух ранжированных списков
+
+    Returns:
+        (кандидаты, релевантность в [0, 1]) для объединения списков
+    """
+    candidates = np.union1d(sparse_indices, dense_indices)
+    relevance = np.zeros(len(candidates))
+
+    for indices, scores, weight in ((sparse_indices, sparse_scores, config.sparse_weight),
+                                    (dense_indices, dense_scores, config.dense_weight)):
+        if len(indices) == 0:
+            continue
+        positions = np.searchsorted(candidates, indices)
+        if config.fusion == 'rrf':
+            ranks = np.arange(1, len(indices) + 1)
+            relevance[positions] += weight / (config.rrf_k + ranks)
+        else:
+            scores = np.asarray(scores, dtype=np.float64)
+            spread = scores.max() - scores.min()
+            normalized = (scores - scores.min()) / spread if spread > 0 else np.ones(len(scores))
+            relevance[positions] += weight * normalized
+
+    # Приводим к [0, 1], чтобы веса названия и свежести имели тот же масштаб
+    if config.fusion == 'rrf':
+        relevance /= (config.sparse_weight + config.dense_weight) / (config.rrf_k + 1)
+    else:
+        relevance /= config.sparse_weight + config.dense_weight
+
+    return candidates, relevance
+
+
+class HybridRetriever:
+    """
+    Гибридный поиск BM25 + dense
+
+    Обе ветки запускаются параллельно (BM25 в пуле потоков, пока
+    кодируется запрос и считаются dense скоры), каждая отдает
+    k * oversample кандидатов. Списки сливаются через RRF или
+    взвешенные нормализованные скоры, затем в одном векторном
+    проходе по кандидатам добавляются скоры названий и свежести.
+    Индексы документов в BM25 и DenseSearchIndex должны совпадать.
+    """
+
+    def __init__(self, bm25: BM25WithPreprocessing, dense_index: DenseSearchIndex,
+                 encode_queries: Callable[[List[str]], np.ndarray], config: HybridConfig = None,
+                 cache: QueryResultCache = None, version: Callable[[], int] = None):
+        """
+        Args:
+            bm25: обученная BM25 модель
+            dense_index: индекс dense эмбеддингов в том же порядке статей
+            encode_queries: функция кодирования списка запросов в нормализованные эмбеддинги
+            config: настройки слияния
+            cache: кэш результатов поиска, опционально
+            version: текущая версия индексов для ключа кэша (по умолчанию индексы не меняются)
+        """
+        if config is not None and config.fusion not in FUSIONS:
+            raise ValueError(f"Неизвестный способ слияния '{config.fusion}', доступны: {FUSIONS}")
+        if bm25.num_docs != len(dense_index):
+            raise ValueError(f"Число документов BM25 ({bm25.num_docs}) не совпадает "
+                             f"с dense индексом ({len(dense_index)})")
+
+        self.bm25 = bm25
+        self.dense_index = dense_index
+        self.encode_queries = encode_queries
+        self.config = config or HybridConfig()
+        self.cache = cache
+        self.version = version or (lambda: 0)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self.last_timings: Dict[str, float] = {}
+
+    def _sparse_leg(self, query: str, k: int):
+        start = time.perf_counter()
+        indices, scores = self.bm25.search(query, k)
+        indices, scores = np.asarray(indices, dtype=np.int64), np.asarray(scores, dtype=np.float64)
+        # BM25 отдает min(k, N) документов; документы без терминов запроса (скор 0)
+        # не кандидаты - иначе RRF дал бы им ранг наравне с найденными
+        matched = scores > 0
+        self.last_timings['sparse_ms'] = (time.perf_counter() - start) * 1000
+        return indices[matched], scores[matched]
+
+    def _dense_leg(self, query: str, k: int):
+        start = time.perf_counter()
+        query_emb = self.encode_queries([query])
+        scores = self.dense_index.scores(query_emb)[0]
+        indices = self.dense_index.top_k(scores[None, :], k)[0]
+        self.last_timings['dense_ms'] = (time.perf_counter() - start) * 1000
+        return indices, scores[indices], query_emb
+
+    def search_with_scores(self, query: str, k: int = 10) -> Tuple[List[str], List[float]]:
+        """Поиск: ID статей и итоговые скоры по убыванию"""
+        if self.cache is None:
+            return self._search_with_scores(query, k)
+        key = self.cache.key(query, self.version(), k=k, config=asdict(self.config))
+        return self.cache.get_or_compute(key, lambda: self._search_with_scores(query, k))
+
+    def _search_with_scores(self, query: str, k: int) -> Tuple[List[str], List[float]]:
+        config = self.config
+        start = time.perf_counter()
+        candidates_k = k * config.oversample
+
+        sparse_future = self._executor.submit(self._sparse_leg, query, candidates_k)
+        dense_indices, dense_scores, query_emb = self._dense_leg(query, candidates_k)
+        sparse_indices, sparse_scores = sparse_future.result()
+
+        candidates, relevance = fuse_rankings(sparse_indices, sparse_scores,
+                                              dense_indices, dense_scores, config)
+
+        # Название и свежесть - одним проходом по кандидатам
+        combined = config.text_weight * relevance
+        if config.title_weight or config.recency_weight:
+            combined = combined + self.dense_index.scores(
+                query_emb, text_weight=0.0,
+                title_weight=config.title_weight,
+                recency_weight=config.recency_weight,
+                candidates=candidates[None, :]
+            )[0]
+
+        order = self.dense_index.top_k(combined[None, :], k)[0]
+        top = candidates[order]
+
+        self.last_timings['total_ms'] = (time.perf_counter() - start) * 1000
+        return self.dense_index.article_ids[top].tolist(), combined[order].tolist()
+
+    def search(self, query: str, k: int = 10) -> List[str]:
+        """Поиск только ID статей"""
+        return self.search_with_scores(query, k)[0]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def qdrant_hybrid_search(client: QdrantClient, collection_name: str,
+                         dense_vector: List[float], sparse_vector: Tuple[List[int], List[float]],
+                         k: int = 10, prefetch_limit: int = 50,
+                         dense_name: str = 'dense', sparse_name: str = 'bm25',
+                         title_vector: Optional[List[float]] = None,
+                         title_name: str = 'title',
+                         start=None, end=None) -> List[str]:
+    """
+    Гибридный поиск одним запросом Qdrant: prefetch по каждому вектору + RRF на сервере
+
+    Нужна коллекция с именованными dense и sparse векторами
+    (QdrantLocalSetup.create_collection с dense_vector_name и sparse_vector_name).
+    Свежесть здесь не учитывается - ее добавляет только HybridRetriever.
+    start / end ограничивают дату публикации (start <= дата < end) через
+    datetime индекс published_time; фильтр применяется в каждом prefetch.
+    """
+    query_filter = date_range_filter(start, end)
+    indices, values = sparse_vector
+    prefetch = [
+        models.Prefetch(query=models.SparseVector(indices=indices, values=values),
+                        using=sparse_name, limit=prefetch_limit, filter=query_filter),
+        models.Prefetch(query=dense_vector, using=dense_name, limit=prefetch_limit, filter=query_filter),
+    ]
+    if title_vector is not None:
+        prefetch.append(models.Prefetch(query=title_vector, using=title_name, limit=prefetch_limit,
+                                        filter=query_filter))
+
+    response = client.query_points(
+        collection_name=collection_name,
+        prefetch=prefetch,
+        query=models.FusionQuery(fusion=models.Fusion.RRF),
+        query_filter=query_filter,
+        limit=k,
+        with_payload=['id']
+    )
+    return [point.payload.get('id', str(point.id)) for point in response.points]
@@ -0,0 +1,488 @@
+import argparse
+import asyncio
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+from qdrant_client.http import models
+
+from async_parser import AsyncTechCrunchCrawler
+from instrumentation import METRICS, Metrics, add_instrumentation_args, log_summary, start_instrumentation
+from qdrant_bulk import BulkLoadConfig, QdrantBulkLoader
+from setup_qdrant import QdrantLocalSetup, build_payload
+from sitemap_discovery import add_discovery_args, make_discovery
+from text_clean import clean_text_for_embedding
+
+logger = logging.getLogger(__name__)
+
+# Как часто заблокированные put/get проверяют, не остановлен ли конвейер
+POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+def _put(items: queue.Queue, item, stop: threading.Event) -> bool:
+    """Блокирующий put, который прерывается остановкой конвейера. False - конвейер остановлен"""
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(items: queue.Queue, stop: threading.Event, timeout: float = None):
+    """
+    Блокирующий get, который прерывается остановкой конвейера
+
+    Returns:
+        элемент, _DONE при остановке или None, если за timeout ничего не пришло
+    """
+    deadline = time.perf_counter() + timeout if timeout is not None else None
+    while not stop.is_set():
+        wait = POLL_INTERVAL
+        if deadline is not None:
+            wait = min(wait, deadline - time.perf_counter())
+            if wait <= 0:
+                return None
+        try:
+            return items.get(timeout=wait)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+@dataclass
+class Stage:
+    """
+    Этап конвейера
+
+    func - генераторная функция: получает элемент (список элементов при
+    batch_size > 1) и отдает ноль или больше элементов следующему этапу.
+    """
+    name: str
+    func: Callable[[Any], Iterable]
+    workers: int = 1
+    batch_size: int = 1
+    max_wait: float = 0.5  # сколько ждать добора неполного батча, с
+
+
+class StreamingPipeline:
+    """
+    Конвейер из генераторных этапов с ограниченными очередями между ними
+
+    Каждый этап работает в своем числе потоков и забирает элементы из
+    входной очереди по одному или батчами. Все очереди ограничены
+    queue_size: если следующий этап не успевает, предыдущий блокируется
+    на put (backpressure), поэтому в памяти одновременно находится не
+    больше queue_size + workers * batch_size элементов на этап - независимо
+    от размера корпуса. Время ожидания на put пишется в гистограмму
+    pipeline_backpressure_seconds{stage}: долгое ожидание этапа значит,
+    что узкое место ниже по конвейеру.
+
+    Ошибка любого этапа останавливает весь конвейер и пробрасывается из run.
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = 64, metrics: Metrics = None):
+        if not stages:
+            raise ValueError("Нужен хотя бы один этап")
+        self.stages = stages
+        self.queue_size = queue_size
+        self.metrics = metrics or METRICS
+
+    def _emit(self, items: queue.Queue, item, stop: threading.Event, stage: str) -> bool:
+        start = time.perf_counter()
+        delivered = _put(items, item, stop)
+        self.metrics.observe('pipeline_backpressure_seconds', time.perf_counter() - start, stage=stage)
+        return delivered
+
+    def _next_batch(self, inbox: queue.Queue, stage: Stage, stop: threading.Event):
+        """Батч до batch_size элементов; неполный батч отдается через max_wait. Возвращает (батч, конец потока)"""
+        first = _get(inbox, stop)
+        if first is _DONE:
+            return [], True
+        batch = [first]
+        deadline = time.perf_counter() + stage.max_wait
+        while len(batch) < stage.batch_size:
+            item = _get(inbox, stop, timeout=max(deadline - time.perf_counter(), 0))
+            if item is None:
+                break
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def run(self, source: Iterable) -> Iterator:
+        """
+        Запускает конвейер над потоком source
+
+        Returns:
+            итератор выходов последнего этапа по мере их готовности
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        stop = threading.Event()
+        errors = []
+        lock = threading.Lock()
+        remaining = [stage.workers for stage in self.stages]
+
+        def fail(stage_name: str, error: Exception):
+            logger.error("Этап %s упал: %s", stage_name, error)
+            self.metrics.inc('stage_errors_total', stage=stage_name)
+            with lock:
+                errors.append(error)
+            stop.set()
+
+        def feed():
+            try:
+                for item in source:
+                    if not self._emit(queues[0], item, stop, 'source'):
+                        return
+                _put(queues[0], _DONE, stop)
+            except Exception as e:
+                fail('source', e)
+            finally:
+                close = getattr(source, 'close', None)
+                if close is not None:
+                    close()
+
+        def work(position: int, stage: Stage):
+            inbox, outbox = queues[position], queues[position + 1]
+            try:
+                while True:
+                    if stage.batch_size > 1:
+                        batch, finished = self._next_batch(inbox, stage, stop)
+                    else:
+                        item = _get(inbox, stop)
+                        batch, finished = ([], True) if item is _DONE else ([item], False)
+
+                    if batch:
+                        start = time.perf_counter()
+                        outputs = list(stage.func(batch if stage.batch_size > 1 else batch[0]))
+                        self.metrics.record(stage.name, time.perf_counter() - start, items=len(batch))
+                        for output in outputs:
+                            if not self._emit(outbox, output, stop, stage.name):
+                                return
+
+                    if finished:
+                        # Конец потока видят все потоки этапа, дальше его передает последний
+                        _put(inbox, _DONE, stop)
+                        with lock:
+                            remaining[position] -= 1
+                            last = remaining[position] == 0
+                        if last:
+                            _put(outbox, _DONE, stop)
+                        return
+            except Exception as e:
+                fail(stage.name, e)
+
+        threads = [threading.Thread(target=feed, name='pipeline-source', daemon=True)]
+        for position, stage in enumerate(self.stages):
+            threads.extend(
+                threading.Thread(target=work, args=(position, stage), name=f'pipeline-{stage.name}-{i}', daemon=True)
+                for i in range(stage.workers)
+            )
+        for thread in threads:
+            thread.start()
+
+        finished = False
+        try:
+            while True:
+                item = _get(queues[-1], stop)
+                if item is _DONE:
+                    break
+                yield item
+            finished = True
+        finally:
+            # Потребитель перестал читать или этап упал - останавливаем остальные
+            if errors or not finished:
+                stop.set()
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            raise errors[0]
+
+
+def iter_crawled_articles(crawler: AsyncTechCrunchCrawler, target_articles: int, max_pages: int,
+                          buffer_size: int = 16) -> Iterator[Dict]:
+    """
+    Статьи асинхронного краулера как обычный итератор
+
+    Краулер работает в отдельном потоке со своим event loop и отдает статьи
+    через ограниченную очередь. Пока очередь полна, on_article краулера
+    ждет, а вместе с max_in_flight краулера это останавливает загрузку
+    новых статей: краулер не убегает вперед медленных этапов.
+    """
+    articles = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+    errors = []
+    running = {}
+
+    async def on_article(order, article):
+        await asyncio.to_thread(_put, articles, article, stop)
+
+    async def crawl_task():
+        running['loop'], running['task'] = asyncio.get_running_loop(), asyncio.current_task()
+        # В журнал статьи записывает получатель (crawler.mark_done) после загрузки в Qdrant
+        await crawler.crawl_stream(target_articles, max_pages, on_article, confirm=False)
+
+    def crawl():
+        try:
+            asyncio.run(crawl_task())
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            errors.append(e)
+        finally:
+            _put(articles, _DONE, stop)
+
+    thread = threading.Thread(target=crawl, name='crawler', daemon=True)
+    thread.start()
+    try:
+        while True:
+            article = articles.get()
+            if article is _DONE:
+                break
+            yield article
+    finally:
+        stop.set()
+        if thread.is_alive() and running:
+            # Потребитель остановился раньше конца обхода - отменяем обход
+            try:
+                running['loop'].call_soon_threadsafe(running['task'].cancel)
+            except RuntimeError:
+                pass  # event loop уже закрыт
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+@dataclass
+class IngestConfig:
+    """Настройки потокового конвейера crawl → clean → embed → upsert"""
+    collection_name: str = "ai_trends_stream"
+    queue_size: int = 64  # элементов в очереди между соседними этапами
+    crawl_in_flight: int = 32  # статей, загружаемых краулером одновременно
+    clean_workers: int = 2
+    min_words: int = 30  # более короткие тексты после чистки не индексируются
+    embed_workers: int = 1
+    embed_batch_size: int = 32
+    upsert_workers: int = 2
+    upsert_batch_size: int = 64
+    max_wait: float = 1.0  # сколько ждать добора неполного батча эмбеддинга или загрузки, с
+
+
+@dataclass
+class IngestItem:
+    """Статья на пути через конвейер"""
+    article: Dict
+    started: float  # time.perf_counter() при входе в конвейер
+    text: str = ''
+    vector: Optional[np.ndarray] = None
+
+
+class IngestPipeline:
+    """
+    Потоковая загрузка свежих статей в Qdrant
+
+    Статьи идут от краулера через чистку текста, эмбеддинг батчами и
+    загрузку батчами с повторами, не дожидаясь конца обхода: первая
+    статья оказывается в Qdrant через секунды после загрузки, а память
+    ограничена очередями конвейера. Задержка от входа статьи в конвейер
+    до подтвержденной записи в Qdrant пишется в ingest_lag_seconds.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], loader: QdrantBulkLoader,
+                 config: IngestConfig = None, metrics: Metrics = None,
+                 on_done: Callable[[Dict], None] = None):
+        """
+        Args:
+            encode: функция кодирования списка текстов в нормализованные эмбеддинги
+            loader: загрузчик Qdrant (используются его повторы упавших батчей)
+            config: настройки конвейера
+            metrics: реестр метрик (по умолчанию общий instrumentation.METRICS)
+            on_done: вызывается для статьи после подтвержденной записи в Qdrant или
+                после отсева при чистке - слишком короткой или помеченной duplicate_of
+                (например, crawler.mark_done по URL)
+        """
+        self.encode = encode
+        self.loader = loader
+        self.config = config or IngestConfig()
+        self.metrics = metrics or METRICS
+        self.on_done = on_done
+
+    def clean(self, item: IngestItem) -> Iterator[IngestItem]:
+        if item.article.get('duplicate_of'):
+            # Почти-дубликат, помеченный краулером (--dedup-mode flag), не эмбеддится
+            self.metrics.inc('ingest_skipped_total', reason='near_duplicate')
+            if self.on_done is not None:
+                self.on_done(item.article)
+            return
+        text = clean_text_for_embedding(item.article.get('text'))
+        if len(text.split()) < self.config.min_words:
+            self.metrics.inc('ingest_skipped_total', reason='too_short')
+            if self.on_done is not None:
+                self.on_done(item.article)
+            return
+        item.text = text
+        yield item
+
+    def embed(self, items: List[IngestItem]) -> Iterator[IngestItem]:
+        vectors = self.encode([item.text for item in items])
+        for item, vector in zip(items, vectors):
+            item.vector = vector
+            yield item
+
+    def upsert(self, items: List[IngestItem]) -> Iterator[int]:
+        points = []
+        for item in items:
+            payload = build_payload(item.article, 0)
+            points.append(models.PointStruct(id=payload['id'], vector=np.asarray(item.vector).tolist(),
+                                             payload=payload))
+        self.loader.upsert_batch(self.config.collection_name, points, wait=True)
+
+        done = time.perf_counter()
+        for item in items:
+            self.metrics.observe('ingest_lag_seconds', done - item.started)
+            if self.on_done is not None:
+                self.on_done(item.article)
+        yield len(points)
+
+    def stages(self) -> List[Stage]:
+        config = self.config
+        return [
+            Stage('clean', self.clean, workers=config.clean_workers),
+            Stage('embed', self.embed, workers=config.embed_workers,
+                  batch_size=config.embed_batch_size, max_wait=config.max_wait),
+            Stage('load', self.upsert, workers=config.upsert_workers,
+                  batch_size=config.upsert_batch_size, max_wait=config.max_wait),
+        ]
+
+    def run(self, articles: Iterable[Dict]) -> Dict:
+        """
+        Прогоняет поток статей до Qdrant
+
+        Returns:
+            статистика: articles, points, seconds, points_per_sec
+        """
+        stats = {'articles': 0, 'points': 0}
+
+        def source():
+            for article in articles:
+                stats['articles'] += 1
+                yield IngestItem(article, time.perf_counter())
+
+        pipeline = StreamingPipeline(self.stages(), self.config.queue_size, self.metrics)
+        start = time.perf_counter()
+        for count in pipeline.run(source()):
+            stats['points'] += count
+            logger.debug("В Qdrant загружено точек: %s", stats['points'])
+
+        stats['seconds'] = time.perf_counter() - start
+        stats['points_per_sec'] = stats['points'] / stats['seconds'] if stats['seconds'] else 0.0
+        return stats
+
+
+def make_encoder(args) -> Callable[[List[str]], np.ndarray]:
+    """Функция кодирования текстов статей по аргументам main"""
+    if args.synthetic_encoder:
+        from query_service import HashingEncoder
+        return HashingEncoder()
+
+    from parallel_embed import load_sentence_transformer
+
+    model = load_sentence_transformer(args.model)
+
+    def encode(texts: List[str]) -> np.ndarray:
+        return model.encode(texts, batch_size=len(texts), convert_to_numpy=True,
+                            normalize_embeddings=True, show_progress_bar=False)
+
+    if not args.embedding_cache:
+        return encode
+
+    from embedding_cache import EmbeddingCache, cached_encode
+
+    cache = EmbeddingCache(args.embedding_cache)
+    return lambda texts: cached_encode(cache, args.model, True, texts, encode)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Потоковая загрузка статей: crawl → clean → embed → upsert")
+    parser.add_argument('--target-articles', type=int, default=7000)
+    parser.add_argument('--max-pages', type=int, default=185)
+    parser.add_argument('--base-url', default=None, help='адрес сайта (для проверки - сервер фикстур)')
+    parser.add_argument('--rps', type=float, default=2.0, help='средняя частота запросов краулера в секунду')
+    parser.add_argument('--max-per-host', type=int, default=8)
+    parser.add_argument('--ledger', default=None, help='SQLite журнал URL: загружать только новые/измененные статьи')
+    parser.add_argument('--dedup', default=None, help='SQLite индекс почти-дубликатов (MinHash)')
+    parser.add_argument('--model', default='Qwen/Qwen3-Embedding-0.6B')
+    parser.add_argument('--synthetic-encoder', action='store_true',
+                        help='HashingEncoder вместо модели (проверка конвейера без torch)')
+    parser.add_argument('--embedding-cache', default=None, help='директория дискового кэша эмбеддингов')
+    parser.add_argument('--collection', default=IngestConfig.collection_name)
+    parser.add_argument('--qdrant-path', default=None, help='локальный Qdrant в директории вместо сервера')
+    parser.add_argument('--grpc', action='store_true', help='подключаться по gRPC')
+    parser.add_argument('--queue-size', type=int, default=IngestConfig.queue_size)
+    parser.add_argument('--clean-workers', type=int, default=IngestConfig.clean_workers)
+    parser.add_argument('--embed-workers', type=int, default=IngestConfig.embed_workers)
+    parser.add_argument('--embed-batch-size', type=int, default=IngestConfig.embed_batch_size)
+    parser.add_argument('--upsert-workers', type=int, default=IngestConfig.upsert_workers)
+    parser.add_argument('--upsert-batch-size', type=int, default=IngestConfig.upsert_batch_size)
+    add_discovery_args(parser)
+    add_instrumentation_args(parser)
+    args = parser.parse_args()
+    reporter = start_instrumentation(args)
+
+    config = IngestConfig(
+        collection_name=args.collection,
+        queue_size=args.queue_size,
+        clean_workers=args.clean_workers,
+        embed_workers=args.embed_workers,
+        embed_batch_size=args.embed_batch_size,
+        upsert_workers=args.upsert_workers,
+        upsert_batch_size=args.upsert_batch_size,
+    )
+
+    encode = make_encoder(args)
+    setup = QdrantLocalSetup(prefer_grpc=args.grpc, path=args.qdrant_path)
+    # Размер вектора берется из самой модели
+    setup.create_collection(config.collection_name, vector_size=encode(["probe"]).shape[1])
+    loader = QdrantBulkLoader(setup.client, BulkLoadConfig(workers=config.upsert_workers, disable_indexing=False),
+                              on_upsert=setup.versions.bump)
+
+    from crawl_ledger import CrawlLedger
+    from near_dedup import NearDuplicateIndex
+
+    ledger = CrawlLedger(args.ledger) if args.ledger else None
+    dedup = NearDuplicateIndex(args.dedup) if args.dedup else None
+    discovery = make_discovery(args)
+    crawler_kwargs = {'base_url': args.base_url} if args.base_url else {}
+    crawler = AsyncTechCrunchCrawler(max_per_host=args.max_per_host, requests_per_second=args.rps,
+                                     ledger=ledger, dedup=dedup, max_in_flight=config.crawl_in_flight,
+                                     discovery=discovery, **crawler_kwargs)
+    try:
+        articles = iter_crawled_articles(crawler, args.target_articles, args.max_pages)
+        stats = IngestPipeline(encode, loader, config,
+                               on_done=lambda article: crawler.mark_done(article['url'])).run(articles)
+        lag = METRICS.histogram('ingest_lag_seconds')
+        logger.info("Готово: статей %s, точек в '%s' %s за %.1f с (%.1f точек/с), "
+                    "задержка до Qdrant p50 %.2f с, p95 %.2f с",
+                    stats['articles'], config.collection_name, stats['points'], stats['seconds'],
+                    stats['points_per_sec'], lag.quantile(0.5) if lag else 0.0, lag.quantile(0.95) if lag else 0.0)
+    finally:
+        if dedup is not None:
+            dedup.close()
+        if ledger is not None:
+            ledger.close()
+        reporter.stop()
+        log_summary(METRICS, logger)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Границы бакетов гистограммы задержек, секунды (le в Prometheus)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Гистограмма с фиксированными бакетами: observe - один bisect и три сложения"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последний - +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля линейной интерполяцией внутри бакета (как histogram_quantile)"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count > 0:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return lower  # выше последней границы точнее не оценить
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+def _label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_value(value: float) -> str:
+    """Число без потери точности (формат :g округлил бы большие счетчики байт)"""
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metrics:
+    """
+    Реестр счетчиков и гистограмм с метками
+
+    Этапы краулера: wait (паузы и ограничитель частоты), fetch, parse,
+    extract; эмбеддингов: embed; загрузчика: build_point, backpressure, upsert.
+
+    Стандартные метрики этапов:
+        stage_seconds{stage} - гистограмма задержек
+        stage_bytes_total{stage} - переданные байты
+        stage_items_total{stage} - обработанные элементы (статьи, точки, тексты)
+        stage_errors_total{stage} - ошибки
+        http_responses_total{stage,status} - HTTP статусы
+
+    Запись - одна блокировка и несколько операций со словарем, поэтому
+    инструментацию можно не выключать.
+    """
+
+    def __init__(self, namespace: str = 'rag_crunch'):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._histograms: Dict[Tuple[str, LabelKey], Histogram] = {}
+        self.started = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def record(self, stage: str, seconds: float, nbytes: int = None, status=None, items: int = None, **labels):
+        """Одна запись этапа: задержка и (опционально) байты, HTTP статус и число элементов"""
+        self.observe('stage_seconds', seconds, stage=stage, **labels)
+        if nbytes:
+            self.inc('stage_bytes_total', nbytes, stage=stage, **labels)
+        if items:
+            self.inc('stage_items_total', items, stage=stage, **labels)
+        if status is not None:
+            self.inc('http_responses_total', stage=stage, status=status, **labels)
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        """Замер этапа; исключение считается в stage_errors_total и пробрасывается дальше"""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc('stage_errors_total', stage=stage, **labels)
+            raise
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+    def timed_iter(self, iterable: Iterable, stage: str, **labels) -> Iterator:
+        """Итератор, замеряющий время получения каждого элемента (например, построение точек)"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage, **labels)
+            self.inc('stage_items_total', stage=stage, **labels)
+            yield item
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started = time.time()
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get((name, _label_key(labels)))
+
+    def snapshot(self) -> Dict:
+        """Состояние всех метрик в виде словаря (для JSON)"""
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(key), 'value': value}
+                        for (name, key), value in sorted(self._counters.items())]
+            histograms = [{
+                'name': name,
+                'labels': dict(key),
+                'count': histogram.count,
+                'sum': histogram.sum,
+                'p50': histogram.quantile(0.5),
+                'p95': histogram.quantile(0.95),
+                'p99': histogram.quantile(0.99),
+            } for (name, key), histogram in sorted(self._histograms.items())]
+        return {
+            'timestamp': time.time(),
+            'uptime_s': time.time() - self.started,
+            'counters': counters,
+            'histograms': histograms,
+        }
+
+    def to_prometheus(self) -> str:
+        """Текстовый формат экспозиции Prometheus"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+            typed = set()
+            for (name, key), value in counters:
+                full_name = f"{self.namespace}_{name}"
+                if full_name not in typed:
+                    lines.append(f"# TYPE {full_name} counter")
+                    typed.add(full_name)
+                lines.append(f"{full_name}{_format_labels(key)} {_format_value(value)}")
+
+            for (name, key), histogram in histograms:
+                full_name = f"{self.namespace}_{name}"
+                if full_name not in typed:
+                    lines.append(f"# TYPE {full_name} histogram")
+                    typed.add(full_name)
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                    lines.append(f"{full_name}_bucket{_format_labels(key, (('le', le),))} {cumulative}")
+                lines.append(f"{full_name}_sum{_format_labels(key)} {_format_value(histogram.sum)}")
+                lines.append(f"{full_name}_count{_format_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> List[str]:
+        """Строки сводки по этапам: сколько времени ушло на каждый этап"""
+        rows = []
+        for entry in self.snapshot()['histograms']:
+            if entry['name'] != 'stage_seconds':
+                continue
+            labels = entry['labels']
+            stage = labels.get('stage')
+            extra = ','.join(f"{name}={value}" for name, value in labels.items() if name != 'stage')
+            nbytes = self.counter_value('stage_bytes_total', **labels)
+            errors = self.counter_value('stage_errors_total', **labels)
+            rows.append(
+                f"{stage + (f'[{extra}]' if extra else ''):<28} n={entry['count']:<7} "
+                f"всего={entry['sum']:.1f} с  p50={entry['p50'] * 1000:.1f} мс  p95={entry['p95'] * 1000:.1f} мс"
+                + (f"  {nbytes / 2 ** 20:.1f} МБ" if nbytes else '')
+                + (f"  ошибок={errors:g}" if errors else '')
+            )
+        return rows
+
+
+# Реестр по умолчанию: краулер и загрузчик пишут сюда, если не передан свой
+METRICS = Metrics()
+
+
+def write_prometheus(metrics: Metrics, path: str):
+    """Атомарная запись метрик в файл (для textfile collector node_exporter)"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(metrics.to_prometheus())
+    os.replace(tmp_path, path)
+
+
+def append_json_snapshot(metrics: Metrics, path: str):
+    """Дописывает снимок метрик строкой JSONL"""
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(metrics.snapshot(), ensure_ascii=False) + '\n')
+
+
+class MetricsReporter:
+    """Фоновый поток, периодически выгружающий метрики в JSONL и/или файл Prometheus"""
+
+    def __init__(self, metrics: Metrics = METRICS, interval: float = 30.0,
+                 json_path: str = None, prometheus_path: str = None):
+        self.metrics = metrics
+        self.interval = interval
+        self.json_path = json_path
+        self.prometheus_path = prometheus_path
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def flush(self):
+        if self.json_path:
+            append_json_snapshot(self.metrics, self.json_path)
+        if self.prometheus_path:
+            write_prometheus(self.metrics, self.prometheus_path)
+
+    def start(self) -> 'MetricsReporter':
+        def loop():
+            while not self._stop.wait(self.interval):
+                try:
+                    self.flush()
+                except OSError as e:
+                    logging.getLogger(__name__).warning("Не удалось выгрузить метрики: %s", e)
+
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Останавливает поток и делает финальную выгрузку"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+def serve_prometheus(metrics: Metrics = METRICS, port: int = 9108, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """HTTP эндпоинт /metrics в фоновом потоке; остановка - server.shutdown()"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def setup_logging(level: str = 'INFO'):
+    """Уровневое логирование вместо print: время, уровень, модуль"""
+    logging.basicConfig(level=getattr(logging, level.upper()), format=LOG_FORMAT)
+
+
+def add_instrumentation_args(parser: argparse.ArgumentParser):
+    """Общие аргументы CLI: уровень логов и выгрузка метрик"""
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    parser.add_argument('--metrics-json', default=None, help='JSONL файл для периодических снимков метрик')
+    parser.add_argument('--metrics-prom', default=None, help='файл метрик в формате Prometheus')
+    parser.add_argument('--metrics-port', type=int, default=None, help='порт HTTP эндпоинта /metrics')
+    parser.add_argument('--metrics-interval', type=float, default=30.0, help='период выгрузки метрик, с')
+
+
+def start_instrumentation(args, metrics: Metrics = METRICS) -> MetricsReporter:
+    """Настраивает логирование и выгрузку метрик по аргументам add_instrumentation_args"""
+    setup_logging(args.log_level)
+    if args.metrics_port:
+        serve_prometheus(metrics, args.metrics_port)
+    reporter = MetricsReporter(metrics, args.metrics_interval, args.metrics_json, args.metrics_prom)
+    if args.metrics_json or args.metrics_prom:
+        reporter.start()
+    return reporter
+
+
+def log_summary(metrics: Metrics = METRICS, logger: logging.Logger = None):
+    """Сводка по этапам в лог"""
+    logger = logger or logging.getLogger(__name__)
+    rows = metrics.summary()
+    if rows:
+        logger.info("Время по этапам:\n  %s", '\n  '.join(rows))
@@ -0,0 +1,250 @@
+import argparse
+import hashlib
+import re
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from article_store import JsonlArticleWriter, iter_articles
+
+TOKEN_RE = re.compile(r'\w+')
+
+DROP = "drop"
+FLAG = "flag"
+DEDUP_MODES = (DROP, FLAG)
+
+
+def shingle_hashes(text: str, shingle_size: int = 5) -> np.ndarray:
+    """
+    Уникальные 32-битные хэши словесных шинглов текста
+
+    Текст приводится к нижнему регистру и режется на слова, поэтому
+    пунктуация, пробелы и регистр не влияют на сравнение.
+    """
+    tokens = TOKEN_RE.findall(text.lower())
+    if len(tokens) < shingle_size:
+        shingles = [' '.join(tokens)]
+    else:
+        shingles = [' '.join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)]
+    # crc32 стабилен между запусками, в отличие от встроенного hash()
+    return np.unique(np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles),
+                                 dtype=np.uint64, count=len(shingles)))
+
+
+class NearDuplicateIndex:
+    """
+    Персистентный индекс почти-дубликатов статей (MinHash + LSH, SQLite)
+
+    Сигнатура статьи - num_perm минимумов хэшей ее шинглов; доля
+    совпавших позиций двух сигнатур оценивает коэффициент Жаккара
+    их множеств шинглов. Сигнатура режется на bands полос, каждая
+    полоса хэшируется в корзину: статьи, совпавшие хотя бы в одной
+    корзине, становятся кандидатами и проверяются по оценке Жаккара.
+    В корзины попадают только оригиналы, дубликаты лишь помечаются.
+    """
+
+    def __init__(self,
+                 path: str = "near_duplicates.sqlite",
+                 num_perm: int = 128,
+                 bands: int = 16,
+                 threshold: float = 0.8,
+                 shingle_size: int = 5,
+                 seed: int = 1):
+        """
+        Args:
+            path: файл SQLite (параметры сохраняются в нем и проверяются при открытии)
+            num_perm: длина сигнатуры MinHash
+            bands: число полос LSH (num_perm должно делиться на bands)
+            threshold: минимальная оценка Жаккара, с которой статья считается дубликатом
+            shingle_size: число слов в шингле
+            seed: seed хэш-функций
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) должно делиться на bands ({bands})")
+
+        self.path = path
+        # Индекс создается в главном потоке, а проверяет статьи поток краулера (ingest_pipeline)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS signatures (
+                url TEXT PRIMARY KEY,
+                article_id TEXT,
+                signature BLOB,
+                duplicate_of TEXT,
+                similarity REAL,
+                checked TEXT
+            )
+        """)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS buckets (band INTEGER, bucket INTEGER, url TEXT)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS buckets_lookup ON buckets (band, bucket)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS buckets_url ON buckets (url)")
+
+        params = {'num_perm': num_perm, 'bands': bands, 'shingle_size': shingle_size, 'seed': seed}
+        stored = {name: int(value) for name, value in self.conn.execute("SELECT name, value FROM meta")}
+        if stored and stored != params:
+            raise ValueError(f"Индекс {path} создан с другими параметрами: {stored}")
+        self.conn.executemany("INSERT OR IGNORE INTO meta VALUES (?, ?)", [(k, str(v)) for k, v in params.items()])
+        self.conn.commit()
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+
+        # Хэши вида (a * x + b) >> 32 по модулю 2^64 (multiply-shift), a нечетные
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2**63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """Сигнатура MinHash текста (num_perm значений uint32)"""
+        hashes = shingle_hashes(text, self.shingle_size)
+        with np.errstate(over='ignore'):
+            permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) >> np.uint64(32)
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def _band_buckets(self, signature: np.ndarray) -> List[int]:
+        """Ключ корзины для каждой полосы (знаковое 64-битное число для SQLite)"""
+        return [
+            int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8).digest(), 'little', signed=True)
+            for band in signature.reshape(self.bands, self.rows)
+        ]
+
+    def similarity(self, first: np.ndarray, second: np.ndarray) -> float:
+        """Оценка коэффициента Жаккара по двум сигнатурам"""
+        return float(np.mean(first == second))
+
+    def find(self, signature: np.ndarray, exclude_url: str = None) -> Optional[Tuple[str, float]]:
+        """
+        Самый похожий оригинал в индексе
+
+        Returns:
+            (url, оценка Жаккара) или None, если похожих выше threshold нет
+        """
+        candidates = set()
+        best = None
+        with self._lock:
+            for band, bucket in enumerate(self._band_buckets(signature)):
+                rows = self.conn.execute(
+                    "SELECT url FROM buckets WHERE band = ? AND bucket = ?", (band, bucket)
+                ).fetchall()
+                candidates.update(row[0] for row in rows)
+            candidates.discard(exclude_url)
+
+            for url in candidates:
+                stored = self.conn.execute("SELECT signature FROM signatures WHERE url = ?", (url,)).fetchone()
+                score = self.similarity(signature, np.frombuffer(stored[0], dtype=np.uint32))
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (url, score)
+        return best
+
+    def check(self, url: str, article_id: str, text: str) -> Optional[str]:
+        """
+        Проверяет статью и записывает ее в индекс
+
+        Повторная проверка того же URL (статья изменилась) заменяет его
+        прежнюю сигнатуру, а не считается дубликатом самого себя.
+
+        Returns:
+            URL оригинала, если статья - почти-дубликат, иначе None
+        """
+        signature = self.signature(text)
+        with self._lock:
+            match = self.find(signature, exclude_url=url)
+            duplicate_of, score = match if match else (None, None)
+
+            self.conn.execute("DELETE FROM buckets WHERE url = ?", (url,))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO signatures VALUES (?, ?, ?, ?, ?, ?)",
+                (url, article_id, signature.tobytes(), duplicate_of, score, datetime.now().isoformat())
+            )
+            if duplicate_of is None:
+                self.conn.executemany(
+                    "INSERT INTO buckets VALUES (?, ?, ?)",
+                    [(band, bucket, url) for band, bucket in enumerate(self._band_buckets(signature))]
+                )
+            self.conn.commit()
+        return duplicate_of
+
+    def duplicates(self) -> List[Tuple[str, str, float]]:
+        """Все найденные пары (дубликат, оригинал, оценка Жаккара)"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT url, duplicate_of, similarity FROM signatures WHERE duplicate_of IS NOT NULL"
+            ).fetchall()
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def dedup_articles(articles: Iterable[Dict], index: NearDuplicateIndex, mode: str = DROP) -> Iterator[Dict]:
+    """
+    Фильтр почти-дубликатов для потока статей
+
+    Args:
+        articles: статьи с полями url, id, text
+        index: индекс почти-дубликатов (дополняется по ходу)
+        mode: DROP - дубликаты отбрасываются, FLAG - помечаются полем duplicate_of
+    """
+    if mode not in DEDUP_MODES:
+        raise ValueError(f"Неизвестный режим '{mode}', доступны: {DEDUP_MODES}")
+
+    for i, article in enumerate(articles):
+        text = article.get('text')
+        if text:
+            duplicate_of = index.check(article.get('url', str(i)), article.get('id', str(i)), text)
+            if duplicate_of is not None:
+                if mode == DROP:
+                    continue
+                article = {**article, 'duplicate_of': duplicate_of}
+        yield article
+
+
+def skip_flagged(articles: Iterable[Dict]) -> Iterator[Dict]:
+    """Статьи без пометки duplicate_of (перед эмбеддингом и загрузкой в Qdrant)"""
+    return (article for article in articles if not article.get('duplicate_of'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск почти-дубликатов статей (MinHash + LSH)")
+    parser.add_argument('articles', help='файл со статьями (.json или .jsonl)')
+    parser.add_argument('--index', default='near_duplicates.sqlite', help='файл индекса (дополняется)')
+    parser.add_argument('--output', default=None, help='JSONL без дубликатов (или с пометками при --mode flag)')
+    parser.add_argument('--mode', choices=DEDUP_MODES, default=DROP)
+    parser.add_argument('--threshold', type=float, default=0.8)
+    args = parser.parse_args()
+
+    index = NearDuplicateIndex(args.index, threshold=args.threshold)
+    writer = JsonlArticleWriter(args.output, checkpoint_every=0) if args.output else None
+    total = kept = 0
+    try:
+        for article in dedup_articles(iter_articles(args.articles), index, args.mode):
+            kept += 'duplicate_of' not in article
+            if writer is not None:
+                writer.write(article)
+        total = sum(1 for _ in iter_articles(args.articles))
+        pairs = index.duplicates()
+    finally:
+        if writer is not None:
+            writer.close()
+        index.close()
+
+    print(f"Статей: {total}, без почти-дубликатов: {kept}; всего пар в индексе: {len(pairs)}")
+    for url, original, score in pairs[:20]:
+        print(f"  [{score:.2f}] {url}\n         -> {original}")
+
+
+if __name__ == "__main__":
+    main()
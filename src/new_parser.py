@@ -1,3 +1,5 @@
+import argparse
+import logging
 import requests
 import json
 import hashlib
@@ -8,191 +10,133 @@ from bs4 import BeautifulSoup
 import re
 import uuid
 
+from article_store import normalize_published_time
+from instrumentation import METRICS, add_instrumentation_args, log_summary, start_instrumentation
 
-def parse_techcrunch_pagination(target_articles, max_pages):
-    """Парсит статьи с пагинированных страниц TechCrunch AI"""
+logger = logging.getLogger(__name__)
 
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Referer': 'https://www.google.com/',
-    }
+BASE_URL = "https://techcrunch.com"
+CATEGORY_PATH = "/category/artificial-intelligence/"
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Referer': 'https://www.google.com/',
+}
+
+# Элементы, которые удаляются перед извлечением текста статьи
+REMOVE_SELECTOR = 'script, style, iframe, nav, footer, .advertisement, .share-buttons, .comments'
+
+# Селекторы основного контента статьи в порядке приоритета
+CONTENT_SELECTORS = [
+    '.article-content',
+    '.entry-content',
+    '.single-post-content',
+    'article .content',
+    '.article__content',
+    '.article-body',
+    '.post-content',
+    'article > div',
+    '[class*="content"]',
+    '.rich-text'
+]
+
+
+def _polite_sleep(low, high, kind):
+    """Случайная пауза между запросами, учитывается как этап wait"""
+    with METRICS.timer('wait', kind=kind):
+        time.sleep(random.uniform(low, high))
+
+
+def _fetch(session, url, kind):
+    """GET с замером этапа fetch: задержка, байты и HTTP статус"""
+    start = time.perf_counter()
+    try:
+        response = session.get(url, timeout=15)
+    except requests.exceptions.RequestException as e:
+        status = 'timeout' if isinstance(e, requests.exceptions.Timeout) else 'error'
+        METRICS.record('fetch', time.perf_counter() - start, status=status, kind=kind)
+        METRICS.inc('stage_errors_total', stage='fetch', kind=kind)
+        raise
+    METRICS.record('fetch', time.perf_counter() - start, nbytes=len(response.content),
+                   status=response.status_code, kind=kind)
+    return response
+
+
+def parse_techcrunch_pagination(target_articles, max_pages, dedup=None, dedup_mode='drop'):
+    """
+    Парсит статьи с пагинированных страниц TechCrunch AI
+
+    Args:
+        dedup: индекс почти-дубликатов near_dedup.NearDuplicateIndex (None - без проверки)
+        dedup_mode: 'drop' - дубликаты отбрасываются, 'flag' - помечаются полем duplicate_of
+    """
 
     session = requests.Session()
-    session.headers.update(headers)
+    session.headers.update(HEADERS)
 
     all_articles = {}
     page = 1
 
     six_months_ago = datetime.now() - timedelta(days=180)
 
-    print(f"Начинаю парсинг пагинации TechCrunch AI...")
-    print(f"Цель: {target_articles} статей за последние 6 месяцев")
-    print("=" * 60)
+    logger.info("Начинаю парсинг пагинации TechCrunch AI: цель %s статей", target_articles)
 
     while len(all_articles) < target_articles and page <= max_pages:
         # Формируем URL страницы
-        if page == 1:
-            url = "https://techcrunch.com/category/artificial-intelligence/"
-        else:
-            url = f"https://techcrunch.com/category/artificial-intelligence/page/{page}/"
+        url = listing_page_url(page)
 
-        print(f"Страница {page}: {url}")
+        logger.info("Страница %s: %s", page, url)
 
         try:
             # Загружаем страницу с случайной задержкой
-            time.sleep(random.uniform(2, 4))
+            _polite_sleep(2, 4, 'listing')
 
-            response = session.get(url, timeout=15)
+            response = _fetch(session, url, 'listing')
 
             if response.status_code == 404:
-                print(f"  Страница {page} не найдена (404). Прекращаю парсинг.")
+                logger.info("Страница %s не найдена (404). Прекращаю парсинг.", page)
                 break
 
             if response.status_code != 200:
-                print(f"  Ошибка {response.status_code}. Пропускаю страницу.")
+                logger.warning("Ошибка %s на странице %s. Пропускаю страницу.", response.status_code, page)
                 page += 1
                 continue
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            # 🔧 ИСПРАВЛЕННЫЙ СЕЛЕКТОР: Находим ВСЕ статьи на странице
-            # Используем правильные классы из HTML структуры TechCrunch
-            article_elements = soup.find_all('li', class_='wp-block-post')
-
-            if not article_elements:
-                # Альтернативный селектор
-                article_elements = soup.select('article.post-block, .post-block')
-
-            if not article_elements:
-                print(f"На странице {page} не найдены статьи. Пробую другой селектор...")
-                # Еще один вариант поиска
-                article_elements = soup.select('[class*="post-"]')
+            with METRICS.timer('parse'):
+                page_articles, found, has_next = parse_listing_page(response.content, page)
 
-            if not article_elements or len(article_elements) == 0:
-                print(f"На странице {page} статьи не найдены. Проверяю HTML...")
-                # Выводим отладку для проверки структуры
-                # print(soup.prettify()[:2000])  # Раскомментируйте для отладки
+            if not found:
                 break
 
-            print(f"  Найдено статей: {len(article_elements)}")
-
-            # Парсим каждую статью на странице
+            # Добавляем статьи (пока без текста)
             articles_on_page = 0
-            published_date = None
-
-            for article_element in article_elements:
-                try:
-                    # 1. Извлекаем ссылку на статью - ИСПРАВЛЕННЫЙ СЕЛЕКТОР
-                    link_element = article_element.select_one('a.loop-card__title-link')
-
-                    # Если не нашли через класс, ищем по атрибуту data-destinationlink
-                    if not link_element:
-                        link_element = article_element.select_one('a[data-destinationlink]')
-
-                    # Если все еще не нашли, ищем любую ссылку внутри
-                    if not link_element:
-                        link_element = article_element.select_one('a[href*="/202"]')
-
-                    if not link_element:
-                        print(f"    Не найдена ссылка в статье")
-                        continue
-
-                    article_url = link_element.get('href', '')
-                    if not article_url:
-                        # Пробуем получить из data-destinationlink
-                        article_url = link_element.get('data-destinationlink', '')
+            for article in page_articles:
+                if article["url"] not in all_articles:
+                    all_articles[article["url"]] = article
+                    articles_on_page += 1
 
-                    if not article_url:
-                        continue
+            logger.info("На странице %s добавлено статей: %s, всего собрано: %s/%s (%.1f%%)",
+                        page, articles_on_page, len(all_articles), target_articles,
+                        len(all_articles) / target_articles * 100)
 
-                    if not article_url.startswith('http'):
-                        article_url = 'https://techcrunch.com' + article_url
-
-                    # 2. Извлекаем заголовок - ИСПРАВЛЕННЫЙ СЕЛЕКТОР
-                    title_element = article_element.select_one('.loop-card__title')
-                    if not title_element:
-                        title_element = link_element
-
-                    article_title = title_element.get_text(strip=True) if title_element else ""
-                    """
-                    
-                    # 3. Извлекаем дату - ИСПРАВЛЕННЫЙ СЕЛЕКТОР
-                    date_element = article_element.find('time', recursive=True)
-
-                    print(f" Date {date_element}")
-                    if date_element:
-                        datetime_str = date_element.get('datetime')
-
-                        if datetime_str:
-                            date_str = datetime_str[:10]
-
-                            try:
-                                published_date = date.fromisoformat(date_str)
-                                six_months_ago_date = six_months_ago.date()
-
-                                if published_date < six_months_ago_date:
-                                    print(f"    Статья слишком старая: {published_date}")
-                                    continue
-                            except Exception as e:
-                                print(f"    Ошибка сравнения дат: {e}")
-                    else:
-                        published_date = date.today()
-                    """
-
-                    date_from_url = article_url.split('/')[3:6]
-                    if date_from_url[0][:2]=='20':
-                        published_date = '-'.join(date_from_url)
-
-
-                    # 5. Получаем полный текст статьи (позже)
-                    print(f"    Найдена статья: {article_title[:70]}...")
-
-                    # 7. Создаем ID
-                    article_id = str(uuid.uuid5(uuid.NAMESPACE_URL, article_url))
-                    #article_id = len(all_articles) + 1
-
-                    # 8. Добавляем статью (пока без текста)
-                    if article_url not in all_articles:
-                        all_articles[article_url] = {
-                            "id": article_id,
-                            "title": article_title,
-                            "url": article_url,
-                            "published_time": published_date,
-                        }
-
-                        articles_on_page += 1
-                        print(f"    ✓ Добавлена: {article_title[:60]}...")
-
-                except Exception as e:
-                    print(f"    Ошибка обработки статьи: {e}")
-                    continue
-
-            print(f"  На странице {page} добавлено статей: {articles_on_page}")
-            print(f"  Всего собрано: {len(all_articles)}/{target_articles}")
-            print(f"  Прогресс: {len(all_articles) / target_articles * 100:.1f}%")
-
-            # Проверяем, есть ли следующая страница - ИСПРАВЛЕННЫЙ СЕЛЕКТОР
-            next_page_link = soup.select_one('.wp-block-query-pagination-next, a[rel="next"]')
-            if not next_page_link and len(article_elements) < 10:
-                print("  Нет следующей страницы или мало статей. Прекращаю.")
+            if not has_next:
+                logger.info("Нет следующей страницы или мало статей. Прекращаю.")
                 break
 
             page += 1
 
-            print()  # Пустая строка для читаемости
-
         except requests.exceptions.Timeout:
-            print(f"  Таймаут на странице {page}. Пропускаю.")
+            logger.warning("Таймаут на странице %s. Пропускаю.", page)
             page += 1
             continue
         except Exception as e:
-            print(f"  Критическая ошибка на странице {page}: {e}")
+            logger.error("Критическая ошибка на странице %s: %s", page, e)
             break
 
     # 🔧 ДОБАВЛЯЕМ ПОЛУЧЕНИЕ ПОЛНОГО ТЕКСТА ДЛЯ ВСЕХ СОБРАННЫХ СТАТЕЙ
-    print(f"\nНачинаю получение полного текста для {len(all_articles)} статей...")
+    logger.info("Начинаю получение полного текста для %s статей...", len(all_articles))
 
     articles_with_text = []
     processed_count = 0
@@ -200,13 +144,14 @@ def parse_techcrunch_pagination(target_articles, max_pages):
     for i, (article_url, article_data) in enumerate(list(all_articles.items()), 1):
         try:
             total_articles = len(all_articles)
-            print(f"[{i}/{total_articles}] Получаю текст: {article_data['title'][:60]}...")
+            logger.debug("[%s/%s] Получаю текст: %s...", i, total_articles, article_data['title'][:60])
 
             # Получаем полный текст
             full_text = extract_full_article_text(session, article_url)
 
             if not full_text or len(full_text) < 500:
-                print(f"Текст слишком короткий или не найден")
+                logger.info("Текст слишком короткий или не найден: %s", article_url)
+                METRICS.inc('articles_total', result='no_text')
                 # Удаляем статью без текста
                 del all_articles[article_url]
                 continue
@@ -218,20 +163,33 @@ def parse_techcrunch_pagination(target_articles, max_pages):
            #     del all_articles[article_url]
            #     continue
 
+            if dedup is not None:
+                with METRICS.timer('dedup'):
+                    duplicate_of = dedup.check(article_url, article_data['id'], full_text)
+                if duplicate_of is not None:
+                    METRICS.inc('near_duplicates_total', action=dedup_mode)
+                    if dedup_mode == 'drop':
+                        logger.info("Почти-дубликат %s статьи %s, пропускаю", article_url, duplicate_of)
+                        METRICS.inc('articles_total', result='near_duplicate')
+                        del all_articles[article_url]
+                        continue
+                    article_data["duplicate_of"] = duplicate_of
+
             # Добавляем текст к данным статьи
             article_data["text"] = full_text
             article_data["word_count"] = len(full_text.split())
 
             articles_with_text.append(article_data)
             processed_count += 1
+            METRICS.inc('articles_total', result='ok')
 
-            print(f"    ✓ Текст получен: {article_data['word_count']} слов")
+            logger.debug("Текст получен: %s слов", article_data['word_count'])
 
             # Задержка между запросами статей
-            time.sleep(random.uniform(0.5, 1.5))
+            _polite_sleep(0.5, 1.5, 'article')
 
         except Exception as e:
-            print(f" Ошибка получения текста: {e}")
+            logger.warning("Ошибка получения текста %s: %s", article_url, e)
             # Удаляем проблемную статью
             if article_url in all_articles:
                 del all_articles[article_url]
@@ -241,81 +199,207 @@ def parse_techcrunch_pagination(target_articles, max_pages):
     articles_list = list(all_articles.values())
     #articles_list.sort(key=lambda x: x['published_time'], reverse=True)
 
-    print("\n" + "=" * 60)
-    print(f"ПАРСИНГ ЗАВЕРШЕН!")
-    print(f"Всего собрано ссылок: {len(articles_list)}")
-    print(f"Статей с текстом: {len(articles_with_text)}")
-    print("=" * 60)
+    logger.info("Парсинг завершен: ссылок %s, статей с текстом %s", len(articles_list), len(articles_with_text))
+    log_summary(METRICS, logger)
 
     return articles_list[:target_articles]
 
 
+def listing_page_url(page, base_url=BASE_URL):
+    """Возвращает URL страницы пагинации категории AI"""
+    if page == 1:
+        return f"{base_url}{CATEGORY_PATH}"
+    return f"{base_url}{CATEGORY_PATH}page/{page}/"
+
+
+def parse_listing_page(html, page, base_url=BASE_URL):
+    """
+    Разбирает HTML страницы листинга
+
+    Returns:
+        (статьи без текста, число найденных элементов, есть ли следующая страница)
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # 🔧 ИСПРАВЛЕННЫЙ СЕЛЕКТОР: Находим ВСЕ статьи на странице
+    # Используем правильные классы из HTML структуры TechCrunch
+    article_elements = soup.find_all('li', class_='wp-block-post')
+
+    if not article_elements:
+        # Альтернативный селектор
+        article_elements = soup.select('article.post-block, .post-block')
+
+    if not article_elements:
+        logger.debug("На странице %s не найдены статьи. Пробую другой селектор...", page)
+        # Еще один вариант поиска
+        article_elements = soup.select('[class*="post-"]')
+
+    if not article_elements or len(article_elements) == 0:
+        logger.warning("На странице %s статьи не найдены. Проверяю HTML...", page)
+        # Выводим отладку для проверки структуры
+        # print(soup.prettify()[:2000])  # Раскомментируйте для отладки
+        return [], 0, False
+
+    logger.debug("Найдено статей: %s", len(article_elements))
+
+    # Парсим каждую статью на странице
+    page_articles = []
+    seen_urls = set()
+    published_date = None
+
+    for article_element in article_elements:
+        try:
+            # 1. Извлекаем ссылку на статью - ИСПРАВЛЕННЫЙ СЕЛЕКТОР
+            link_element = article_element.select_one('a.loop-card__title-link')
+
+            # Если не нашли через класс, ищем по атрибуту data-destinationlink
+            if not link_element:
+                link_element = article_element.select_one('a[data-destinationlink]')
+
+            # Если все еще не нашли, ищем любую ссылку внутри
+            if not link_element:
+                link_element = article_element.select_one('a[href*="/202"]')
+
+            if not link_element:
+                logger.debug("Не найдена ссылка в статье")
+                continue
+
+            article_url = link_element.get('href', '')
+            if not article_url:
+                # Пробуем получить из data-destinationlink
+                article_url = link_element.get('data-destinationlink', '')
+
+            if not article_url:
+                continue
+
+            if not article_url.startswith('http'):
+                article_url = base_url + article_url
+
+            # 2. Извлекаем заголовок - ИСПРАВЛЕННЫЙ СЕЛЕКТОР
+            title_element = article_element.select_one('.loop-card__title')
+            if not title_element:
+                title_element = link_element
+
+            article_title = title_element.get_text(strip=True) if title_element else ""
+            """
+            
+            # 3. Извлекаем дату - ИСПРАВЛЕННЫЙ СЕЛЕКТОР
+            date_element = article_element.find('time', recursive=True)
+
+            print(f" Date {date_element}")
+            if date_element:
+                datetime_str = date_element.get('datetime')
+
+                if datetime_str:
+                    date_str = datetime_str[:10]
+
+                    try:
+                        published_date = date.fromisoformat(date_str)
+                        six_months_ago_date = six_months_ago.date()
+
+                        if published_date < six_months_ago_date:
+                            print(f"    Статья слишком старая: {published_date}")
+                            continue
+                    except Exception as e:
+                        print(f"    Ошибка сравнения дат: {e}")
+            else:
+                published_date = date.today()
+            """
+
+            date_from_url = article_url.split('/')[3:6]
+            if date_from_url[0][:2]=='20':
+                published_date = '-'.join(date_from_url)
+
+
+            # 5. Получаем полный текст статьи (позже)
+            logger.debug("Найдена статья: %s...", article_title[:70])
+
+            # 7. Создаем ID
+            article_id = str(uuid.uuid5(uuid.NAMESPACE_URL, article_url))
+            #article_id = len(all_articles) + 1
+
+            # 8. Добавляем статью (пока без текста)
+            if article_url not in seen_urls:
+                seen_urls.add(article_url)
+                page_articles.append({
+                    "id": article_id,
+                    "title": article_title,
+                    "url": article_url,
+                    # RFC 3339 UTC - под datetime индекс Qdrant и фильтры по диапазону дат
+                    "published_time": normalize_published_time(published_date),
+                })
+
+                logger.debug("Добавлена: %s...", article_title[:60])
+
+        except Exception as e:
+            logger.warning("Ошибка обработки статьи: %s", e)
+            continue
+
+    # Проверяем, есть ли следующая страница - ИСПРАВЛЕННЫЙ СЕЛЕКТОР
+    next_page_link = soup.select_one('.wp-block-query-pagination-next, a[rel="next"]')
+    has_next = bool(next_page_link) or len(article_elements) >= 10
+
+    return page_articles, len(article_elements), has_next
+
+
 def extract_full_article_text(session, url):
     """Извлекает полный текст статьи"""
     try:
-        time.sleep(random.uniform(0.5, 0.8))  # Задержка между запросами
+        _polite_sleep(0.5, 0.8, 'article')  # Задержка между запросами
 
-        response = session.get(url, timeout=15)
+        response = _fetch(session, url, 'article')
 
         if response.status_code != 200:
             return None
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        # Удаляем ненужные элементы
-        for element in soup.select('script, style, iframe, nav, footer, .advertisement, .share-buttons, .comments'):
-            element.decompose()
-
-        # Пробуем разные селекторы для основного контента
-        content_selectors = [
-            '.article-content',
-            '.entry-content',
-            '.single-post-content',
-            'article .content',
-            '.article__content',
-            '.article-body',
-            '.post-content',
-            'article > div',
-            '[class*="content"]',
-            '.rich-text'
-        ]
-
-
-        for selector in content_selectors:
-            content_div = soup.select_one(selector)
-            if content_div:
-                # Извлекаем все текстовые элементы
-                text_elements = content_div.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
-                text_parts = []
-
-                for element in text_elements:
-                    text = element.get_text(strip=True)
-                    if text and len(text) > 30:  # Игнорируем короткие элементы
-                        text_parts.append(text)
-
-                if text_parts:
-                    full_text = '\n\n'.join(text_parts)
-                    if len(full_text) > 300:
-                        return full_text
-
-        # Резервный метод: все параграфы в статье
-        article_tag = soup.find('article')
-        if article_tag:
-            paragraphs = article_tag.find_all('p')
-            if paragraphs:
-                text_parts = [p.get_text(strip=True) for p in paragraphs if len(p.get_text(strip=True)) > 50]
-                if text_parts:
-                    full_text = '\n\n'.join(text_parts)
-                    if len(full_text) > 300:
-                        return full_text
-
-        return None
+        with METRICS.timer('extract'):
+            return extract_article_text(response.content)
 
     except Exception as e:
-        print(f"      Ошибка получения текста: {e}")
+        logger.warning("Ошибка получения текста %s: %s", url, e)
         return None
 
 
+def extract_article_text(html):
+    """Извлекает полный текст статьи из HTML страницы"""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Удаляем ненужные элементы
+    for element in soup.select(REMOVE_SELECTOR):
+        element.decompose()
+
+    # Пробуем разные селекторы для основного контента
+    for selector in CONTENT_SELECTORS:
+        content_div = soup.select_one(selector)
+        if content_div:
+            # Извлекаем все текстовые элементы
+            text_elements = content_div.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+            text_parts = []
+
+            for element in text_elements:
+                text = element.get_text(strip=True)
+                if text and len(text) > 30:  # Игнорируем короткие элементы
+                    text_parts.append(text)
+
+            if text_parts:
+                full_text = '\n\n'.join(text_parts)
+                if len(full_text) > 300:
+                    return full_text
+
+    # Резервный метод: все параграфы в статье
+    article_tag = soup.find('article')
+    if article_tag:
+        paragraphs = article_tag.find_all('p')
+        if paragraphs:
+            text_parts = [p.get_text(strip=True) for p in paragraphs if len(p.get_text(strip=True)) > 50]
+            if text_parts:
+                full_text = '\n\n'.join(text_parts)
+                if len(full_text) > 300:
+                    return full_text
+
+    return None
+
+
 def is_ai_article(title, text):
     """Проверяет, относится ли статья к AI тематике"""
     content = (title + ' ' + text).lower()
@@ -360,16 +444,73 @@ def save_articles_to_json(articles, filename=None):
     with open(filename, 'w', encoding='utf-8') as f:
         json.dump(articles, f, ensure_ascii=False, indent=2)
 
-    print(f"Статьи сохранены в {filename}")
+    logger.info("Статьи сохранены в %s", filename)
     return filename
 
 
+def print_statistics(articles, filename, elapsed_time):
+    """Печатает статистику по статьям; articles может быть ленивым итератором"""
+    count = 0
+    total_words = 0
+    dates = []
+    first_articles = []
+
+    for article in articles:
+        count += 1
+        total_words += article.get('word_count', 0)
+        if 'date' in article:
+            dates.append(article['date'])
+        if len(first_articles) < 3:
+            first_articles.append(article)
+
+    if not count:
+        logger.warning("Не удалось собрать статьи")
+        return
+
+    logger.info("Собрано статей: %s за %.1f минут, средняя длина статьи: %.0f слов",
+                count, elapsed_time / 60, total_words / count)
+
+    if dates:
+        logger.info("Диапазон дат: %s - %s", min(dates), max(dates))
+
+    for i, article in enumerate(first_articles):
+        logger.info("%s. %s... (дата: %s, слов: %s)", i + 1, article['title'][:80],
+                    article.get('date', 'N/A'), article['word_count'])
+
+    logger.info("Файл: %s", filename)
+
+
 def main():
     """Основная функция"""
-    print("=" * 60)
-    print("TECHCRUNCH AI ARTICLE PARSER")
-    print("Парсинг пагинации /category/artificial-intelligence/page/N/")
-    print("=" * 60)
+    parser = argparse.ArgumentParser(description="Парсер статей TechCrunch AI")
+    parser.add_argument('--sync', action='store_true',
+                        help='последовательный парсер на requests вместо асинхронного')
+    parser.add_argument('--max-per-host', type=int, default=8,
+                        help='максимум одновременных запросов к хосту (async)')
+    parser.add_argument('--rps', type=float, default=2.0,
+                        help='средняя частота запросов в секунду (async)')
+    parser.add_argument('--ledger', default=None,
+                        help='путь к SQLite журналу URL: обходить только новые/измененные статьи (async)')
+    parser.add_argument('--output', default='techcrunch_ai_articles.jsonl',
+                        help='JSONL файл, в который потоково пишутся статьи (async)')
+    parser.add_argument('--resume', action='store_true',
+                        help='продолжить обход с последнего checkpoint файла --output (async)')
+    parser.add_argument('--backend', choices=['lxml', 'bs4'], default='lxml',
+                        help='бэкенд извлечения текста статей (async)')
+    parser.add_argument('--parse-workers', type=int, default=0,
+                        help='число процессов для разбора HTML, 0 - разбор в event loop (async)')
+    parser.add_argument('--dedup', default=None,
+                        help='путь к SQLite индексу почти-дубликатов (MinHash), сохраняется между запусками')
+    parser.add_argument('--dedup-mode', choices=['drop', 'flag'], default='drop',
+                        help='drop - не сохранять почти-дубликаты, flag - сохранять с полем duplicate_of')
+    # sitemap_discovery сам импортирует new_parser - импорт только внутри main
+    from sitemap_discovery import add_discovery_args, make_discovery
+    add_discovery_args(parser)
+    add_instrumentation_args(parser)
+    args = parser.parse_args()
+
+    reporter = start_instrumentation(args)
+    logger.info("TechCrunch AI: парсинг пагинации /category/artificial-intelligence/page/N/")
 
     # Настройки
     TARGET_ARTICLES = 7000
@@ -377,37 +518,60 @@ def main():
 
     start_time = time.time()
 
-    # Парсим статьи
-    articles = parse_techcrunch_pagination(TARGET_ARTICLES, MAX_PAGES)
+    from near_dedup import NearDuplicateIndex
+    dedup = NearDuplicateIndex(args.dedup) if args.dedup else None
 
-    # Сохраняем
-    if articles:
+    if args.sync:
+        # Парсим статьи и сохраняем одним JSON файлом
+        try:
+            articles = parse_techcrunch_pagination(TARGET_ARTICLES, MAX_PAGES, dedup=dedup,
+                                                   dedup_mode=args.dedup_mode)
+        finally:
+            if dedup is not None:
+                dedup.close()
+            reporter.stop()
+        if not articles:
+            logger.warning("Не удалось собрать статьи")
+            return
         filename = save_articles_to_json(articles)
-
-        # Статистика
-        elapsed_time = time.time() - start_time
-        avg_words = sum(a['word_count'] for a in articles) / len(articles)
-
-        print(f"\n{'=' * 60}")
-        print("СТАТИСТИКА:")
-        print(f"Собрано статей: {len(articles)}")
-        print(f"Время выполнения: {elapsed_time / 60:.1f} минут")
-        print(f"Средняя длина статьи: {avg_words:.0f} слов")
-
-        if articles:
-            dates = [a['date'] for a in articles if 'date' in a]
-            if dates:
-                print(f"Диапазон дат: {min(dates)} - {max(dates)}")
-
-        print(f"\nПервые 3 статьи:")
-        for i, article in enumerate(articles[:3]):
-            print(f"{i + 1}. {article['title'][:80]}...")
-            print(f"   Дата: {article.get('date', 'N/A')}, Слов: {article['word_count']}")
-
-        print(f"\nФайл: {filename}")
-    else:
-        print("Не удалось собрать статьи")
+        print_statistics(articles, filename, time.time() - start_time)
+        return
+
+    from async_parser import crawl_techcrunch_to_jsonl
+    from article_store import iter_articles
+    from crawl_ledger import CrawlLedger
+    from html_extract import make_parse_pool
+
+    # Парсим статьи, сразу дописывая их в JSONL
+    ledger = CrawlLedger(args.ledger) if args.ledger else None
+    parse_pool = make_parse_pool(args.parse_workers) if args.parse_workers else None
+    discovery = make_discovery(args)
+    try:
+        crawl_techcrunch_to_jsonl(
+            args.output, TARGET_ARTICLES, MAX_PAGES,
+            resume=args.resume,
+            max_per_host=args.max_per_host,
+            requests_per_second=args.rps,
+            ledger=ledger,
+            backend=args.backend,
+            parse_pool=parse_pool,
+            dedup=dedup,
+            dedup_mode=args.dedup_mode,
+            discovery=discovery
+        )
+    finally:
+        if dedup is not None:
+            logger.info("Статей в индексе почти-дубликатов: %s", len(dedup))
+            dedup.close()
+        if parse_pool is not None:
+            parse_pool.shutdown()
+        if ledger is not None:
+            logger.info("URL в журнале: %s", len(ledger))
+            ledger.close()
+        reporter.stop()
+
+    print_statistics(iter_articles(args.output), args.output, time.time() - start_time)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
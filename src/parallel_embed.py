@@ -0,0 +1,283 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from multiprocessing import get_context
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from article_store import iter_articles
+from instrumentation import METRICS, setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ParallelEmbeddingConfig:
+    """Настройки параллельной генерации эмбеддингов на CPU"""
+    workers: int = 4
+    threads_per_worker: int = 0  # 0 - поровну разделить ядра между процессами
+    max_tokens_per_batch: int = 16384  # бюджет батча: число текстов x длина самого длинного
+    max_batch_size: int = 64
+    max_seq_length: int = 512
+    sort_by_length: bool = True
+    normalize: bool = True
+
+
+def load_sentence_transformer(model_name: str, device: str = 'cpu'):
+    """Загрузка модели в процессе-воркере"""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device=device)
+
+
+def estimate_token_lengths(texts: Sequence[str], tokenizer=None, max_seq_length: int = 512) -> np.ndarray:
+    """
+    Длины текстов в токенах (с учетом обрезки до max_seq_length)
+
+    Без токенизатора длина оценивается по числу слов.
+    """
+    if tokenizer is not None:
+        lengths = [len(ids) for ids in tokenizer(list(texts), add_special_tokens=True,
+                                                 truncation=False)['input_ids']]
+    else:
+        lengths = [int(len(text.split()) * 1.3) + 2 for text in texts]
+    return np.minimum(np.asarray(lengths, dtype=np.int64), max_seq_length)
+
+
+def token_budget_batches(lengths: np.ndarray, max_tokens: int, max_batch_size: int,
+                         sort_by_length: bool = True) -> List[np.ndarray]:
+    """
+    Разбивка на батчи по бюджету токенов
+
+    При сортировке по длине в батч попадают тексты похожей длины, поэтому
+    почти нет паддинга. Стоимость батча считается как число текстов,
+    умноженное на длину самого длинного (до нее дополняются остальные).
+
+    Returns:
+        список массивов индексов исходных текстов
+    """
+    order = np.argsort(-lengths, kind='stable') if sort_by_length else np.arange(len(lengths))
+
+    batches = []
+    batch = []
+    batch_max = 0
+    for idx in order:
+        length = max(int(lengths[idx]), 1)
+        new_max = max(batch_max, length)
+        if batch and (new_max * (len(batch) + 1) > max_tokens or len(batch) >= max_batch_size):
+            batches.append(np.asarray(batch, dtype=np.int64))
+            batch = []
+            new_max = length
+        batch.append(idx)
+        batch_max = new_max
+    if batch:
+        batches.append(np.asarray(batch, dtype=np.int64))
+    return batches
+
+
+# Состояние процесса-воркера: своя копия модели на процесс
+_worker_model = None
+_worker_normalize = True
+
+
+def _init_worker(model_factory: Callable, model_name: str, threads: int, normalize: bool,
+                 max_seq_length: int = 0):
+    global _worker_model, _worker_normalize
+    if threads > 0:
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    _worker_model = model_factory(model_name, 'cpu')
+    if max_seq_length > 0:
+        # Та же обрезка, под которую считался бюджет токенов батчей (по умолчанию у Qwen3 - 32k)
+        _worker_model.max_seq_length = max_seq_length
+    _worker_normalize = normalize
+
+
+def _worker_dim() -> int:
+    return int(_worker_model.encode(["test"], convert_to_numpy=True).shape[1])
+
+
+def _encode_batch(output_path: str, indices: np.ndarray, texts: List[str]) -> Tuple[int, float]:
+    """Кодирует батч и пишет строки в общий memmap; возвращает (число текстов, секунды)"""
+    start = time.perf_counter()
+    embeddings = _worker_model.encode(
+        texts,
+        batch_size=len(texts),
+        show_progress_bar=False,
+        convert_to_numpy=True,
+        normalize_embeddings=_worker_normalize
+    )
+    output = np.load(output_path, mmap_mode='r+')
+    output[indices] = embeddings
+    output.flush()
+    del output
+    return len(texts), time.perf_counter() - start
+
+
+class ParallelEmbeddingGenerator:
+    """
+    Генерация dense эмбеддингов пулом процессов на CPU
+
+    Тексты группируются по длине в батчи с бюджетом токенов, батчи
+    раздаются процессам (в каждом своя копия модели), результаты
+    пишутся в общий .npy memmap в исходном порядке текстов.
+    """
+
+    def __init__(self, model_name: str, config: ParallelEmbeddingConfig = None,
+                 tokenizer=None, model_factory: Callable = load_sentence_transformer):
+        """
+        Args:
+            model_name: имя модели SentenceTransformer
+            config: настройки пула и батчей
+            tokenizer: токенизатор для точных длин (None - оценка по словам)
+            model_factory: функция (model_name, device) -> модель, вызывается в каждом воркере
+        """
+        self.model_name = model_name
+        self.config = config or ParallelEmbeddingConfig()
+        self.tokenizer = tokenizer
+        self.model_factory = model_factory
+        self.last_stats: Dict = {}
+
+    def _threads_per_worker(self) -> int:
+        if self.config.threads_per_worker > 0:
+            return self.config.threads_per_worker
+        return max(1, (os.cpu_count() or 1) // self.config.workers)
+
+    def transform(self, texts: List[str], output_path: str, show_progress: bool = True) -> np.ndarray:
+        """
+        Эмбеддинги всех текстов
+
+        Args:
+            texts: тексты
+            output_path: .npy файл результата (memmap, общий для воркеров)
+
+        Returns:
+            memmap на output_path (N x dim) в исходном порядке texts
+        """
+        config = self.config
+        start = time.perf_counter()
+
+        lengths = estimate_token_lengths(texts, self.tokenizer, config.max_seq_length)
+        batches = token_budget_batches(lengths, config.max_tokens_per_batch,
+                                       config.max_batch_size, config.sort_by_length)
+
+        padded_tokens = sum(len(batch) * int(lengths[batch].max()) for batch in batches)
+        real_tokens = int(lengths.sum())
+
+        with ProcessPoolExecutor(
+            max_workers=config.workers,
+            mp_context=get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.model_factory, self.model_name, self._threads_per_worker(), config.normalize,
+                      config.max_seq_length)
+        ) as pool:
+            dim = pool.submit(_worker_dim).result()
+
+            output = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.float32,
+                                               shape=(len(texts), dim))
+            output.flush()
+            del output
+
+            futures = [
+                pool.submit(_encode_batch, output_path, batch,
+                            [texts[i] for i in batch])
+                for batch in batches
+            ]
+
+            done = 0
+            next_report = len(texts) / 10
+            for future in as_completed(futures):
+                count, seconds = future.result()
+                # Время кодирования меряется в воркере, метрики копятся в родителе
+                METRICS.record('embed', seconds, items=count)
+                done += count
+                if show_progress and done >= next_report:
+                    logger.info("  %s/%s текстов", done, len(texts))
+                    next_report += len(texts) / 10
+
+        elapsed = time.perf_counter() - start
+        self.last_stats = {
+            'texts': len(texts),
+            'batches': len(batches),
+            'padding_ratio': padded_tokens / real_tokens if real_tokens else 1.0,
+            'seconds': elapsed,
+            'texts_per_sec': len(texts) / elapsed if elapsed else 0.0,
+        }
+        return np.load(output_path, mmap_mode='r')
+
+
+def benchmark_embedding(texts: List[str], model_name: str, configs: List[ParallelEmbeddingConfig],
+                        output_dir: str = './temp_embeddings', tokenizer=None,
+                        model_factory: Callable = load_sentence_transformer) -> List[Dict]:
+    """
+    Замер текстов/сек для каждой конфигурации
+
+    Первая строка - базовый режим (один процесс, порядок корпуса,
+    фиксированный batch_size), как в DenseEmbeddingGenerator._transform_batched.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+
+    model = model_factory(model_name, 'cpu')
+    batch_size = configs[0].max_batch_size if configs else 32
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        model.encode(texts[i:i + batch_size], batch_size=batch_size, show_progress_bar=False,
+                     convert_to_numpy=True, normalize_embeddings=True)
+    elapsed = time.perf_counter() - start
+    results.append({'mode': f'serial(batch={batch_size})', 'texts_per_sec': len(texts) / elapsed,
+                    'padding_ratio': None})
+    del model
+
+    for i, config in enumerate(configs):
+        generator = ParallelEmbeddingGenerator(model_name, config, tokenizer, model_factory)
+        generator.transform(texts, os.path.join(output_dir, f'bench_{i}.npy'), show_progress=False)
+        stats = generator.last_stats
+        mode = (f"workers={config.workers},tokens={config.max_tokens_per_batch},"
+                f"{'sorted' if config.sort_by_length else 'corpus'}")
+        results.append({'mode': mode, 'texts_per_sec': stats['texts_per_sec'],
+                        'padding_ratio': stats['padding_ratio']})
+
+    for res in results:
+        padding = f"{res['padding_ratio']:.2f}" if res['padding_ratio'] is not None else '-'
+        logger.info("%-45s %10.1f текстов/сек  паддинг x%s", res['mode'], res['texts_per_sec'], padding)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк параллельной генерации эмбеддингов на CPU")
+    parser.add_argument('articles', help='файл со статьями (.json или .jsonl)')
+    parser.add_argument('--model', default='Qwen/Qwen3-Embedding-0.6B')
+    parser.add_argument('--limit', type=int, default=500)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--max-tokens', type=int, default=16384)
+    args = parser.parse_args()
+    setup_logging()
+
+    texts = []
+    for article in iter_articles(args.articles):
+        texts.append(article.get('text', ''))
+        if len(texts) >= args.limit:
+            break
+
+    tokenizer = None
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.model)
+    except Exception as e:
+        logger.warning("Токенизатор недоступен (%s), длины оцениваются по словам", e)
+
+    configs = [ParallelEmbeddingConfig(workers=1, max_tokens_per_batch=args.max_tokens, sort_by_length=False)]
+    configs += [ParallelEmbeddingConfig(workers=w, max_tokens_per_batch=args.max_tokens) for w in args.workers]
+    benchmark_embedding(texts, args.model, configs, tokenizer=tokenizer)
+
+
+if __name__ == "__main__":
+    main()
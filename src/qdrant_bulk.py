@@ -0,0 +1,308 @@
+import argparse
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from instrumentation import METRICS, Metrics, add_instrumentation_args, log_summary, start_instrumentation
+
+logger = logging.getLogger(__name__)
+
+# indexing_threshold сервера Qdrant по умолчанию (KB); коллекция без явного значения возвращает None
+DEFAULT_INDEXING_THRESHOLD = 20000
+
+
+@dataclass
+class BulkLoadConfig:
+    """Настройки массовой загрузки"""
+    workers: int = 4
+    max_batch_bytes: int = 4 * 1024 * 1024
+    max_batch_points: int = 1000
+    retries: int = 3
+    retry_backoff: float = 0.5
+    disable_indexing: bool = True
+    wait_indexed: bool = False
+    index_timeout: float = 600.0
+
+
+def estimate_point_bytes(point: models.PointStruct) -> int:
+    """Грубая оценка размера точки в запросе: вектор + payload"""
+    vector = point.vector
+    if isinstance(vector, dict):
+        size = 0
+        for value in vector.values():
+            if isinstance(value, models.SparseVector):
+                size += 12 * len(value.indices)
+            else:
+                size += 8 * len(value)
+    else:
+        size = 8 * len(vector)
+
+    if point.payload:
+        size += len(json.dumps(point.payload, ensure_ascii=False))
+    return size + 64
+
+
+class QdrantBulkLoader:
+    """
+    Конвейерная массовая загрузка точек в Qdrant
+
+    Поток-производитель строит точки и собирает батчи по оценке объема,
+    N потоков-загрузчиков отправляют их с wait=False и повторяют упавшие
+    батчи. В конце последний батч отправляется повторно с wait=True: Qdrant
+    применяет операции по порядку, поэтому это барьер согласованности.
+
+    В метрики пишутся этапы upsert (задержка, точки, байты, ошибки) и
+    backpressure - сколько производитель ждал свободного места в очереди:
+    если он ждет долго, загрузка упирается в сервер, а не в построение точек.
+    """
+
+    def __init__(self, client: QdrantClient, config: BulkLoadConfig = None, metrics: Metrics = None,
+                 on_upsert: Callable[[str], None] = None, local: Optional[bool] = None):
+        """
+        Args:
+            on_upsert: вызывается с именем коллекции после каждого успешного батча
+                (например, CollectionVersions.bump для сброса кэша результатов)
+            local: клиент локальный in-process; None - определить по path / location=':memory:'
+                в параметрах создания клиента
+        """
+        self.client = client
+        self.config = config or BulkLoadConfig()
+        self.metrics = metrics or METRICS
+        self.on_upsert = on_upsert
+        if local is None:
+            options = getattr(client, 'init_options', None) or {}
+            local = bool(options.get('path')) or options.get('location') == ':memory:'
+        # Локальный in-process клиент (QdrantClient(path=...)) не потокобезопасен:
+        # построение точек по-прежнему идет параллельно, но upsert сериализуются
+        self._upsert_lock = threading.Lock() if local else None
+
+    def _batches(self, points: Iterable[models.PointStruct]):
+        """Адаптивные батчи: ограничение и по числу точек, и по объему. Отдает (батч, байты)"""
+        batch = []
+        batch_bytes = 0
+        for point in points:
+            point_bytes = estimate_point_bytes(point)
+            if batch and (batch_bytes + point_bytes > self.config.max_batch_bytes
+                          or len(batch) >= self.config.max_batch_points):
+                yield batch, batch_bytes
+                batch = []
+                batch_bytes = 0
+            batch.append(point)
+            batch_bytes += point_bytes
+        if batch:
+            yield batch, batch_bytes
+
+    def _upsert_with_retry(self, collection_name: str, batch: List, wait: bool = False,
+                           batch_bytes: int = None, stage: str = 'upsert') -> int:
+        """Отправка батча с повторами. Возвращает число повторов"""
+        for attempt in range(self.config.retries + 1):
+            start = time.perf_counter()
+            try:
+                if self._upsert_lock is not None:
+                    with self._upsert_lock:
+                        self.client.upsert(collection_name=collection_name, points=batch, wait=wait)
+                else:
+                    self.client.upsert(collection_name=collection_name, points=batch, wait=wait)
+                self.metrics.record(stage, time.perf_counter() - start, nbytes=batch_bytes, items=len(batch))
+                if self.on_upsert is not None:
+                    self.on_upsert(collection_name)
+                return attempt
+            except Exception as e:
+                self.metrics.record(stage, time.perf_counter() - start,
+                                    status=getattr(e, 'status_code', None) or 'error')
+                self.metrics.inc('stage_errors_total', stage=stage)
+                if attempt == self.config.retries:
+                    raise
+                self.metrics.inc('upsert_retries_total')
+                delay = self.config.retry_backoff * 2 ** attempt
+                logger.warning("Ошибка загрузки батча (%s точек): %s. Повтор через %.1f с", len(batch), e, delay)
+                time.sleep(delay)
+        return self.config.retries
+
+    def upsert_batch(self, collection_name: str, points: List[models.PointStruct], wait: bool = True) -> int:
+        """Отправка одного готового батча с повторами (потоковая загрузка). Возвращает число повторов"""
+        return self._upsert_with_retry(collection_name, points, wait=wait,
+                                       batch_bytes=sum(estimate_point_bytes(point) for point in points))
+
+    def _indexing_threshold(self, collection_name: str) -> int:
+        """Текущий порог индексации; без явного значения - порог сервера по умолчанию"""
+        info = self.client.get_collection(collection_name)
+        threshold = info.config.optimizer_config.indexing_threshold
+        # OptimizersConfigDiff(indexing_threshold=None) ничего не меняет: восстанавливать нужно число
+        return DEFAULT_INDEXING_THRESHOLD if threshold is None else threshold
+
+    def _set_indexing_threshold(self, collection_name: str, value: int):
+        self.client.update_collection(
+            collection_name=collection_name,
+            optimizer_config=models.OptimizersConfigDiff(indexing_threshold=value)
+        )
+
+    def _wait_green(self, collection_name: str):
+        """Ожидание окончания индексации после восстановления порога"""
+        deadline = time.time() + self.config.index_timeout
+        while time.time() < deadline:
+            status = self.client.get_collection(collection_name).status
+            if status == models.CollectionStatus.GREEN:
+                return
+            time.sleep(1)
+        logger.warning("Индексация '%s' не завершилась за %s с", collection_name, self.config.index_timeout)
+
+    def load(self, collection_name: str, points: Iterable[models.PointStruct]) -> Dict:
+        """
+        Загружает точки в коллекцию
+
+        Returns:
+            статистика: points, batches, retries, seconds, points_per_sec
+        """
+        config = self.config
+        batches = queue.Queue(maxsize=config.workers * 2)
+        stats = {'points': 0, 'batches': 0, 'retries': 0}
+        failed = []
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                item = batches.get()
+                if item is None:
+                    return
+                batch, batch_bytes = item
+                try:
+                    retries = self._upsert_with_retry(collection_name, batch, batch_bytes=batch_bytes)
+                    with lock:
+                        stats['points'] += len(batch)
+                        stats['batches'] += 1
+                        stats['retries'] += retries
+                except Exception as e:
+                    with lock:
+                        failed.append((batch, e))
+
+        restore_threshold = None
+        if config.disable_indexing:
+            restore_threshold = self._indexing_threshold(collection_name)
+            self._set_indexing_threshold(collection_name, 0)
+
+        start = time.perf_counter()
+        try:
+            threads = [threading.Thread(target=worker, daemon=True) for _ in range(config.workers)]
+            for thread in threads:
+                thread.start()
+
+            last_batch = None
+            try:
+                for batch, batch_bytes in self._batches(points):
+                    # Ожидание места в очереди: загрузчики не успевают за построением точек
+                    with self.metrics.timer('backpressure'):
+                        batches.put((batch, batch_bytes))
+                    last_batch = batch
+            finally:
+                for _ in threads:
+                    batches.put(None)
+                for thread in threads:
+                    thread.join()
+
+            if failed:
+                raise RuntimeError(f"Не удалось загрузить {len(failed)} батчей "
+                                   f"({sum(len(b) for b, _ in failed)} точек): {failed[0][1]}")
+
+            # Барьер: повторная идемпотентная запись последнего батча с wait=True
+            if last_batch:
+                self._upsert_with_retry(collection_name, last_batch, wait=True, stage='upsert_barrier')
+        finally:
+            if config.disable_indexing:
+                self._set_indexing_threshold(collection_name, restore_threshold)
+
+        if config.disable_indexing and config.wait_indexed:
+            self._wait_green(collection_name)
+
+        stats['seconds'] = time.perf_counter() - start
+        stats['points_per_sec'] = stats['points'] / stats['seconds'] if stats['seconds'] else 0.0
+        return stats
+
+
+def _synthetic_points(n: int, dim: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    for i in range(n):
+        yield models.PointStruct(
+            id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"bench-{i}")),
+            vector=rng.random(dim, dtype=np.float32).tolist(),
+            payload={'title': f"Article {i}", 'text': 'x' * 500}
+        )
+
+
+def benchmark_bulk_load(client: QdrantClient, n_points: int = 5000, dim: int = 1024,
+                        workers_list=(1, 4), batch_size: int = 100) -> List[Dict]:
+    """
+    Сравнение точек/сек: последовательная загрузка батчами по batch_size с wait=True
+    (как в QdrantLocalSetup.upload_dense_embeddings) против QdrantBulkLoader
+    """
+    results = []
+
+    def fresh_collection(name):
+        if client.collection_exists(name):
+            client.delete_collection(name)
+        client.create_collection(
+            collection_name=name,
+            vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE),
+            optimizers_config=models.OptimizersConfigDiff(indexing_threshold=20000)
+        )
+
+    fresh_collection('bench_sequential')
+    start = time.perf_counter()
+    points = []
+    for point in _synthetic_points(n_points, dim):
+        points.append(point)
+        if len(points) >= batch_size:
+            client.upsert(collection_name='bench_sequential', points=points, wait=True)
+            points = []
+    if points:
+        client.upsert(collection_name='bench_sequential', points=points, wait=True)
+    elapsed = time.perf_counter() - start
+    results.append({'mode': f'sequential(batch={batch_size})', 'points_per_sec': n_points / elapsed})
+
+    for workers in workers_list:
+        name = f'bench_bulk_{workers}'
+        fresh_collection(name)
+        loader = QdrantBulkLoader(client, BulkLoadConfig(workers=workers))
+        stats = loader.load(name, _synthetic_points(n_points, dim))
+        results.append({'mode': f'bulk(workers={workers})', 'points_per_sec': stats['points_per_sec']})
+
+    for res in results:
+        logger.info("%-28s %10.0f точек/сек", res['mode'], res['points_per_sec'])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк массовой загрузки в Qdrant")
+    parser.add_argument('--path', default=None, help='локальная in-process база вместо сервера')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--grpc', action='store_true', help='подключаться по gRPC')
+    parser.add_argument('--points', type=int, default=5000)
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    add_instrumentation_args(parser)
+    args = parser.parse_args()
+    reporter = start_instrumentation(args)
+
+    if args.path:
+        client = QdrantClient(path=args.path)
+    else:
+        client = QdrantClient(host=args.host, prefer_grpc=args.grpc)
+
+    try:
+        benchmark_bulk_load(client, args.points, args.dim, args.workers)
+    finally:
+        reporter.stop()
+    log_summary(METRICS, logger)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import argparse
+import json
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from instrumentation import METRICS, Metrics
+
+
+class CollectionVersions:
+    """
+    Счетчики версий коллекций
+
+    Каждая успешная запись в коллекцию увеличивает ее версию. Версия входит
+    в ключ кэша результатов, поэтому после записи старые результаты больше
+    не находятся и вытесняются как обычные устаревшие записи.
+    """
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def bump(self, collection_name: str) -> int:
+        with self._lock:
+            version = self._versions.get(collection_name, 0) + 1
+            self._versions[collection_name] = version
+            return version
+
+    def get(self, collection_name: str) -> int:
+        with self._lock:
+            return self._versions.get(collection_name, 0)
+
+
+# Реестр по умолчанию: QdrantLocalSetup увеличивает версии здесь, если не передан свой
+COLLECTION_VERSIONS = CollectionVersions()
+
+
+def normalize_query(query: str) -> str:
+    """Текст запроса для ключа кэша: NFKC, без регистра, пробелы схлопнуты"""
+    return ' '.join(unicodedata.normalize('NFKC', query).casefold().split())
+
+
+def estimate_nbytes(value: Any) -> int:
+    """Оценка памяти, занимаемой результатом поиска (рекурсивно по контейнерам)"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes + 112
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        return size
+    if isinstance(value, dict):
+        return size + sum(estimate_nbytes(k) + estimate_nbytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(estimate_nbytes(item) for item in value)
+    fields = getattr(value, '__dict__', None)
+    if fields is not None:
+        return size + estimate_nbytes(fields)
+    return size
+
+
+@dataclass
+class QueryCacheConfig:
+    """Ограничения кэша результатов поиска"""
+    max_entries: int = 10000
+    max_bytes: int = 64 * 1024 * 1024  # жесткий предел по оценке estimate_nbytes
+    ttl_seconds: float = 600.0  # 0 - без ограничения по времени
+
+
+class QueryResultCache:
+    """
+    LRU кэш результатов поиска с TTL и пределом памяти
+
+    Ключ - нормализованный текст запроса, настройки поиска (k, веса,
+    фильтры) и версия коллекции. Размер каждого результата оценивается
+    при записи; пока суммарный размер больше max_bytes или записей больше
+    max_entries, вытесняются самые давно использованные. Результат,
+    который один больше max_bytes, не кэшируется. Закэшированные
+    результаты отдаются как есть - вызывающий код не должен их менять.
+    """
+
+    def __init__(self, config: QueryCacheConfig = None, metrics: Metrics = None):
+        self.config = config or QueryCacheConfig()
+        self.metrics = metrics or METRICS
+        self._entries: 'OrderedDict[Hashable, Tuple[float, int, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(query: str, version: int = 0, **config) -> Tuple[str, str, int]:
+        """Ключ кэша: запрос, настройки поиска (любые JSON-совместимые значения) и версия коллекции"""
+        return (normalize_query(query),
+                json.dumps(config, sort_keys=True, default=str, ensure_ascii=False),
+                version)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Результат по ключу или None (промах или истекший TTL)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                self.metrics.inc('query_cache_evictions_total', reason='ttl')
+                entry = None
+            if entry is None:
+                self.misses += 1
+                self.metrics.inc('query_cache_requests_total', result='miss')
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        self.metrics.inc('query_cache_requests_total', result='hit')
+        return entry[2]
+
+    def put(self, key: Hashable, value: Any):
+        nbytes = estimate_nbytes(key) + estimate_nbytes(value)
+        if nbytes > self.config.max_bytes:
+            self.metrics.inc('query_cache_evictions_total', reason='too_large')
+            return
+        expires = time.monotonic() + self.config.ttl_seconds if self.config.ttl_seconds > 0 else float('inf')
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires, nbytes, value)
+            self.nbytes += nbytes
+            while len(self._entries) > self.config.max_entries or self.nbytes > self.config.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.metrics.inc('query_cache_evictions_total', reason='lru')
+
+    def _remove(self, key: Hashable):
+        _, nbytes, _ = self._entries.pop(key)
+        self.nbytes -= nbytes
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Результат из кэша или compute() с записью в кэш"""
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict:
+        requests = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.nbytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+        }
+
+
+def main():
+    from dense_search import DenseSearchIndex
+    from query_service import HashingEncoder, QueryEngine, SearchRequest
+    from retrieval_benchmark import synthetic_corpus
+
+    parser = argparse.ArgumentParser(description="Кэш результатов поиска: повторяющиеся трендовые запросы")
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--distinct', type=int, default=300, help='различных запросов (частоты по закону Ципфа)')
+    parser.add_argument('--batch', type=int, default=8, help='запросов в одном вызове search_batch')
+    parser.add_argument('--cache-mb', type=float, default=64)
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.docs)
+    encoder = HashingEncoder()
+    embeddings = np.concatenate([encoder(corpus.texts[i:i + 256]) for i in range(0, len(corpus), 256)])
+    index = DenseSearchIndex(embeddings, corpus.article_ids)
+
+    rng = np.random.default_rng(0)
+    vocabulary = sorted({word for text in corpus.texts[:200] for word in text.split()})
+    distinct = [' '.join(rng.choice(vocabulary, 4)) for _ in range(args.distinct)]
+    weights = 1.0 / np.arange(1, args.distinct + 1)
+    picks = rng.choice(args.distinct, args.requests, p=weights / weights.sum())
+    # Те же запросы в разном регистре и с лишними пробелами
+    queries = [distinct[i].upper() if n % 3 == 0 else f"  {distinct[i]} " for n, i in enumerate(picks)]
+
+    print(f"{'Режим':<10} {'мс/запрос':>10} {'Попаданий':>10} {'Записей':>8} {'МБ':>6} {'Совпадение':>11}")
+    print("-" * 60)
+    baseline = None
+    for label, cache in (('без кэша', None),
+                         ('с кэшем', QueryResultCache(QueryCacheConfig(max_bytes=int(args.cache_mb * 2 ** 20))))):
+        engine = QueryEngine(encoder, index, cache=cache)
+        found = []
+        start = time.perf_counter()
+        for i in range(0, len(queries), args.batch):
+            found.extend(result['ids'] for result in
+                         engine.search_batch([SearchRequest(q) for q in queries[i:i + args.batch]]))
+        elapsed_ms = (time.perf_counter() - start) / len(queries) * 1000
+        baseline = baseline or found
+        stats = cache.stats() if cache else {'hit_rate': 0.0, 'entries': 0, 'bytes': 0}
+        print(f"{label:<10} {elapsed_ms:>10.3f} {stats['hit_rate']:>10.1%} {stats['entries']:>8} "
+              f"{stats['bytes'] / 2 ** 20:>6.2f} {str(found == baseline):>11}")
+
+
+if __name__ == "__main__":
+    main()
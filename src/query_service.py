@@ -0,0 +1,494 @@
+import argparse
+import asyncio
+import logging
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+from aiohttp import ClientSession, web
+
+from article_store import iter_articles, normalize_published_time
+from dense_search import DenseSearchIndex, normalize_rows
+from document_store import DocumentStore
+from instrumentation import METRICS, Metrics, add_instrumentation_args, start_instrumentation
+from query_cache import QueryCacheConfig, QueryResultCache
+from time_shards import TimeShardedDenseIndex
+
+logger = logging.getLogger(__name__)
+
+# Границы бакетов гистограммы размера батча
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+MAX_K = 100
+
+
+@dataclass
+class MicroBatchConfig:
+    """Настройки микро-батчинга запросов"""
+    max_batch_size: int = 32
+    max_wait_ms: float = 5.0  # сколько первый запрос батча ждет попутчиков
+    max_pending: int = 1024  # при большей очереди запросы сразу отклоняются (HTTP 503)
+
+
+@dataclass
+class SearchRequest:
+    """Один поисковый запрос; start / end - RFC 3339 границы даты публикации"""
+    query: str
+    k: int = 10
+    start: Optional[str] = None
+    end: Optional[str] = None
+
+
+class QueueFullError(RuntimeError):
+    """Очередь запросов переполнена"""
+
+
+class MicroBatcher:
+    """
+    Сборщик запросов в микро-батчи
+
+    Запросы копятся в asyncio очереди. Батч закрывается, когда набралось
+    max_batch_size запросов или с момента поступления первого прошло
+    max_wait_ms. Батч целиком обрабатывается process_batch в отдельном
+    потоке (event loop продолжает принимать запросы), результаты
+    раздаются ожидающим вызывающим. Пока считается один батч, следующий
+    успевает набраться, поэтому под нагрузкой батчи сами растут.
+    """
+
+    def __init__(self, process_batch: Callable[[List], List], config: MicroBatchConfig = None,
+                 metrics: Metrics = None):
+        """
+        Args:
+            process_batch: функция список запросов -> список результатов того же размера
+            config: настройки батчинга
+            metrics: реестр метрик (по умолчанию общий instrumentation.METRICS)
+        """
+        self.process_batch = process_batch
+        self.config = config or MicroBatchConfig()
+        self.metrics = metrics or METRICS
+        # Один поток: модель и матричные произведения сами распараллеливаются по ядрам
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.config.max_pending)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, item):
+        """Ставит запрос в очередь и ждет его результат"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((item, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.metrics.inc('query_rejected_total')
+            raise QueueFullError(f"В очереди уже {self.config.max_pending} запросов")
+        return await future
+
+    async def _collect(self) -> List:
+        first = await self._queue.get()
+        batch = [first]
+        deadline = first[2] + self.config.max_wait_ms / 1000
+
+        while len(batch) < self.config.max_batch_size:
+            # Все, что уже пришло, забираем без ожидания
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.metrics.observe('query_queue_wait_seconds', started - enqueued)
+            self.metrics.observe('query_batch_size', len(batch), buckets=BATCH_SIZE_BUCKETS)
+
+            try:
+                results = await loop.run_in_executor(self._executor, self.process_batch,
+                                                     [item for item, _, _ in batch])
+            except Exception as e:
+                logger.exception("Ошибка обработки батча из %s запросов", len(batch))
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                # Клиент мог отключиться, не дождавшись ответа
+                if not future.done():
+                    future.set_result(result)
+
+
+class QueryEngine:
+    """
+    Батчевый поиск по dense индексу
+
+    На батч - один вызов encode_queries и одно матричное произведение
+    с корпусом на каждый различный диапазон дат (запросы без дат идут
+    одной группой). Найденные документы всего батча достаются из
+    DocumentStore одним чтением. С кэшем результатов кодируются и
+    скорятся только запросы, которых нет в кэше, причем одинаковые
+    запросы батча - один раз.
+    """
+
+    def __init__(self, encode_queries: Callable[[List[str]], np.ndarray],
+                 index: Union[DenseSearchIndex, TimeShardedDenseIndex],
+                 documents: DocumentStore = None, document_fields: Sequence[str] = ('title', 'url', 'published_time'),
+                 weights: Dict[str, float] = None, metrics: Metrics = None,
+                 cache: QueryResultCache = None, version: Callable[[], int] = None):
+        """
+        Args:
+            encode_queries: функция кодирования списка запросов в нормализованные эмбеддинги
+            index: DenseSearchIndex или TimeShardedDenseIndex (нужен для фильтра по датам)
+            documents: хранилище статей для ответа с заголовками и ссылками, опционально
+            document_fields: поля документов в ответе
+            weights: text_weight, title_weight, recency_weight для DenseSearchIndex
+            metrics: реестр метрик (по умолчанию общий instrumentation.METRICS)
+            cache: кэш результатов поиска, опционально
+            version: текущая версия индекса для ключа кэша (по умолчанию индекс не меняется)
+        """
+        self.encode_queries = encode_queries
+        self.index = index
+        self.documents = documents
+        self.document_fields = list(document_fields)
+        self.weights = weights or {}
+        self.metrics = metrics or METRICS
+        self.cache = cache
+        self.version = version or (lambda: 0)
+
+    @property
+    def supports_date_range(self) -> bool:
+        return isinstance(self.index, TimeShardedDenseIndex)
+
+    def _search(self, embeddings: np.ndarray, k: int, start: Optional[str], end: Optional[str]) -> List[List[str]]:
+        if self.supports_date_range:
+            return self.index.search_batch(embeddings, k, start, end)
+        if start is not None or end is not None:
+            raise ValueError("Фильтр по датам требует TimeShardedDenseIndex")
+        return self.index.search_batch(embeddings, k, **self.weights)
+
+    def cache_key(self, request: SearchRequest, version: int):
+        return QueryResultCache.key(request.query, version, k=request.k, start=request.start, end=request.end,
+                                    weights=self.weights,
+                                    fields=self.document_fields if self.documents is not None else None)
+
+    def search_batch(self, requests: List[SearchRequest]) -> List[Dict]:
+        """
+        Поиск для батча запросов
+
+        Returns:
+            для каждого запроса {'ids': [...]} и, если есть хранилище, 'documents'
+        """
+        if self.cache is None:
+            return self._search_requests(requests)
+
+        # Версия читается до поиска: запись в индекс во время поиска сделает результат устаревшим
+        version = self.version()
+        keys = [self.cache_key(request, version) for request in requests]
+        results = [self.cache.get(key) for key in keys]
+
+        missing: Dict[tuple, List[int]] = {}
+        for i, result in enumerate(results):
+            if result is None:
+                missing.setdefault(keys[i], []).append(i)
+        if missing:
+            found = self._search_requests([requests[rows[0]] for rows in missing.values()])
+            for (key, rows), result in zip(missing.items(), found):
+                self.cache.put(key, result)
+                for i in rows:
+                    results[i] = result
+        return results
+
+    def _search_requests(self, requests: List[SearchRequest]) -> List[Dict]:
+        with self.metrics.timer('encode'):
+            embeddings = np.atleast_2d(self.encode_queries([request.query for request in requests]))
+        self.metrics.inc('stage_items_total', len(requests), stage='encode')
+
+        groups: Dict[tuple, List[int]] = {}
+        for i, request in enumerate(requests):
+            groups.setdefault((request.start, request.end), []).append(i)
+
+        results: List[Dict] = [{} for _ in requests]
+        with self.metrics.timer('score'):
+            for (start, end), rows in groups.items():
+                k = max(requests[i].k for i in rows)
+                found = self._search(embeddings[rows], k, start, end)
+                for i, ids in zip(rows, found):
+                    results[i]['ids'] = ids[:requests[i].k]
+
+        if self.documents is not None:
+            all_ids = [doc_id for result in results for doc_id in result['ids']]
+            documents = iter(self.documents.get_many(all_ids, self.document_fields))
+            for result in results:
+                result['documents'] = [next(documents) for _ in result['ids']]
+        return results
+
+
+def make_app(engine: QueryEngine, config: MicroBatchConfig = None, metrics: Metrics = None) -> web.Application:
+    """
+    HTTP API сервиса
+
+    POST /search  {"query": "...", "k": 10, "start": "2026-01-01", "end": null}
+    GET  /health
+    GET  /metrics  - метрики в формате Prometheus
+    """
+    metrics = metrics or engine.metrics
+    batcher = MicroBatcher(engine.search_batch, config, metrics)
+
+    async def search(request: web.Request) -> web.Response:
+        try:
+            body = await request.json()
+        except ValueError:
+            return web.json_response({'error': 'тело запроса должно быть JSON'}, status=400)
+
+        query = body.get('query') if isinstance(body, dict) else None
+        if not isinstance(query, str) or not query.strip():
+            return web.json_response({'error': "нужна непустая строка 'query'"}, status=400)
+        try:
+            k = int(body.get('k', 10))
+        except (TypeError, ValueError):
+            return web.json_response({'error': "'k' должно быть целым"}, status=400)
+        if not 1 <= k <= MAX_K:
+            return web.json_response({'error': f"'k' должно быть от 1 до {MAX_K}"}, status=400)
+
+        bounds = {}
+        for name in ('start', 'end'):
+            value = body.get(name)
+            bounds[name] = normalize_published_time(value) if value is not None else None
+            if value is not None and bounds[name] is None:
+                return web.json_response({'error': f"'{name}' - не дата ISO 8601"}, status=400)
+        if (bounds['start'] or bounds['end']) and not engine.supports_date_range:
+            return web.json_response({'error': 'индекс сервиса без помесячных шардов, фильтр по датам недоступен'},
+                                     status=400)
+
+        started = time.perf_counter()
+        try:
+            result = await batcher.submit(SearchRequest(query, k, bounds['start'], bounds['end']))
+        except QueueFullError as e:
+            return web.json_response({'error': str(e)}, status=503)
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        except Exception as e:
+            return web.json_response({'error': f"ошибка поиска: {e}"}, status=500)
+
+        took = time.perf_counter() - started
+        metrics.observe('query_seconds', took)
+        return web.json_response({**result, 'took_ms': round(took * 1000, 3)})
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok', 'documents': len(engine.index)})
+
+    async def prometheus(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.to_prometheus(), content_type='text/plain')
+
+    async def on_startup(app):
+        await batcher.start()
+
+    async def on_cleanup(app):
+        await batcher.stop()
+
+    app = web.Application()
+    app.router.add_post('/search', search)
+    app.router.add_get('/health', health)
+    app.router.add_get('/metrics', prometheus)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+class HashingEncoder:
+    """
+    Синтетический кодировщик для проверки сервиса без модели
+
+    Мешок слов хэшируется в buckets измерений и проходит через два
+    плотных слоя. Как и у трансформера, каждый вызов читает все веса
+    (десятки МБ), поэтому стоимость батча растет медленнее его размера.
+    """
+
+    def __init__(self, dim: int = 384, buckets: int = 8192, hidden: int = 1024, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.buckets = buckets
+        self.w1 = (rng.standard_normal((buckets, hidden)) / np.sqrt(buckets)).astype(np.float32)
+        self.w2 = (rng.standard_normal((hidden, dim)) / np.sqrt(hidden)).astype(np.float32)
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        bags = np.zeros((len(texts), self.buckets), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in text.lower().split():
+                bags[i, zlib.crc32(token.encode('utf-8')) % self.buckets] += 1.0
+        return normalize_rows(np.tanh(bags @ self.w1) @ self.w2)
+
+
+async def load_test(base_url: str, queries: List[str], concurrency: int, k: int = 10) -> Dict:
+    """
+    Нагрузка на запущенный сервис: concurrency клиентов по очереди отправляют запросы
+
+    Returns:
+        перцентили задержки (как retrieval_benchmark.latency_stats), qps и число ошибок
+    """
+    from retrieval_benchmark import latency_stats
+
+    latencies, errors = [], 0
+    position = iter(range(len(queries)))
+
+    async def client(session: ClientSession):
+        nonlocal errors
+        for i in position:
+            started = time.perf_counter()
+            async with session.post(f"{base_url}/search", json={'query': queries[i], 'k': k}) as response:
+                await response.read()
+                if response.status != 200:
+                    errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {**latency_stats(latencies), 'qps': len(queries) / elapsed, 'errors': errors}
+
+
+async def compare_batching(engine: QueryEngine, queries: List[str], configs: Dict[str, MicroBatchConfig],
+                           concurrency: int, k: int = 10) -> List[Dict]:
+    """Прогоняет одну и ту же нагрузку через сервис с разными настройками батчинга"""
+    results = []
+    for name, config in configs.items():
+        metrics = Metrics()
+        engine.metrics = metrics
+        runner = web.AppRunner(make_app(engine, config, metrics))
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            stats = await load_test(f"http://127.0.0.1:{port}", queries, concurrency, k)
+        finally:
+            await runner.cleanup()
+
+        batch_sizes = metrics.histogram('query_batch_size')
+        queue_wait = metrics.histogram('query_queue_wait_seconds')
+        results.append({'mode': name, **stats,
+                        'mean_batch': batch_sizes.sum / batch_sizes.count if batch_sizes else 0.0,
+                        'queue_wait_p95_ms': (queue_wait.quantile(0.95) or 0.0) * 1000 if queue_wait else 0.0})
+    return results
+
+
+def build_engine(args) -> QueryEngine:
+    """Загружает модель, индекс и хранилище документов один раз при старте сервиса"""
+    cache = None
+    if args.cache_mb > 0:
+        cache = QueryResultCache(QueryCacheConfig(max_entries=args.cache_entries,
+                                                  max_bytes=int(args.cache_mb * 2 ** 20),
+                                                  ttl_seconds=args.cache_ttl))
+
+    if args.synthetic:
+        from retrieval_benchmark import synthetic_corpus
+
+        corpus = synthetic_corpus(args.synthetic)
+        encoder = HashingEncoder()
+        embeddings = np.concatenate([encoder(corpus.texts[i:i + 256]) for i in range(0, len(corpus), 256)])
+        logger.info("Синтетический корпус: %s статей", len(corpus))
+        return QueryEngine(encoder, DenseSearchIndex(embeddings, corpus.article_ids), cache=cache)
+
+    if not args.model:
+        raise SystemExit("нужен --model (или --synthetic N)")
+    from parallel_embed import load_sentence_transformer
+
+    model = load_sentence_transformer(args.model)
+
+    def encode_queries(queries: List[str]) -> np.ndarray:
+        return model.encode(queries, batch_size=len(queries), convert_to_numpy=True,
+                            normalize_embeddings=True, show_progress_bar=False)
+
+    if args.shards:
+        index = TimeShardedDenseIndex(args.shards)
+    elif args.embeddings and args.articles:
+        article_ids, published_times = [], []
+        for i, article in enumerate(iter_articles(args.articles)):
+            article_ids.append(article.get('id', str(i)))
+            published_times.append(article.get('published_time', ''))
+        index = DenseSearchIndex(np.load(args.embeddings, mmap_mode='r'), article_ids,
+                                 published_times=published_times)
+    else:
+        raise SystemExit("нужен --shards или пара --embeddings и --articles")
+
+    documents = DocumentStore(args.document_store) if args.document_store else None
+    logger.info("Модель %s и индекс (%s статей) загружены", args.model, len(index))
+    return QueryEngine(encode_queries, index, documents, cache=cache)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поисковый сервис с микро-батчингом эмбеддингов запросов")
+    parser.add_argument('--model', default=None, help='модель sentence-transformers для запросов')
+    parser.add_argument('--shards', default=None, help='директория TimeShardedDenseIndex (поиск с датами)')
+    parser.add_argument('--embeddings', default=None, help='.npy с dense эмбеддингами статей')
+    parser.add_argument('--articles', default=None, help='статьи (.json/.jsonl) для ID и дат')
+    parser.add_argument('--document-store', default=None, help='DocumentStore для заголовков и ссылок в ответе')
+    parser.add_argument('--synthetic', type=int, default=0, help='синтетический корпус из N статей без модели')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-batch', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--cache-mb', type=float, default=64, help='предел памяти кэша результатов, 0 - без кэша')
+    parser.add_argument('--cache-entries', type=int, default=10000)
+    parser.add_argument('--cache-ttl', type=float, default=600, help='время жизни результата в кэше, с')
+    parser.add_argument('--load-test', action='store_true',
+                        help='вместо запуска сервиса сравнить батч 1 и микро-батчинг под нагрузкой')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    add_instrumentation_args(parser)
+    args = parser.parse_args()
+
+    reporter = start_instrumentation(args)
+    engine = build_engine(args)
+    config = MicroBatchConfig(max_batch_size=args.max_batch, max_wait_ms=args.max_wait_ms)
+
+    try:
+        if not args.load_test:
+            web.run_app(make_app(engine, config), host=args.host, port=args.port)
+            return
+
+        rng = np.random.default_rng(0)
+        vocabulary = [f"term{i}" for i in range(5000)]
+        queries = [' '.join(rng.choice(vocabulary, 6)) for _ in range(args.requests)]
+        configs = {'batch=1': MicroBatchConfig(max_batch_size=1, max_wait_ms=0.0),
+                   f'batch<={args.max_batch}, {args.max_wait_ms:g} мс': config}
+        results = asyncio.run(compare_batching(engine, queries, configs, args.concurrency))
+
+        print(f"\n{'Режим':<24} {'qps':>8} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} "
+              f"{'ср. батч':>9} {'ожидание p95, мс':>17} {'ошибок':>7}")
+        print("-" * 100)
+        for res in results:
+            print(f"{res['mode']:<24} {res['qps']:>8.0f} {res['p50_ms']:>9.1f} {res['p95_ms']:>9.1f} "
+                  f"{res['p99_ms']:>9.1f} {res['mean_batch']:>9.1f} {res['queue_wait_p95_ms']:>17.1f} "
+                  f"{res['errors']:>7}")
+    finally:
+        reporter.stop()
+
+
+if __name__ == "__main__":
+    main()
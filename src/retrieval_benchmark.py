@@ -0,0 +1,584 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from article_store import iter_articles
+
+SearchFunc = Callable[..., List[str]]  # search_func(query, k=k) -> список ID статей
+
+
+@dataclass
+class BenchmarkCorpus:
+    """Корпус для бенчмарка: статьи, размеченные вопросы и (опционально) dense эмбеддинги"""
+    article_ids: List[str]
+    texts: List[str]
+    titles: List[str]
+    published_times: List[str]
+    questions: List[Dict]
+    embeddings: Optional[np.ndarray] = None
+    scale: int = 1
+
+    def __len__(self) -> int:
+        return len(self.article_ids)
+
+
+def load_corpus(articles_path: str, questions_path: str, embeddings_path: str = None) -> BenchmarkCorpus:
+    """Размеченный набор: статьи, questions.json и эмбеддинги в том же порядке"""
+    article_ids, texts, titles, published_times = [], [], [], []
+    for idx, article in enumerate(iter_articles(articles_path)):
+        article_ids.append(article.get('id', str(idx)))
+        texts.append(article.get('text', ''))
+        titles.append(article.get('title', ''))
+        published_times.append(article.get('published_time', '2020-01-01'))
+
+    with open(questions_path, 'r', encoding='utf-8') as f:
+        questions = json.load(f)
+
+    embeddings = np.load(embeddings_path, mmap_mode='r') if embeddings_path else None
+    return BenchmarkCorpus(article_ids, texts, titles, published_times, questions, embeddings)
+
+
+def synthetic_corpus(num_docs: int = 5000, num_questions: int = 200, vocab_size: int = 20000,
+                     avg_doc_length: int = 300, dim: int = 64, seed: int = 0) -> BenchmarkCorpus:
+    """
+    Синтетический размеченный корпус для прогона без данных
+
+    Слова документов - по закону Ципфа, вопрос - несколько слов из
+    документа, правильный ответ - этот документ. Эмбеддинги
+    кластеризованы по темам, эмбеддинг вопроса близок к документу.
+    """
+    rng = np.random.default_rng(seed)
+    probs = np.arange(1, vocab_size + 1, dtype=np.float64) ** -1.1
+    probs /= probs.sum()
+    words = np.array([f"w{i}" for i in range(vocab_size)], dtype=object)
+
+    article_ids = [str(uuid.uuid5(uuid.NAMESPACE_URL, f"synthetic-base-{i}")) for i in range(num_docs)]
+    texts = [' '.join(words[rng.choice(vocab_size, size=max(int(rng.poisson(avg_doc_length)), 1), p=probs)])
+             for _ in range(num_docs)]
+    titles = [' '.join(text.split()[:8]) for text in texts]
+    published_times = [datetime.fromtimestamp(ts).isoformat()
+                       for ts in rng.integers(1.6e9, 1.77e9, num_docs)]
+
+    centers = rng.standard_normal((50, dim)).astype(np.float32)
+    embeddings = centers[rng.integers(0, 50, num_docs)] + 0.5 * rng.standard_normal((num_docs, dim)).astype(np.float32)
+
+    questions = []
+    for doc in rng.choice(num_docs, size=min(num_questions, num_docs), replace=False):
+        tokens = texts[doc].split()
+        questions.append({'question': ' '.join(rng.choice(tokens, size=4)), 'id': [article_ids[doc]]})
+
+    return BenchmarkCorpus(article_ids, texts, titles, published_times, questions, embeddings)
+
+
+def scale_corpus(corpus: BenchmarkCorpus, scale: int, seed: int = 0) -> BenchmarkCorpus:
+    """
+    Корпус, увеличенный в scale раз синтетическими статьями-дистракторами
+
+    Исходные статьи и вопросы сохраняются, поэтому метрики качества
+    остаются сопоставимыми: дистракторы никогда не являются правильным
+    ответом. Слова дистракторов берутся из частотного распределения
+    корпуса, длины - из распределения длин, эмбеддинги - смесь двух
+    реальных эмбеддингов с шумом.
+    """
+    if scale <= 1:
+        return corpus
+
+    rng = np.random.default_rng(seed)
+    extra = len(corpus) * (scale - 1)
+
+    vocabulary, counts = np.unique(
+        np.array([token for text in corpus.texts for token in text.split()], dtype=object),
+        return_counts=True
+    )
+    probs = counts / counts.sum()
+    lengths = np.array([len(text.split()) for text in corpus.texts])
+
+    texts = list(corpus.texts)
+    titles = list(corpus.titles)
+    for length in rng.choice(lengths, size=extra):
+        text = ' '.join(vocabulary[rng.choice(len(vocabulary), size=max(int(length), 1), p=probs)])
+        texts.append(text)
+        titles.append(' '.join(text.split()[:8]))
+
+    embeddings = None
+    if corpus.embeddings is not None:
+        base = np.asarray(corpus.embeddings, dtype=np.float32)
+        embeddings = np.empty((len(corpus) * scale, base.shape[1]), dtype=np.float32)
+        embeddings[:len(base)] = base
+        noise_scale = 0.3 * float(base.std())
+        for start in range(len(base), len(embeddings), 10000):
+            end = min(start + 10000, len(embeddings))
+            first = base[rng.integers(0, len(base), end - start)]
+            second = base[rng.integers(0, len(base), end - start)]
+            embeddings[start:end] = (0.5 * (first + second)
+                                     + noise_scale * rng.standard_normal(first.shape).astype(np.float32))
+
+    return BenchmarkCorpus(
+        article_ids=list(corpus.article_ids) + [str(uuid.uuid5(uuid.NAMESPACE_URL, f"synthetic-{i}"))
+                                                for i in range(extra)],
+        texts=texts,
+        titles=titles,
+        published_times=list(corpus.published_times)
+                        + rng.choice(np.asarray(corpus.published_times, dtype=object), size=extra).tolist(),
+        questions=corpus.questions,
+        embeddings=embeddings,
+        scale=scale,
+    )
+
+
+def _rss_mb() -> float:
+    """Текущая резидентная память процесса (на Linux - из /proc, иначе пиковая)"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_build(build: Callable[[], SearchFunc]) -> Tuple[SearchFunc, Dict]:
+    """Строит индекс и замеряет время и прирост резидентной памяти"""
+    gc.collect()
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    search_func = build()
+    build_s = time.perf_counter() - start
+    gc.collect()
+    rss_after = _rss_mb()
+    return search_func, {
+        'build_s': build_s,
+        'rss_mb': rss_after,
+        'rss_delta_mb': rss_after - rss_before,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def query_metrics(found_ids: Sequence[str], correct_ids: set, k: int) -> Dict[str, float]:
+    """Precision/Recall/Hit/MRR@k одного вопроса (как в evaluate_search)"""
+    correct_found = [article_id for article_id in found_ids if article_id in correct_ids]
+    mrr = 0.0
+    for rank, found_id in enumerate(found_ids, 1):
+        if found_id in correct_ids:
+            mrr = 1.0 / rank
+            break
+    return {
+        'precision': len(correct_found) / k if k > 0 else 0,
+        'recall': len(correct_found) / len(correct_ids),
+        'hit_rate': 1 if correct_found else 0,
+        'mrr': mrr,
+    }
+
+
+def evaluate_quality(search_func: SearchFunc, questions: List[Dict],
+                     k_values=(1, 3, 5, 10)) -> List[Dict]:
+    """
+    Метрики качества по размеченным вопросам
+
+    Returns:
+        список словарей как у evaluate_search: k, precision, recall, f1, hit_rate, mrr
+    """
+    labeled = [(q.get('question', ''), set(q.get('id', []))) for q in questions if q.get('id')]
+    results = []
+    for k in k_values:
+        totals = {'precision': 0.0, 'recall': 0.0, 'hit_rate': 0.0, 'mrr': 0.0}
+        for query, correct_ids in labeled:
+            for name, value in query_metrics(search_func(query, k=k), correct_ids, k).items():
+                totals[name] += value
+
+        averages = {name: value / len(labeled) if labeled else 0.0 for name, value in totals.items()}
+        precision, recall = averages['precision'], averages['recall']
+        averages['f1'] = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
+        results.append({'k': k, **averages})
+    return results
+
+
+def latency_stats(latencies_ms: Sequence[float]) -> Dict[str, float]:
+    """Перцентили задержки в миллисекундах"""
+    latencies = np.asarray(latencies_ms, dtype=np.float64)
+    if len(latencies) == 0:
+        return {}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99,
+            'mean_ms': float(latencies.mean()), 'max_ms': float(latencies.max()), 'queries': len(latencies)}
+
+
+def measure_latency(search_func: SearchFunc, queries: List[str], k: int = 10,
+                    repeats: int = 3, warmup: int = 5) -> Dict[str, float]:
+    """Задержка одиночных запросов (последовательно, после прогрева)"""
+    for query in queries[:warmup]:
+        search_func(query, k=k)
+
+    latencies = []
+    for _ in range(repeats):
+        for query in queries:
+            start = time.perf_counter()
+            search_func(query, k=k)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latency_stats(latencies)
+
+
+def measure_throughput(search_func: SearchFunc, queries: List[str], k: int = 10,
+                       concurrency_levels=(1, 4, 16), min_queries: int = 200) -> List[Dict]:
+    """
+    Запросов в секунду при нескольких уровнях параллелизма
+
+    Каждый уровень - пул потоков, который прогоняет не меньше
+    min_queries запросов (список вопросов повторяется по кругу).
+    """
+    total = max(min_queries, len(queries))
+    workload = [queries[i % len(queries)] for i in range(total)]
+
+    def timed(query):
+        start = time.perf_counter()
+        search_func(query, k=k)
+        return (time.perf_counter() - start) * 1000
+
+    results = []
+    for concurrency in concurrency_levels:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            start = time.perf_counter()
+            latencies = list(executor.map(timed, workload))
+            elapsed = time.perf_counter() - start
+        stats = latency_stats(latencies)
+        results.append({'concurrency': concurrency, 'qps': total / elapsed,
+                        'p50_ms': stats['p50_ms'], 'p95_ms': stats['p95_ms'], 'p99_ms': stats['p99_ms']})
+    return results
+
+
+@dataclass
+class BenchmarkSettings:
+    """Что и как мерить"""
+    k_values: Tuple[int, ...] = (1, 3, 5, 10)
+    latency_k: int = 10
+    latency_repeats: int = 3
+    concurrency_levels: Tuple[int, ...] = (1, 4, 16)
+    throughput_queries: int = 200
+
+
+def benchmark_retriever(name: str, search_func: SearchFunc, questions: List[Dict],
+                        settings: BenchmarkSettings = None, build_stats: Dict = None,
+                        num_docs: int = None, scale: int = 1) -> Dict:
+    """
+    Полный прогон уже построенного ретривера: качество, задержка, пропускная способность
+
+    Подходит для любых функций поиска из ноутбука (BM25, dense, hybrid, Qdrant).
+    """
+    settings = settings or BenchmarkSettings()
+    queries = [q.get('question', '') for q in questions if q.get('question')]
+
+    result = {
+        'retriever': name,
+        'scale': scale,
+        'num_docs': num_docs,
+        'build': build_stats or {},
+        'quality': evaluate_quality(search_func, questions, settings.k_values),
+        'latency': measure_latency(search_func, queries, settings.latency_k, settings.latency_repeats),
+        'throughput': measure_throughput(search_func, queries, settings.latency_k,
+                                         settings.concurrency_levels, settings.throughput_queries),
+    }
+    result['rss_mb'] = _rss_mb()
+    return result
+
+
+def _build_bm25(corpus: BenchmarkCorpus, options: Dict):
+    from bm25_search import BM25WithPreprocessing
+
+    bm25 = BM25WithPreprocessing(preprocess_workers=options.get('preprocess_workers', 1))
+    bm25.fit(corpus.texts)
+    return bm25
+
+
+def _build_dense_index(corpus: BenchmarkCorpus):
+    from dense_search import DenseSearchIndex
+
+    if corpus.embeddings is None:
+        raise ValueError("Для dense ретривера нужны эмбеддинги корпуса (--embeddings)")
+    return DenseSearchIndex(corpus.embeddings, corpus.article_ids, published_times=corpus.published_times)
+
+
+def build_bm25_retriever(corpus: BenchmarkCorpus, options: Dict) -> SearchFunc:
+    bm25 = _build_bm25(corpus, options)
+    article_ids = np.asarray(corpus.article_ids, dtype=object)
+
+    def search(query: str, k: int = 10) -> List[str]:
+        indices, _ = bm25.search(query, k)
+        return article_ids[indices].tolist()
+
+    return search
+
+
+def build_dense_retriever(corpus: BenchmarkCorpus, options: Dict) -> SearchFunc:
+    dense_index = _build_dense_index(corpus)
+    encode_queries = options['encode_queries']
+
+    def search(query: str, k: int = 10) -> List[str]:
+        return dense_index.search(encode_queries([query]), k)
+
+    return search
+
+
+def build_hybrid_retriever(corpus: BenchmarkCorpus, options: Dict) -> SearchFunc:
+    from hybrid_search import HybridConfig, HybridRetriever
+
+    # Эмбеддингов названий в бенчмарке нет - их вес уходит в релевантность
+    config = HybridConfig(text_weight=0.8, title_weight=0.0, recency_weight=0.2)
+    retriever = HybridRetriever(_build_bm25(corpus, options), _build_dense_index(corpus),
+                                options['encode_queries'], config)
+    return retriever.search
+
+
+def build_qdrant_retriever(corpus: BenchmarkCorpus, options: Dict) -> SearchFunc:
+    """
+    BM25 матрица в коллекции Qdrant, поиск через query_points
+
+    По умолчанию - локальная in-process база (поиск в ней перебором,
+    задержки не показательны); с options['qdrant_host'] - сервер.
+    """
+    from qdrant_client.http import models
+    from bm25_matrix import matrix_from_model
+    from hybrid_search import bm25_query_vector
+    from setup_qdrant import SPARSE_VECTOR_NAME, QdrantLocalSetup
+
+    bm25 = _build_bm25(corpus, options)
+    if options.get('qdrant_host'):
+        setup = QdrantLocalSetup(host=options['qdrant_host'])
+        lock = None
+    else:
+        setup = QdrantLocalSetup(path=options.get('qdrant_path', './temp_embeddings/benchmark_qdrant'))
+        # Локальный in-process клиент не потокобезопасен
+        lock = threading.Lock()
+
+    collection = options.get('qdrant_collection', 'retrieval_benchmark')
+    if setup.client.collection_exists(collection):
+        setup.client.delete_collection(collection)
+    setup.create_collection(collection, sparse_vector_name=SPARSE_VECTOR_NAME)
+    setup.bulk_upload_sparse_embeddings(collection, matrix_from_model(bm25),
+                                        ({'id': article_id} for article_id in corpus.article_ids))
+
+    def search(query: str, k: int = 10) -> List[str]:
+        indices, values = bm25_query_vector(bm25, query)
+        if not indices:
+            return []
+        request = dict(
+            collection_name=collection,
+            query=models.SparseVector(indices=indices, values=values),
+            using=SPARSE_VECTOR_NAME,
+            limit=k,
+            with_payload=['id']
+        )
+        if lock is None:
+            response = setup.client.query_points(**request)
+        else:
+            with lock:
+                response = setup.client.query_points(**request)
+        return [point.payload.get('id', str(point.id)) for point in response.points]
+
+    return search
+
+
+RETRIEVERS: Dict[str, Callable[[BenchmarkCorpus, Dict], SearchFunc]] = {
+    'bm25': build_bm25_retriever,
+    'dense': build_dense_retriever,
+    'hybrid': build_hybrid_retriever,
+    'qdrant': build_qdrant_retriever,
+}
+DENSE_RETRIEVERS = ('dense', 'hybrid')
+
+
+def run_suite(corpus: BenchmarkCorpus, retrievers: Sequence[str], scales: Sequence[int] = (1,),
+              settings: BenchmarkSettings = None, options: Dict = None) -> List[Dict]:
+    """Строит и прогоняет каждый ретривер на каждом масштабе корпуса"""
+    options = options or {}
+    results = []
+    for scale in scales:
+        scaled = scale_corpus(corpus, scale)
+        print(f"\nМасштаб x{scale}: {len(scaled)} статей, {len(scaled.questions)} вопросов")
+
+        for name in retrievers:
+            if name in DENSE_RETRIEVERS and (scaled.embeddings is None or 'encode_queries' not in options):
+                print(f"  {name}: пропущен (нужны эмбеддинги корпуса и модель для запросов)")
+                continue
+
+            search_func, build_stats = measure_build(lambda: RETRIEVERS[name](scaled, options))
+            result = benchmark_retriever(name, search_func, scaled.questions, settings,
+                                         build_stats, len(scaled), scale)
+            results.append(result)
+            print_result(result)
+            del search_func
+        del scaled
+    return results
+
+
+def print_result(result: Dict):
+    build = result['build']
+    latency = result['latency']
+    print(f"  {result['retriever']} x{result['scale']}: построение {build.get('build_s', 0):.1f} с, "
+          f"+{build.get('rss_delta_mb', 0):.0f} МБ (RSS {result['rss_mb']:.0f} МБ)")
+    for res in result['quality']:
+        print(f"    @{res['k']:<3} P={res['precision']:.3f} R={res['recall']:.3f} F1={res['f1']:.3f} "
+              f"Hit={res['hit_rate']:.3f} MRR={res['mrr']:.3f}")
+    print(f"    задержка p50={latency['p50_ms']:.2f} p95={latency['p95_ms']:.2f} p99={latency['p99_ms']:.2f} мс")
+    print("    " + ", ".join(f"{res['concurrency']} потоков: {res['qps']:.0f} запр/с" for res in result['throughput']))
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(results: List[Dict], path: str, run_info: Dict = None) -> Dict:
+    """JSON с результатами и окружением, пригодный для сравнения между коммитами"""
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpu_count': os.cpu_count(),
+            'platform': platform.platform(),
+            **(run_info or {}),
+        },
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False, default=float)
+    return report
+
+
+def compare_results(baseline: Dict, current: Dict, quality_tolerance: float = 0.005,
+                    latency_tolerance: float = 0.2) -> List[str]:
+    """
+    Регрессии текущего прогона относительно базового
+
+    Args:
+        quality_tolerance: допустимое абсолютное падение любой метрики качества
+        latency_tolerance: допустимый относительный рост p95 и падение qps
+
+    Returns:
+        список описаний регрессий (пустой - регрессий нет)
+    """
+    def index(report):
+        return {(res['retriever'], res['scale']): res for res in report['results']}
+
+    regressions = []
+    old_results = index(baseline)
+    for key, new in index(current).items():
+        old = old_results.get(key)
+        if old is None:
+            continue
+        label = f"{key[0]} x{key[1]}"
+
+        old_quality = {res['k']: res for res in old['quality']}
+        for res in new['quality']:
+            previous = old_quality.get(res['k'])
+            if previous is None:
+                continue
+            for metric in ('precision', 'recall', 'hit_rate', 'mrr'):
+                if res[metric] < previous[metric] - quality_tolerance:
+                    regressions.append(f"{label}: {metric}@{res['k']} {previous[metric]:.3f} -> {res[metric]:.3f}")
+
+        old_p95, new_p95 = old['latency'].get('p95_ms'), new['latency'].get('p95_ms')
+        if old_p95 and new_p95 > old_p95 * (1 + latency_tolerance):
+            regressions.append(f"{label}: p95 {old_p95:.2f} -> {new_p95:.2f} мс")
+
+        old_qps = {res['concurrency']: res['qps'] for res in old['throughput']}
+        for res in new['throughput']:
+            previous = old_qps.get(res['concurrency'])
+            if previous and res['qps'] < previous * (1 - latency_tolerance):
+                regressions.append(f"{label}: qps при {res['concurrency']} потоках "
+                                   f"{previous:.0f} -> {res['qps']:.0f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк ретриверов: качество, задержка, пропускная способность, память")
+    parser.add_argument('--articles', default=None, help='статьи (.json/.jsonl); без них - синтетический корпус')
+    parser.add_argument('--questions', default=None, help='questions.json с размеченными вопросами')
+    parser.add_argument('--embeddings', default=None, help='.npy с dense эмбеддингами статей')
+    parser.add_argument('--model', default=None, help='модель sentence-transformers для запросов')
+    parser.add_argument('--retrievers', nargs='+', default=['bm25'], choices=sorted(RETRIEVERS))
+    parser.add_argument('--scales', type=int, nargs='+', default=[1], help='например 1 10 100')
+    parser.add_argument('--synthetic-docs', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--latency-repeats', type=int, default=3)
+    parser.add_argument('--throughput-queries', type=int, default=200)
+    parser.add_argument('--preprocess-workers', type=int, default=1)
+    parser.add_argument('--qdrant-host', default=None, help='сервер Qdrant (по умолчанию локальная база)')
+    parser.add_argument('--qdrant-path', default='./temp_embeddings/benchmark_qdrant')
+    parser.add_argument('--output', default='./benchmark_results/retrieval.json')
+    parser.add_argument('--compare', default=None, help='JSON прошлого прогона для поиска регрессий')
+    parser.add_argument('--quality-tolerance', type=float, default=0.005)
+    parser.add_argument('--latency-tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.articles:
+        if not args.questions:
+            parser.error("--articles требует --questions")
+        corpus = load_corpus(args.articles, args.questions, args.embeddings)
+    else:
+        corpus = synthetic_corpus(args.synthetic_docs)
+
+    options = {'preprocess_workers': args.preprocess_workers,
+               'qdrant_host': args.qdrant_host, 'qdrant_path': args.qdrant_path}
+    if args.model:
+        from embedding_cache import cached_encode
+        from parallel_embed import load_sentence_transformer
+
+        model = load_sentence_transformer(args.model)
+        options['encode_queries'] = lambda queries: cached_encode(
+            None, args.model, True, queries,
+            lambda batch: model.encode(batch, convert_to_numpy=True, normalize_embeddings=True,
+                                       show_progress_bar=False))
+    elif not args.articles:
+        # Синтетика: эмбеддинг запроса - эмбеддинг правильной статьи с шумом
+        from dense_search import normalize_rows
+
+        question_vectors = {}
+        positions = {article_id: i for i, article_id in enumerate(corpus.article_ids)}
+        rng = np.random.default_rng(1)
+        for question in corpus.questions:
+            vector = corpus.embeddings[positions[question['id'][0]]]
+            question_vectors[question['question']] = vector + rng.standard_normal(vector.shape)
+        options['encode_queries'] = lambda queries: normalize_rows(
+            np.stack([question_vectors[query] for query in queries]))
+
+    settings = BenchmarkSettings(concurrency_levels=tuple(args.concurrency),
+                                 latency_repeats=args.latency_repeats,
+                                 throughput_queries=args.throughput_queries)
+    results = run_suite(corpus, args.retrievers, args.scales, settings, options)
+    report = save_results(results, args.output, {
+        'articles': args.articles or f'synthetic({args.synthetic_docs})',
+        'scales': args.scales,
+    })
+    print(f"\nРезультаты сохранены в {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, report, args.quality_tolerance, args.latency_tolerance)
+        if regressions:
+            print(f"\nРегрессии относительно {args.compare} (коммит {baseline['meta'].get('commit')}):")
+            for regression in regressions:
+                print(f"  - {regression}")
+            raise SystemExit(1)
+        print(f"\nРегрессий относительно {args.compare} нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,235 @@
+import argparse
+import logging
+import time
+from contextlib import contextmanager
 import numpy as np
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
-import json
-from typing import List, Dict
+from typing import List, Dict, Optional, Iterable, Iterator, Sequence
 import os
 from tqdm import tqdm
 from scipy import sparse
 
+from article_store import iter_articles, normalize_published_time
+from bm25_segments import SegmentedBM25Index
+from document_store import DocumentStore, DocumentStoreWriter
+from instrumentation import METRICS, add_instrumentation_args, log_summary, start_instrumentation
+from near_dedup import skip_flagged
+from qdrant_bulk import BulkLoadConfig, QdrantBulkLoader, estimate_point_bytes
+from query_cache import COLLECTION_VERSIONS, CollectionVersions, QueryResultCache
+
+logger = logging.getLogger(__name__)
+
+
+SPARSE_VECTOR_NAME = "bm25"
+DENSE_VECTOR_NAME = "dense"
+
+# Поля payload, по которым фильтруют и строят индексы; остальное - в DocumentStore
+FILTER_FIELDS = ('id', 'published_time', 'source', 'category', 'author')
+
+
+def build_payload(article: Dict, i: int, payload_fields: Sequence[str] = None) -> Dict:
+    """
+    Payload точки Qdrant для статьи (пустые поля отбрасываются)
+
+    Args:
+        article: статья
+        i: номер статьи (id по умолчанию)
+        payload_fields: оставить только эти поля (FILTER_FIELDS, когда полные статьи лежат в DocumentStore)
+    """
+    payload = {
+        'id': article.get('id', str(i)),
+        'title': article.get('title', ''),
+        'text': article.get('text', '')[:2000],  # Ограничиваем длину
+        # RFC 3339 UTC: datetime индекс Qdrant и фильтры по диапазону дат
+        'published_time': normalize_published_time(article.get('published_time')),
+        'source': 'TechCrunch',
+        'url': article.get('url', ''),
+        'category': article.get('category', ''),
+        'author': article.get('author', '')
+    }
+
+    if payload_fields is not None:
+        payload = {k: payload[k] for k in payload_fields if k in payload}
+
+    return {k: v for k, v in payload.items() if v}
+
+
+def iter_sparse_points(sparse_matrix, articles: Iterable[Dict], vector_name: str = SPARSE_VECTOR_NAME,
+                       payload_fields: Sequence[str] = None) -> Iterator[models.PointStruct]:
+    """Точки с нативными sparse векторами из строк CSR матрицы"""
+    csr = sparse.csr_matrix(sparse_matrix)
+    indptr, indices, data = csr.indptr, csr.indices, csr.data
+
+    count = 0
+    for i, article in enumerate(articles):
+        if i >= csr.shape[0]:
+            raise ValueError(f"Статей больше, чем строк в матрице ({csr.shape[0]})")
+
+        start, end = indptr[i], indptr[i + 1]
+        payload = build_payload(article, i, payload_fields)
+        yield models.PointStruct(
+            id=payload['id'],
+            vector={vector_name: models.SparseVector(
+                indices=indices[start:end].tolist(),
+                values=data[start:end].tolist()
+            )},
+            payload=payload
+        )
+        count += 1
+
+    if count < csr.shape[0]:
+        raise ValueError(f"Статей ({count}) меньше, чем строк в матрице ({csr.shape[0]})")
+
+
+def iter_dense_points(embeddings: np.ndarray, articles: Iterable[Dict],
+                      payload_fields: Sequence[str] = None) -> Iterator[models.PointStruct]:
+    """Точки с dense векторами"""
+    count = 0
+    for i, article in enumerate(articles):
+        # Статьи могут быть ленивым итератором: число сверяется по ходу, а не заранее
+        if i >= len(embeddings):
+            raise ValueError(f"Статей больше, чем эмбеддингов ({len(embeddings)})")
+
+        payload = build_payload(article, i, payload_fields)
+        yield models.PointStruct(
+            id=payload['id'],
+            vector=embeddings[i].tolist(),
+            payload=payload
+        )
+        count += 1
+
+    if count < len(embeddings):
+        raise ValueError(f"Статей ({count}) меньше, чем эмбеддингов ({len(embeddings)})")
+
+
+def iter_hybrid_points(embeddings: np.ndarray, sparse_matrix, articles: Iterable[Dict],
+                       dense_name: str = DENSE_VECTOR_NAME,
+                       sparse_name: str = SPARSE_VECTOR_NAME,
+                       payload_fields: Sequence[str] = None) -> Iterator[models.PointStruct]:
+    """Точки с именованными dense и sparse векторами одновременно"""
+    if len(embeddings) != sparse_matrix.shape[0]:
+        raise ValueError(f"Количество эмбеддингов ({len(embeddings)}) не равно числу строк "
+                         f"sparse матрицы ({sparse_matrix.shape[0]})")
+
+    # Число статей сверяет iter_sparse_points, поэтому строки embeddings и точек совпадают
+    for i, point in enumerate(iter_sparse_points(sparse_matrix, articles, sparse_name, payload_fields)):
+        point.vector[dense_name] = np.asarray(embeddings[i]).tolist()
+        yield point
+
+
+def date_range_filter(start=None, end=None, field: str = 'published_time') -> Optional[models.Filter]:
+    """
+    Фильтр Qdrant по дате публикации: start <= дата < end
+
+    Args:
+        start, end: datetime, date или строка ISO 8601; None - без границы
+
+    Returns:
+        models.Filter или None, если обе границы не заданы
+    """
+    if start is None and end is None:
+        return None
+    return models.Filter(must=[models.FieldCondition(
+        key=field,
+        range=models.DatetimeRange(gte=normalize_published_time(start) if start is not None else None,
+                                   lt=normalize_published_time(end) if end is not None else None)
+    )])
+
+
+@contextmanager
+def document_store_source(articles: Iterable[Dict], document_store: Optional[str]):
+    """
+    Статьи для построения точек и набор полей payload
+
+    Без document_store статьи отдаются как есть (полный payload). С ним
+    статьи за тот же проход пишутся в DocumentStore, а в payload
+    остаются только FILTER_FIELDS; хранилище дописывается при выходе.
+    """
+    if document_store is None:
+        yield articles, None
+        return
+    with DocumentStoreWriter(document_store) as writer:
+        yield writer.add_articles(articles), FILTER_FIELDS
+    logger.info("Полные статьи сохранены в хранилище %s (%s документов)", document_store, len(writer))
+
 
 class QdrantLocalSetup:
-    def __init__(self, host="localhost", port=6333):
-        self.client = QdrantClient(host=host, port=port)
-        print(f"Подключение к Qdrant: {host}:{port}")
+    def __init__(self, host="localhost", port=6333, prefer_grpc=False, grpc_port=6334, path=None,
+                 versions: CollectionVersions = None):
+        """
+        Args:
+            prefer_grpc: использовать gRPC (быстрее для массовой загрузки)
+            path: путь к локальной in-process базе вместо сервера
+            versions: счетчики версий коллекций для кэша результатов (по умолчанию общий COLLECTION_VERSIONS);
+                каждый upsert увеличивает версию коллекции
+        """
+        self.versions = versions or COLLECTION_VERSIONS
+        if path:
+            self.client = QdrantClient(path=path)
+            logger.info("Локальная база Qdrant: %s", path)
+            return
+
+        self.client = QdrantClient(host=host, port=port, grpc_port=grpc_port, prefer_grpc=prefer_grpc)
+        logger.info("Подключение к Qdrant: %s:%s", host, grpc_port if prefer_grpc else port)
 
     def create_collection(self,
                           collection_name: str = "ai_articles",
                           vector_size: int = 1024,
-                          distance: str = "Cosine"):
+                          distance: str = "Cosine",
+                          sparse_vector_name: Optional[str] = None,
+                          dense_vector_name: Optional[str] = None,
+                          sparse_idf: bool = False):
         """
         Создание коллекции
+
+        Если задан sparse_vector_name, создается коллекция с нативными
+        sparse векторами (индексы + значения), vector_size при этом не нужен.
+        Если задан и dense_vector_name - гибридная коллекция с именованными
+        dense и sparse векторами (для запросов с prefetch).
+        При sparse_idf=True Qdrant сам применяет BM25 IDF во время запроса
+        (Modifier.IDF): в точках хранится только tf_component, и при росте
+        корпуса IDF у старых точек остается точным. Нормировка длины в
+        tf_component зависит от средней длины документа на момент записи,
+        поэтому по мере роста корпуса веса старых точек устаревают; их
+        стоит периодически переписывать (rewrite_sparse_weights).
         """
         collections = self.client.get_collections()
         existing_names = [c.name for c in collections.collections]
 
         if collection_name in existing_names:
-            print(f"Коллекция '{collection_name}' уже существует")
+            logger.info("Коллекция '%s' уже существует", collection_name)
             return False
 
+        if sparse_vector_name:
+            vectors_config = {}
+            if dense_vector_name:
+                vectors_config[dense_vector_name] = models.VectorParams(
+                    size=vector_size,
+                    distance=self._get_distance(distance)
+                )
+
+            self.client.create_collection(
+                collection_name=collection_name,
+                vectors_config=vectors_config,
+                sparse_vectors_config={
+                    sparse_vector_name: models.SparseVectorParams(
+                        index=models.SparseIndexParams(on_disk=False),
+                        modifier=models.Modifier.IDF if sparse_idf else None
+                    )
+                },
+                optimizers_config=models.OptimizersConfigDiff(
+                    indexing_threshold=20000,
+                    memmap_threshold=20000
+                )
+            )
+            if dense_vector_name:
+                logger.info("Коллекция '%s' создана (dense вектор '%s', sparse вектор '%s')",
+                            collection_name, dense_vector_name, sparse_vector_name)
+            else:
+                logger.info("Коллекция '%s' создана (sparse вектор '%s')", collection_name, sparse_vector_name)
+            return True
+
         self.client.create_collection(
             collection_name=collection_name,
             vectors_config=models.VectorParams(
@@ -38,7 +241,7 @@ class QdrantLocalSetup:
                 memmap_threshold=20000
             )
         )
-        print(f"Коллекция '{collection_name}' создана (vector_size={vector_size}, distance={distance})")
+        logger.info("Коллекция '%s' создана (vector_size=%s, distance=%s)", collection_name, vector_size, distance)
         return True
 
     def _get_distance(self, distance: str) -> models.Distance:
@@ -50,147 +253,224 @@ class QdrantLocalSetup:
         }
         return distance_map.get(distance, models.Distance.COSINE)
 
+    def _upsert(self, collection_name: str, points: List[models.PointStruct]):
+        """Синхронный upsert батча с замером этапа upsert (задержка, точки, байты)"""
+        nbytes = sum(estimate_point_bytes(point) for point in points)
+        start = time.perf_counter()
+        try:
+            self.client.upsert(collection_name=collection_name, points=points, wait=True)
+        except Exception as e:
+            METRICS.record('upsert', time.perf_counter() - start,
+                           status=getattr(e, 'status_code', None) or 'error')
+            METRICS.inc('stage_errors_total', stage='upsert')
+            raise
+        METRICS.record('upsert', time.perf_counter() - start, nbytes=nbytes, items=len(points))
+        self.versions.bump(collection_name)
+
     def upload_sparse_embeddings(self,
                                  collection_name: str,
                                  sparse_matrix,
-                                 articles: List[Dict],
-                                 batch_size: int = 100):
+                                 articles: Iterable[Dict],
+                                 batch_size: int = 100,
+                                 vector_name: str = SPARSE_VECTOR_NAME,
+                                 document_store: Optional[str] = None):
         """
         Загрузка SPARSE эмбеддингов в Qdrant
 
+        Строки CSR матрицы отправляются как нативные sparse векторы
+        (indices, values) без преобразования в dense, поэтому объем данных
+        зависит от числа ненулевых элементов, а не от размера словаря.
+
         Args:
             collection_name: имя коллекции
             sparse_matrix: scipy sparse матрица (n_articles, vector_size)
-            articles: список статей с метаданными
+            articles: статьи с метаданными (список или ленивый итератор, см. iter_articles)
             batch_size: размер батча для загрузки
+            vector_name: имя sparse вектора в коллекции
+            document_store: директория DocumentStore для полных статей (payload урезается до FILTER_FIELDS)
         """
-        # Конвертируем sparse в dense батчами для экономии памяти
-        print(f"Начало загрузки {len(articles)} статей в коллекцию '{collection_name}'...")
+        total = sparse_matrix.shape[0]
+
+        logger.info("Начало загрузки %s статей в коллекцию '%s'...", total, collection_name)
 
         points = []
+        uploaded = 0
 
-        for i in tqdm(range(len(articles)), desc="Загрузка статей"):
-            # Получаем i-ю строку как dense вектор
-            if sparse.issparse(sparse_matrix):
-                # Для sparse матрицы конвертируем строку в dense
-                embedding = sparse_matrix[i].toarray().flatten().tolist()
-            else:
-                # Уже dense
-                embedding = sparse_matrix[i].tolist()
-
-            article = articles[i]
-            payload = {
-                'id': article.get('id', str(i)),
-                'title': article.get('title', ''),
-                'text': article.get('text', '')[:2000],  # Ограничиваем длину
-                'published_time': article.get('published_time', ''),
-                'source': 'TechCrunch',
-                'url': article.get('url', ''),
-                'category': article.get('category', ''),
-                'author': article.get('author', '')
-            }
-
-            payload = {k: v for k, v in payload.items() if v}
-
-            point = models.PointStruct(
-                id=payload['id'],
-                vector=embedding,
-                payload=payload
-            )
-            points.append(point)
+        with document_store_source(articles, document_store) as (articles, payload_fields):
+            # Время построения каждой точки - этап build_point
+            for point in tqdm(METRICS.timed_iter(iter_sparse_points(sparse_matrix, articles, vector_name,
+                                                                    payload_fields), 'build_point'),
+                              total=total, desc="Загрузка статей"):
+                points.append(point)
+                uploaded += 1
 
-            if len(points) >= batch_size:
-                self.client.upsert(
-                    collection_name=collection_name,
-                    points=points,
-                    wait=True
-                )
-                points = []
+                if len(points) >= batch_size:
+                    self._upsert(collection_name, points)
+                    points = []
 
-        if points:
-            self.client.upsert(
-                collection_name=collection_name,
-                points=points,
-                wait=True
-            )
+            if points:
+                self._upsert(collection_name, points)
 
-        print(f"Успешно загружено {len(articles)} статей")
         collection_info = self.client.get_collection(collection_name)
-        print(f"   Векторов в коллекции: {collection_info.points_count}")
+        logger.info("Успешно загружено %s статей, векторов в коллекции: %s", uploaded, collection_info.points_count)
+
+    def rewrite_sparse_weights(self, collection_name: str, index: SegmentedBM25Index,
+                               batch_size: int = 500, vector_name: str = SPARSE_VECTOR_NAME) -> int:
+        """
+        Переписывает sparse векторы коллекции с sparse_idf=True по текущей статистике индекса
+
+        В таких точках хранится tf_component с нормировкой длины по средней
+        длине документа на момент записи. После роста корпуса веса всех живых
+        документов пересчитываются через SegmentedBM25Index.tf_matrix с одной
+        текущей средней длиной и заменяются через update_vectors: payload и
+        остальные векторы точек не меняются. ID точек - ключи индекса (id статей),
+        точки должны быть уже загружены (например, upload_sparse_embeddings
+        с матрицей index.tf_matrix(segment)).
+
+        Args:
+            collection_name: имя коллекции
+            index: сегментированный BM25 индекс, ключи которого - id статей
+            batch_size: точек в одном запросе update_vectors
+            vector_name: имя sparse вектора в коллекции
+
+        Returns:
+            число переписанных точек
+        """
+        # Снимок сегментов и средней длины: фоновое слияние не меняет уже взятые сегменты
+        segments = list(index.segments)
+        avg_doc_length = index.avg_doc_length
+        logger.info("Пересчет sparse весов %s документов в '%s' (средняя длина %.1f)...",
+                    len(index), collection_name, avg_doc_length)
+
+        def flush(batch: List[models.PointVectors]):
+            start = time.perf_counter()
+            self.client.update_vectors(collection_name=collection_name, points=batch, wait=True)
+            METRICS.record('update_vectors', time.perf_counter() - start, items=len(batch))
+            self.versions.bump(collection_name)
+
+        batch = []
+        rewritten = 0
+        for segment in segments:
+            weights = index.tf_matrix(segment, avg_doc_length)
+            for row in np.flatnonzero(~segment.deleted):
+                start, end = weights.indptr[row], weights.indptr[row + 1]
+                batch.append(models.PointVectors(
+                    id=segment.keys[row],
+                    vector={vector_name: models.SparseVector(indices=weights.indices[start:end].tolist(),
+                                                             values=weights.data[start:end].tolist())}
+                ))
+                if len(batch) >= batch_size:
+                    flush(batch)
+                    rewritten += len(batch)
+                    batch = []
+        if batch:
+            flush(batch)
+            rewritten += len(batch)
+
+        logger.info("Переписано sparse векторов: %s", rewritten)
+        return rewritten
 
     def upload_dense_embeddings(self,
                                 collection_name: str,
                                 embeddings: np.ndarray,
                                 articles: List[Dict],
-                                batch_size: int = 100):
+                                batch_size: int = 100,
+                                document_store: Optional[str] = None):
         """
         Загрузка DENSE эмбеддингов в Qdrant
 
         Args:
             collection_name: имя коллекции
             embeddings: numpy массив (n_articles, vector_size)
-            articles: список статей с метаданными
+            articles: статьи с метаданными (список или ленивый итератор, см. iter_articles)
             batch_size: размер батча для загрузки
+            document_store: директория DocumentStore для полных статей (payload урезается до FILTER_FIELDS)
         """
-        if len(embeddings) != len(articles):
+        if hasattr(articles, '__len__') and len(embeddings) != len(articles):
             raise ValueError(f"Количество эмбеддингов ({len(embeddings)}) не равно количеству статей ({len(articles)})")
 
-        print(f"Начало загрузки {len(articles)} статей в коллекцию '{collection_name}'...")
+        logger.info("Начало загрузки %s статей в коллекцию '%s'...", len(embeddings), collection_name)
 
         points = []
+        uploaded = 0
 
-        for i, (embedding, article) in enumerate(tqdm(zip(embeddings, articles),
-                                                      total=len(articles),
-                                                      desc="Загрузка статей")):
-            payload = {
-                'id': article.get('id', str(i)),
-                'title': article.get('title', ''),
-                'text': article.get('text', '')[:2000],
-                'published_time': article.get('published_time', ''),
-                'source': 'TechCrunch',
-                'url': article.get('url', ''),
-                'category': article.get('category', ''),
-                'author': article.get('author', '')
-            }
-
-            payload = {k: v for k, v in payload.items() if v}
-
-            point = models.PointStruct(
-                id=payload['id'],
-                vector=embedding.tolist(),
-                payload=payload
-            )
-            points.append(point)
+        with document_store_source(articles, document_store) as (articles, payload_fields):
+            # Время построения каждой точки - этап build_point
+            for point in tqdm(METRICS.timed_iter(iter_dense_points(embeddings, articles, payload_fields),
+                                                 'build_point'),
+                              total=len(embeddings), desc="Загрузка статей"):
+                points.append(point)
+                uploaded += 1
 
-            if len(points) >= batch_size:
-                self.client.upsert(
-                    collection_name=collection_name,
-                    points=points,
-                    wait=True
-                )
-                points = []
+                if len(points) >= batch_size:
+                    self._upsert(collection_name, points)
+                    points = []
 
-        if points:
-            self.client.upsert(
-                collection_name=collection_name,
-                points=points,
-                wait=True
-            )
+            if points:
+                self._upsert(collection_name, points)
+
+        collection_info = self.client.get_collection(collection_name)
+        logger.info("Успешно загружено %s статей, векторов в коллекции: %s", uploaded, collection_info.points_count)
+
+    def bulk_upload_sparse_embeddings(self,
+                                      collection_name: str,
+                                      sparse_matrix,
+                                      articles: Iterable[Dict],
+                                      vector_name: str = SPARSE_VECTOR_NAME,
+                                      config: BulkLoadConfig = None,
+                                      document_store: Optional[str] = None) -> Dict:
+        """Массовая загрузка SPARSE эмбеддингов через конвейер QdrantBulkLoader"""
+        with document_store_source(articles, document_store) as (articles, payload_fields):
+            points = iter_sparse_points(sparse_matrix, articles, vector_name, payload_fields)
+            return self._bulk_upload(collection_name, points, config)
+
+    def bulk_upload_dense_embeddings(self,
+                                     collection_name: str,
+                                     embeddings: np.ndarray,
+                                     articles: Iterable[Dict],
+                                     config: BulkLoadConfig = None,
+                                     document_store: Optional[str] = None) -> Dict:
+        """Массовая загрузка DENSE эмбеддингов через конвейер QdrantBulkLoader"""
+        with document_store_source(articles, document_store) as (articles, payload_fields):
+            points = iter_dense_points(embeddings, articles, payload_fields)
+            return self._bulk_upload(collection_name, points, config)
+
+    def bulk_upload_hybrid_embeddings(self,
+                                      collection_name: str,
+                                      embeddings: np.ndarray,
+                                      sparse_matrix,
+                                      articles: Iterable[Dict],
+                                      config: BulkLoadConfig = None,
+                                      document_store: Optional[str] = None) -> Dict:
+        """Массовая загрузка точек с dense и sparse векторами в гибридную коллекцию"""
+        with document_store_source(articles, document_store) as (articles, payload_fields):
+            points = iter_hybrid_points(embeddings, sparse_matrix, articles, payload_fields=payload_fields)
+            return self._bulk_upload(collection_name, points, config)
+
+    def _bulk_upload(self, collection_name: str, points, config: BulkLoadConfig = None) -> Dict:
+        loader = QdrantBulkLoader(self.client, config, on_upsert=self.versions.bump)
+        logger.info("Массовая загрузка в коллекцию '%s' (%s потоков)...", collection_name, loader.config.workers)
+
+        stats = loader.load(collection_name, loader.metrics.timed_iter(points, 'build_point'))
 
-        print(f"Успешно загружено {len(articles)} статей")
         collection_info = self.client.get_collection(collection_name)
-        print(f"   Векторов в коллекции: {collection_info.points_count}")
+        logger.info("Успешно загружено %s статей за %.1f с (%.0f точек/сек, батчей: %s, повторов: %s), "
+                    "векторов в коллекции: %s", stats['points'], stats['seconds'], stats['points_per_sec'],
+                    stats['batches'], stats['retries'], collection_info.points_count)
+        return stats
 
     def create_indexes(self, collection_name: str):
         try:
+            # Диапазонный datetime индекс; principal - хранение точек упорядочено по дате,
+            # потому что большинство фильтрованных запросов ограничены по времени
             self.client.create_payload_index(
                 collection_name=collection_name,
                 field_name="published_time",
-                field_schema=models.PayloadSchemaType.KEYWORD
+                field_schema=models.DatetimeIndexParams(type=models.DatetimeIndexType.DATETIME, is_principal=True)
             )
-            print("Индекс по published_time создан")
+            logger.info("Индекс по published_time создан")
         except Exception as e:
-            print(f"Ошибка создания индекса published_time: {e}")
+            logger.warning("Ошибка создания индекса published_time: %s", e)
 
         try:
             self.client.create_payload_index(
@@ -198,9 +478,9 @@ class QdrantLocalSetup:
                 field_name="category",
                 field_schema=models.PayloadSchemaType.KEYWORD
             )
-            print("Индекс по category создан")
+            logger.info("Индекс по category создан")
         except Exception as e:
-            print(f"Ошибка создания индекса category: {e}")
+            logger.warning("Ошибка создания индекса category: %s", e)
 
         try:
             self.client.create_payload_index(
@@ -208,50 +488,134 @@ class QdrantLocalSetup:
                 field_name="author",
                 field_schema=models.PayloadSchemaType.KEYWORD
             )
-            print("Индекс по author создан")
+            logger.info("Индекс по author создан")
         except Exception as e:
-            print(f"Ошибка создания индекса author: {e}")
+            logger.warning("Ошибка создания индекса author: %s", e)
 
-    def test_search(self, collection_name: str, query_vector: List[float], k: int = 5):
-        print(f"\nТестовый поиск (k={k}):")
-        search_result = self.client.search(
-            collection_name=collection_name,
-            query_vector=query_vector,
-            limit=k
-        )
+    def test_search(self, collection_name: str, query_vector, k: int = 5,
+                    documents: Optional[DocumentStore] = None, query: Optional[str] = None,
+                    cache: Optional[QueryResultCache] = None, using: Optional[str] = None,
+                    start=None, end=None):
+        """
+        Args:
+            query_vector: dense вектор (список чисел) или sparse вектор
+                (models.SparseVector или пара (indices, values), например из bm25_query_vector)
+            query: текст запроса, по которому получен query_vector (ключ кэша)
+            cache: кэш результатов; используется вместе с query и сбрасывается upsert в коллекцию
+            using: имя вектора в коллекции; по умолчанию SPARSE_VECTOR_NAME для sparse
+                запроса и безымянный вектор для dense (DENSE_VECTOR_NAME в гибридной коллекции)
+            start, end: диапазон дат публикации start <= дата < end (None - без границы),
+                передается в Qdrant как date_range_filter
+        """
+        logger.info("Тестовый поиск (k=%s):", k)
 
-        for i, hit in enumerate(search_result, 1):
-            print(f"{i}. [{hit.score:.3f}] {hit.payload.get('title', 'Без названия')}")
-            print(f"   ID: {hit.id}, Дата: {hit.payload.get('published_time', 'неизвестна')}")
+        if isinstance(query_vector, tuple):
+            indices, values = query_vector
+            query_vector = models.SparseVector(indices=list(indices), values=list(values))
+        if using is None and isinstance(query_vector, models.SparseVector):
+            using = SPARSE_VECTOR_NAME
+        query_filter = date_range_filter(start, end)
+
+        def search():
+            return self.client.query_points(
+                collection_name=collection_name,
+                query=query_vector,
+                using=using,
+                query_filter=query_filter,
+                limit=k
+            ).points
+
+        if cache is not None and query is not None:
+            key = cache.key(query, self.versions.get(collection_name), collection=collection_name, k=k, using=using,
+                            start=normalize_published_time(start) if start is not None else None,
+                            end=normalize_published_time(end) if end is not None else None)
+            search_result = cache.get_or_compute(key, search)
+        else:
+            search_result = search()
+
+        # При урезанном payload заголовки берутся из хранилища документов одним батчем
+        if documents is not None:
+            hydrated = documents.get_many([hit.payload.get('id', str(hit.id)) for hit in search_result],
+                                          fields=['title'])
+        else:
+            hydrated = [hit.payload for hit in search_result]
+
+        for i, (hit, document) in enumerate(zip(search_result, hydrated), 1):
+            logger.info("%s. [%.3f] %s (ID: %s, дата: %s)", i, hit.score, (document or {}).get('title', 'Без названия'),
+                        hit.id, hit.payload.get('published_time', 'неизвестна'))
 
         return search_result
 
 
 def main():
-    setup = QdrantLocalSetup()
+    parser = argparse.ArgumentParser(description="Загрузка эмбеддингов в Qdrant")
+    parser.add_argument('--bulk', action='store_true',
+                        help='конвейерная загрузка в несколько потоков с wait=False')
+    parser.add_argument('--workers', type=int, default=4, help='потоков загрузки для --bulk')
+    parser.add_argument('--grpc', action='store_true', help='подключаться по gRPC')
+    parser.add_argument('--hybrid', action='store_true',
+                        help='коллекция с dense и sparse векторами для гибридного поиска с prefetch')
+    parser.add_argument('--document-store', default=None,
+                        help='директория хранилища полных статей; в payload Qdrant остаются только поля фильтров')
+    add_instrumentation_args(parser)
+    args = parser.parse_args()
+    reporter = start_instrumentation(args)
+    try:
+        upload(args)
+    finally:
+        reporter.stop()
+        log_summary(METRICS, logger)
+
+
+def upload(args):
+    """Создание коллекции и загрузка эмбеддингов по аргументам main"""
+
+    setup = QdrantLocalSetup(prefer_grpc=args.grpc)
+
+    if args.hybrid:
+        collection_name = "ai_trends_hybrid"
+        embeddings = np.load('dense_embeddings_qwen.npy', mmap_mode='r')
+        setup.create_collection(
+            collection_name=collection_name,
+            vector_size=embeddings.shape[1],
+            sparse_vector_name=SPARSE_VECTOR_NAME,
+            dense_vector_name=DENSE_VECTOR_NAME
+        )
+        setup.bulk_upload_hybrid_embeddings(
+            collection_name, embeddings, sparse.load_npz('bm25_matrix.npz'),
+            skip_flagged(iter_articles('techcrunch_ai_5488_articles_20260112_1535.json')),
+            config=BulkLoadConfig(workers=args.workers),
+            document_store=args.document_store
+        )
+        logger.info("Готово! Гибридная коллекция '%s'", collection_name)
+        return
+
     collection_name = "ai_trends_bm25_4"
-    vector_size = 60846
 
     setup.create_collection(
         collection_name=collection_name,
-        vector_size=vector_size,
-        distance="Cosine"
+        sparse_vector_name=SPARSE_VECTOR_NAME
     )
 
     try:
-        with open('techcrunch_ai_5488_articles_20260112_1535.json', 'r', encoding='utf-8') as f:
-            articles = json.load(f)
+        # Статьи читаются лениво, без загрузки всего файла в память. Почти-дубликаты
+        # (--dedup-mode flag) пропускаются - так же, как при построении эмбеддингов
+        articles = skip_flagged(iter_articles('techcrunch_ai_5488_articles_20260112_1535.json'))
         #embeddings = np.load('dense_embeddings_qwen.npy')
         embeddings = sparse.load_npz('bm25_matrix.npz')
-        setup.upload_sparse_embeddings(collection_name, embeddings, articles)
-
-        print(f"Готово! Qdrant запущен с коллекцией '{collection_name}'")
-        print(f"REST API: http://localhost:6333")
-        print(f"gRPC API: http://localhost:6334")
+        if args.bulk:
+            setup.bulk_upload_sparse_embeddings(collection_name, embeddings, articles,
+                                                config=BulkLoadConfig(workers=args.workers),
+                                                document_store=args.document_store)
+        else:
+            setup.upload_sparse_embeddings(collection_name, embeddings, articles,
+                                           document_store=args.document_store)
+
+        logger.info("Готово! Qdrant запущен с коллекцией '%s' (REST API: http://localhost:6333, "
+                    "gRPC API: http://localhost:6334)", collection_name)
     except Exception as e:
-        print(f"Ошибка загрузки данных: {e}")
-        print("Создана пустая коллекция. Загрузите данные позже.")
+        logger.error("Ошибка загрузки данных: %s. Создана пустая коллекция, загрузите данные позже.", e)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
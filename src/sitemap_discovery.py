@@ -0,0 +1,521 @@
+import argparse
+import asyncio
+import gzip
+import io
+import logging
+import random
+import re
+import tempfile
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from article_store import normalize_published_time, parse_published_time
+from instrumentation import METRICS, Metrics, setup_logging
+from new_parser import BASE_URL, CATEGORY_PATH
+
+logger = logging.getLogger(__name__)
+
+# Окно дат по умолчанию - та же отсечка, что six_months_ago в parse_techcrunch_pagination
+DEFAULT_WINDOW_DAYS = 180
+
+# Категория AI в фидах TechCrunch называется и так, и так (slug и отображаемое имя)
+AI_CATEGORIES = ('artificial-intelligence', 'ai')
+
+# RSS фид категории AI (WordPress, страницы ?paged=N): в отличие от sitemap, записи несут категории
+AI_FEED_PATH = CATEGORY_PATH + 'feed/'
+
+DISCOVERY_MODES = ('listing', 'sitemap', 'feed')
+
+# Элементы, каждый из которых - одна запись: sitemap index, sitemap, RSS, Atom
+ENTRY_TAGS = {'sitemap', 'url', 'item', 'entry'}
+
+URL_DATE_RE = re.compile(r'/(\d{4})/(\d{2})/(\d{2})/')
+
+
+@dataclass
+class FeedEntry:
+    """Запись sitemap или фида"""
+    url: str
+    lastmod: Optional[datetime] = None
+    published: Optional[datetime] = None
+    title: str = ''
+    categories: Tuple[str, ...] = ()
+    is_sitemap: bool = False  # ссылка на вложенный sitemap из sitemap index
+
+
+def _local_name(tag: str) -> str:
+    """Имя тега без пространства имен: {http://...}loc -> loc"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def parse_feed_date(value: Optional[str]) -> Optional[datetime]:
+    """Дата из sitemap (W3C datetime), Atom (RFC 3339) или RSS (RFC 822) в UTC"""
+    if not value:
+        return None
+    parsed = parse_published_time(value)
+    if parsed is not None:
+        return parsed
+    try:
+        return parse_published_time(parsedate_to_datetime(value.strip()))
+    except (TypeError, ValueError):
+        return None
+
+
+def url_published_date(url: str) -> Optional[datetime]:
+    """Дата публикации из URL статьи вида /2026/01/05/slug/"""
+    match = URL_DATE_RE.search(url)
+    if not match:
+        return None
+    try:
+        return datetime(*map(int, match.groups()), tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def window_start(days: int = DEFAULT_WINDOW_DAYS) -> datetime:
+    """Полночь UTC дня, отстоящего от сегодняшнего на days дней"""
+    start = datetime.now(timezone.utc) - timedelta(days=days)
+    return start.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def normalize_category(name: str) -> str:
+    return '-'.join(name.lower().split())
+
+
+def parse_feed(data: bytes) -> Iterator[FeedEntry]:
+    """
+    Потоковый разбор sitemap index, sitemap (в том числе .xml.gz), RSS и Atom
+
+    Документ не строится целиком: после каждой записи разобранные
+    элементы удаляются, поэтому память не зависит от размера файла.
+    """
+    stream = io.BytesIO(data)
+    if data[:2] == b'\x1f\x8b':
+        stream = gzip.GzipFile(fileobj=stream)
+
+    path = []
+    root = None
+    fields = None
+    for event, element in ET.iterparse(stream, events=('start', 'end')):
+        name = _local_name(element.tag)
+        if event == 'start':
+            if root is None:
+                root = element
+            path.append(name)
+            if name in ENTRY_TAGS and fields is None:
+                fields = {'entry': name, 'depth': len(path) - 1, 'categories': []}
+            continue
+
+        path.pop()
+        if fields is None:
+            continue
+
+        if name == fields['entry'] and len(path) == fields['depth']:
+            url = fields.get('url')
+            if url:
+                yield FeedEntry(
+                    url=url,
+                    lastmod=parse_feed_date(fields.get('lastmod')),
+                    published=parse_feed_date(fields.get('published')),
+                    title=fields.get('title', ''),
+                    categories=tuple(normalize_category(c) for c in fields['categories'] if c.strip()),
+                    is_sitemap=name == 'sitemap',
+                )
+            fields = None
+            root.clear()
+            continue
+
+        text = (element.text or '').strip()
+        parent = path[-1] if path else None
+        if name == 'loc' and parent == fields['entry']:
+            fields['url'] = text
+        elif name == 'link' and parent == fields['entry']:
+            # RSS: <link>url</link>, Atom: <link rel="alternate" href="url"/>
+            href = element.get('href')
+            if href is None:
+                fields['url'] = text
+            elif element.get('rel', 'alternate') == 'alternate':
+                fields['url'] = href
+        elif name in ('lastmod', 'updated'):
+            fields['lastmod'] = text
+        elif name in ('pubDate', 'published', 'publication_date'):
+            fields['published'] = text
+        elif name == 'title' and text:
+            fields['title'] = text
+        elif name == 'category':
+            fields['categories'].append(element.get('term') or text)
+        elif name == 'keywords':
+            fields['categories'].extend(text.split(','))
+
+
+def feed_page_url(url: str, page: int) -> str:
+    """Адрес страницы page фида WordPress: ?paged=N (первая страница - без параметра)"""
+    parts = urlsplit(url)
+    query = [(name, value) for name, value in parse_qsl(parts.query) if name != 'paged']
+    if page > 1:
+        query.append(('paged', str(page)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def sitemaps_from_robots(text: str) -> List[str]:
+    """Адреса sitemap из строк Sitemap: в robots.txt"""
+    return [line.split(':', 1)[1].strip() for line in text.splitlines()
+            if line.lower().startswith('sitemap:') and line.split(':', 1)[1].strip()]
+
+
+class SitemapDiscovery:
+    """
+    Поиск статей по sitemap и RSS/Atom фидам вместо страниц листинга
+
+    Sitemap index обходится от свежих вложенных sitemap к старым; вложенный
+    sitemap, не менявшийся с начала окна дат (lastmod < since), не
+    загружается вовсе. Из записей дальше идут только статьи с датой
+    публикации (из фида или URL, иначе lastmod) в окне [since, until) и
+    нужной категорией.
+
+    Обычный sitemap (в том числе у TechCrunch) категорий не содержит, и при
+    заданных categories такие записи по умолчанию отбрасываются - фильтр
+    категорий не отключается молча. Для sitemap категорию задает url_pattern
+    (тогда keep_uncategorized=True), либо статьи берутся из фида категории
+    (category_feed): его записи несут категории, а страницы ?paged=N
+    читаются, пока самая старая запись страницы еще в окне дат.
+    """
+
+    def __init__(self,
+                 start_urls: Sequence[str] = None,
+                 since: datetime = None,
+                 until: datetime = None,
+                 categories: Sequence[str] = AI_CATEGORIES,
+                 keep_uncategorized: bool = False,
+                 url_pattern: str = None,
+                 max_sitemaps: int = 1000,
+                 max_feed_pages: int = 1,
+                 metrics: Metrics = None):
+        """
+        Args:
+            start_urls: sitemap или фиды (абсолютные или пути от адреса сайта);
+                по умолчанию - Sitemap: из robots.txt, иначе /sitemap.xml
+            since, until: окно дат публикации (None - без границы)
+            categories: допустимые категории (None - любые)
+            keep_uncategorized: пропускать ли записи, у которых категорий нет
+            url_pattern: регулярное выражение, которому должен соответствовать URL статьи
+            max_sitemaps: предел числа загружаемых sitemap и страниц фидов (защита от циклов)
+            max_feed_pages: сколько страниц ?paged=N читать у документа без вложенных sitemap
+            metrics: реестр метрик (по умолчанию общий instrumentation.METRICS)
+        """
+        self.start_urls = list(start_urls) if start_urls else None
+        self.since = parse_published_time(since) if since is not None else None
+        self.until = parse_published_time(until) if until is not None else None
+        self.categories = {normalize_category(c) for c in categories} if categories else None
+        self.keep_uncategorized = keep_uncategorized
+        self.url_pattern = re.compile(url_pattern) if url_pattern else None
+        self.max_sitemaps = max_sitemaps
+        self.max_feed_pages = max_feed_pages
+        self.metrics = metrics or METRICS
+
+    @classmethod
+    def recent(cls, days: int = DEFAULT_WINDOW_DAYS, **kwargs) -> 'SitemapDiscovery':
+        """
+        Окно последних days дней
+
+        Начало окна округляется вниз до полуночи UTC: дата статьи из URL
+        известна с точностью до дня, и статьи первого дня окна иначе
+        отбрасывались бы в зависимости от времени запуска.
+        """
+        return cls(since=window_start(days), **kwargs)
+
+    @classmethod
+    def category_feed(cls, days: int = DEFAULT_WINDOW_DAYS, feed_path: str = AI_FEED_PATH,
+                      max_feed_pages: int = 500, **kwargs) -> 'SitemapDiscovery':
+        """Статьи категории за последние days дней из ее постраничного RSS фида"""
+        return cls.recent(days, start_urls=[feed_path], max_feed_pages=max_feed_pages, **kwargs)
+
+    def _in_window(self, moment: Optional[datetime]) -> bool:
+        if moment is None:
+            return True
+        return (self.since is None or moment >= self.since) and (self.until is None or moment < self.until)
+
+    def accept(self, entry: FeedEntry) -> Optional[str]:
+        """Причина отказа для статьи или None, если статья подходит"""
+        published = entry.published or url_published_date(entry.url)
+        if not self._in_window(published or entry.lastmod):
+            return 'out_of_window'
+        if self.categories is not None:
+            if entry.categories:
+                if not self.categories.intersection(entry.categories):
+                    return 'other_category'
+            elif not self.keep_uncategorized:
+                return 'uncategorized'
+        if self.url_pattern is not None and not self.url_pattern.search(entry.url):
+            return 'url_pattern'
+        return None
+
+    def to_article(self, entry: FeedEntry) -> Dict:
+        """Статья без текста в том же виде, что дает parse_listing_page"""
+        return {
+            "id": str(uuid.uuid5(uuid.NAMESPACE_URL, entry.url)),
+            "title": entry.title,
+            "url": entry.url,
+            "published_time": normalize_published_time(entry.published or url_published_date(entry.url)),
+        }
+
+    async def _start_urls(self, fetch, base_url: str) -> List[str]:
+        if self.start_urls:
+            return [base_url.rstrip('/') + url if url.startswith('/') else url for url in self.start_urls]
+        status, body = await fetch(f"{base_url}/robots.txt")
+        if status == 200:
+            urls = sitemaps_from_robots(body.decode('utf-8', errors='replace'))
+            if urls:
+                return urls
+        return [f"{base_url}/sitemap.xml"]
+
+    async def iter_articles(self, fetch: Callable[[str], Awaitable[Tuple[Optional[int], Optional[bytes]]]],
+                            base_url: str = BASE_URL) -> AsyncIterator[Dict]:
+        """
+        Статьи без текста из sitemap и фидов, подходящие по дате и категории
+
+        Args:
+            fetch: корутина url -> (HTTP статус, тело); у краулера - с ограничением частоты
+            base_url: адрес сайта (robots.txt и /sitemap.xml)
+        """
+        pending = [(url, 1) for url in reversed(await self._start_urls(fetch, base_url))]
+        visited = set()
+        seen_urls = set()
+        rejected = {}
+
+        while pending and len(visited) < self.max_sitemaps:
+            sitemap_url, page = pending.pop()
+            if sitemap_url in visited:
+                continue
+            visited.add(sitemap_url)
+
+            status, body = await fetch(sitemap_url)
+            if status != 200:
+                logger.warning("Sitemap %s недоступен: %s", sitemap_url, status)
+                continue
+
+            children = []
+            oldest = None
+            with self.metrics.timer('parse', kind='sitemap'):
+                entries = list(parse_feed(body))
+            for entry in entries:
+                if entry.is_sitemap:
+                    if entry.lastmod is not None and self.since is not None and entry.lastmod < self.since:
+                        # Вложенный sitemap не менялся с начала окна - новых статей в нем нет
+                        self.metrics.inc('sitemaps_total', result='pruned')
+                        continue
+                    children.append(entry)
+                    continue
+
+                moment = entry.published or url_published_date(entry.url) or entry.lastmod
+                if moment is not None:
+                    oldest = moment if oldest is None else min(oldest, moment)
+                reason = self.accept(entry)
+                if reason is None and entry.url in seen_urls:
+                    reason = 'duplicate'
+                self.metrics.inc('discovered_urls_total', result=reason or 'ok')
+                if reason is None:
+                    seen_urls.add(entry.url)
+                    yield self.to_article(entry)
+                else:
+                    rejected[reason] = rejected.get(reason, 0) + 1
+
+            self.metrics.inc('sitemaps_total', result='fetched')
+            # Сначала самые свежие вложенные sitemap (без lastmod - в конце)
+            oldest_possible = datetime.min.replace(tzinfo=timezone.utc)
+            children.sort(key=lambda child: child.lastmod or oldest_possible)
+            pending.extend((child.url, 1) for child in children)
+            logger.info("Sitemap %s: записей %s, вложенных sitemap к загрузке %s",
+                        sitemap_url, len(entries), len(children))
+
+            # Следующая страница фида, пока страница не вышла за начало окна
+            if (not children and oldest is not None and page < self.max_feed_pages
+                    and (self.since is None or oldest >= self.since)):
+                pending.append((feed_page_url(sitemap_url, page + 1), page + 1))
+
+        if rejected.get('uncategorized') and not seen_urls:
+            logger.warning("Все %s записей без категорий отброшены: у sitemap нет категорий - задайте "
+                           "url_pattern или берите статьи из фида категории", rejected['uncategorized'])
+
+
+def add_discovery_args(parser: argparse.ArgumentParser):
+    """Аргументы CLI источника URL статей (new_parser, ingest_pipeline)"""
+    parser.add_argument('--discovery', choices=DISCOVERY_MODES, default='listing',
+                        help='откуда брать URL статей: страницы листинга, sitemap или RSS фид категории AI')
+    parser.add_argument('--since-days', type=int, default=DEFAULT_WINDOW_DAYS,
+                        help='окно дат публикации для --discovery sitemap/feed, дней')
+    parser.add_argument('--url-pattern', default=None,
+                        help='регулярное выражение URL статей для --discovery sitemap: в sitemap нет категорий, '
+                             'и без него берутся только записи с категорией AI')
+
+
+def make_discovery(args) -> Optional[SitemapDiscovery]:
+    """SitemapDiscovery по аргументам add_discovery_args; None - обход страниц листинга"""
+    if args.discovery == 'feed':
+        return SitemapDiscovery.category_feed(args.since_days)
+    if args.discovery == 'sitemap':
+        # URL-шаблон заменяет фильтр категорий, которых в sitemap нет
+        return SitemapDiscovery.recent(args.since_days, url_pattern=args.url_pattern,
+                                       keep_uncategorized=args.url_pattern is not None)
+    return None
+
+
+def write_fixture_site(path: str, articles: int = 1500, days: int = 720, per_page: int = 20,
+                       ai_share: float = 0.7, seed: int = 0) -> Dict:
+    """
+    Фикстуры сайта для бенчмарка: листинг категории AI, статьи всех категорий,
+    robots.txt, sitemap index, помесячные sitemap с lastmod и категориями
+    и постраничный RSS фид категории AI
+
+    Returns:
+        число статей и статей AI по окнам: {'articles', 'ai', 'ai_recent'}
+    """
+    rng = random.Random(seed)
+    root = Path(path)
+    now = datetime.now(timezone.utc)
+    step = timedelta(days=days) / articles
+
+    ai_urls, months = [], {}
+    ai_recent = 0
+    for i in range(articles):
+        published = now - step * (i + 1)  # от новых к старым, как в листинге
+        is_ai = rng.random() < ai_share
+        url_path = f"/{published:%Y/%m/%d}/article-{i}/"
+        words = ' '.join(f"w{rng.randint(1, 5000)}" for _ in range(150))
+        page = root / url_path.strip('/') / 'index.html'
+        page.parent.mkdir(parents=True, exist_ok=True)
+        page.write_text(f'<html><body><h1>Article {i}</h1><div class="article-content"><p>{words}</p>'
+                        f'</div></body></html>', encoding='utf-8')
+        months.setdefault(f"{published:%Y-%m}", []).append((url_path, published, is_ai))
+        if is_ai:
+            ai_urls.append((url_path, i))
+            ai_recent += published >= window_start(DEFAULT_WINDOW_DAYS)
+
+    for page_start in range(0, len(ai_urls), per_page):
+        page = page_start // per_page + 1
+        listing = root / CATEGORY_PATH.strip('/') / ('' if page == 1 else f"page/{page}") / 'index.html'
+        listing.parent.mkdir(parents=True, exist_ok=True)
+        items = ''.join(f'<li class="wp-block-post"><a class="loop-card__title-link" href="{url_path}">'
+                        f'Article {i}</a></li>' for url_path, i in ai_urls[page_start:page_start + per_page])
+        listing.write_text(f'<html><body><ul>{items}</ul></body></html>', encoding='utf-8')
+
+    index_entries = []
+    for month, entries in months.items():
+        urls = ''.join(
+            f'<url><loc>{{base}}{url_path}</loc><lastmod>{published:%Y-%m-%dT%H:%M:%SZ}</lastmod>'
+            f'<news:news><news:keywords>{"AI" if is_ai else "Startups"}</news:keywords></news:news></url>'
+            for url_path, published, is_ai in entries
+        )
+        (root / f"sitemap-{month}.xml").write_text(
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" '
+            f'xmlns:news="http://www.google.com/schemas/sitemap-news/0.9">{urls}</urlset>', encoding='utf-8')
+        lastmod = max(published for _, published, _ in entries)
+        index_entries.append(f'<sitemap><loc>{{base}}/sitemap-{month}.xml</loc>'
+                             f'<lastmod>{lastmod:%Y-%m-%dT%H:%M:%SZ}</lastmod></sitemap>')
+    (root / 'sitemap.xml').write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{"".join(index_entries)}</sitemapindex>',
+        encoding='utf-8')
+    (root / 'robots.txt').write_text("User-agent: *\nSitemap: {base}/sitemap.xml\n", encoding='utf-8')
+
+    published_at = {url_path: published for entries in months.values() for url_path, published, _ in entries}
+    feed_dir = root / AI_FEED_PATH.strip('/')
+    feed_dir.mkdir(parents=True, exist_ok=True)
+    for page_start in range(0, len(ai_urls), per_page):
+        page = page_start // per_page + 1
+        items = ''.join(
+            f'<item><title>Article {i}</title><link>{{base}}{url_path}</link>'
+            f'<pubDate>{published_at[url_path]:%a, %d %b %Y %H:%M:%S +0000}</pubDate>'
+            f'<category>Artificial Intelligence</category></item>'
+            for url_path, i in ai_urls[page_start:page_start + per_page]
+        )
+        name = 'index.html' if page == 1 else f"index.paged-{page}.html"
+        (feed_dir / name).write_text(f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+                                     f'{items}</channel></rss>', encoding='utf-8')
+
+    return {'articles': articles, 'ai': len(ai_urls), 'ai_recent': ai_recent}
+
+
+def bind_base_url(path: str, base_url: str):
+    """Подставляет адрес сервера фикстур в абсолютные ссылки sitemap, фида и robots.txt"""
+    feed_pages = list((Path(path) / AI_FEED_PATH.strip('/')).glob('index*.html'))
+    for file in list(Path(path).glob('*.xml')) + feed_pages + [Path(path) / 'robots.txt']:
+        file.write_text(file.read_text(encoding='utf-8').replace('{base}', base_url), encoding='utf-8')
+
+
+async def benchmark_discovery(fixtures_dir: str, target: int, max_pages: int, rps: float) -> List[Dict]:
+    """
+    Листинг против sitemap и фида на одном сервере фикстур: запросы по видам и время обхода
+
+    listing, sitemap и feed получают одну цель - target статей AI за
+    последние DEFAULT_WINDOW_DAYS дней; листинг не знает дат и идет по
+    страницам до цели. listing-all - текущий обход CLI (до max_pages
+    страниц без окна дат).
+    """
+    from async_parser import AsyncTechCrunchCrawler
+    from fixture_server import start_fixture_server
+
+    runner, base_url = await start_fixture_server(fixtures_dir)
+    bind_base_url(fixtures_dir, base_url)
+    results = []
+    try:
+        for mode, mode_target in (('listing', target), ('sitemap', target), ('feed', target),
+                                  ('listing-all', 10 ** 9)):
+            metrics = Metrics()
+            discovery = None
+            if mode == 'sitemap':
+                discovery = SitemapDiscovery.recent(metrics=metrics)
+            elif mode == 'feed':
+                discovery = SitemapDiscovery.category_feed(metrics=metrics)
+            crawler = AsyncTechCrunchCrawler(base_url=base_url, requests_per_second=rps, burst=4,
+                                             metrics=metrics, discovery=discovery)
+            start = time.perf_counter()
+            articles = await crawler.crawl(mode_target, max_pages)
+            elapsed = time.perf_counter() - start
+
+            requests = {}
+            for kind in ('listing', 'sitemap', 'article'):
+                histogram = metrics.histogram('stage_seconds', stage='fetch', kind=kind)
+                requests[kind] = histogram.count if histogram else 0
+            results.append({'mode': mode, 'articles': len(articles), 'requests': requests,
+                            'pruned_sitemaps': metrics.counter_value('sitemaps_total', result='pruned'),
+                            'seconds': elapsed})
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск статей по sitemap: бенчмарк против обхода листинга")
+    parser.add_argument('--fixtures-dir', default=None, help='куда записать фикстуры (по умолчанию - временная директория)')
+    parser.add_argument('--articles', type=int, default=1500, help='статей на сайте фикстур (все категории)')
+    parser.add_argument('--days', type=int, default=720, help='за сколько дней опубликованы статьи')
+    parser.add_argument('--rps', type=float, default=20.0, help='ограничение частоты запросов краулера')
+    parser.add_argument('--max-pages', type=int, default=185)
+    args = parser.parse_args()
+    setup_logging('WARNING')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixtures_dir = args.fixtures_dir or tmp
+        site = write_fixture_site(fixtures_dir, args.articles, args.days)
+        print(f"Статей: {site['articles']}, AI: {site['ai']}, AI за {DEFAULT_WINDOW_DAYS} дней: {site['ai_recent']}")
+        results = asyncio.run(benchmark_discovery(fixtures_dir, site['ai_recent'], args.max_pages, args.rps))
+
+    print(f"{'Режим':<12} {'Статей':>7} {'Листинг':>8} {'Sitemap':>8} {'Пропущено':>10} {'Статьи':>7} {'Время, с':>9}")
+    print("-" * 67)
+    for res in results:
+        requests = res['requests']
+        print(f"{res['mode']:<12} {res['articles']:>7} {requests['listing']:>8} {requests['sitemap']:>8} "
+              f"{res['pruned_sitemaps']:>10g} {requests['article']:>7} {res['seconds']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
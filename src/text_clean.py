@@ -0,0 +1,26 @@
+import re
+
+URL_RE = re.compile(r'http\S+|www\S+|https\S+|@\S+', flags=re.MULTILINE)
+COUNTER_RE = re.compile(r'\(\d+\)')
+SUBSCRIBE_RE = re.compile(r'Subscribe to.*casts\.', flags=re.DOTALL)
+LISTEN_RE = re.compile(r'Listen to.*episode.*:', flags=re.DOTALL)
+FOLLOW_RE = re.compile(r'You also can follow.*@\w+')
+
+
+def clean_text_for_embedding(text):
+    """
+    Быстрая чистка текста для эмбеддингов
+    """
+    if not isinstance(text, str):
+        return ""
+
+    text = URL_RE.sub('', text)
+
+    text = COUNTER_RE.sub('', text)
+
+    text = SUBSCRIBE_RE.sub('', text)
+    text = LISTEN_RE.sub('', text)
+    text = FOLLOW_RE.sub('', text)
+
+    # Схлопывание переводов строк и пробелов
+    return ' '.join(text.split())
@@ -0,0 +1,223 @@
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from dense_search import DenseSearchIndex, normalize_rows, published_timestamps, to_timestamp
+from vector_store import top_k_indices
+
+
+class TimeShardedDenseIndex:
+    """
+    Dense индекс, разбитый на помесячные шарды
+
+    Нормализованные векторы каждого месяца лежат в отдельном .npy
+    (открывается через memmap) и отсортированы по времени публикации.
+    Запрос с диапазоном дат [start, end) скорит только шарды, которые
+    пересекаются с диапазоном, а внутри граничных шардов - только
+    непрерывный срез строк, найденный бинарным поиском по времени.
+    Статьи без даты лежат в отдельном шарде и участвуют только в
+    запросах без ограничения по дате.
+    """
+
+    META_FILE = "meta.json"
+    UNDATED = "undated"
+
+    def __init__(self, path: str):
+        """Открывает индекс, созданный через build"""
+        self.path = Path(path)
+        with open(self.path / self.META_FILE, 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+
+        self.shards: List[Dict] = []
+        for shard in self.meta['shards']:
+            name = shard['name']
+            self.shards.append({
+                **shard,
+                'vectors': np.load(self.path / f"{name}.npy", mmap_mode='r'),
+                'timestamps': np.load(self.path / f"{name}.ts.npy"),
+                'ids': np.load(self.path / f"{name}.ids.npy"),
+            })
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, article_ids: Sequence[str], published_times: Sequence,
+              path: str) -> 'TimeShardedDenseIndex':
+        """
+        Создает индекс из матрицы эмбеддингов
+
+        Args:
+            embeddings: эмбеддинги статей (N x d), можно memmap
+            article_ids: ID статей в том же порядке
+            published_times: даты публикации (строки ISO, datetime)
+            path: директория индекса
+        """
+        if not (len(embeddings) == len(article_ids) == len(published_times)):
+            raise ValueError("Число эмбеддингов, ID и дат публикации должно совпадать")
+
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        article_ids = np.asarray(article_ids, dtype=str)
+
+        timestamps = published_timestamps(published_times)
+        dated = ~np.isnan(timestamps)
+        months = np.full(len(timestamps), np.datetime64('NaT'), dtype='datetime64[M]')
+        months[dated] = timestamps[dated].astype(np.int64).astype('datetime64[s]').astype('datetime64[M]')
+
+        shards = []
+        for month in np.unique(months[dated]):
+            rows = np.flatnonzero(months == month)
+            rows = rows[np.argsort(timestamps[rows], kind='stable')]
+            shards.append((str(month), rows, int(month.astype('datetime64[s]').astype(np.int64)),
+                           int((month + 1).astype('datetime64[s]').astype(np.int64))))
+        if not dated.all():
+            shards.append((cls.UNDATED, np.flatnonzero(~dated), None, None))
+
+        meta_shards = []
+        for name, rows, start, end in shards:
+            # Строки шарда читаются из исходной матрицы одним упорядоченным индексом
+            np.save(path / f"{name}.npy", normalize_rows(np.asarray(embeddings[rows])))
+            np.save(path / f"{name}.ts.npy", timestamps[rows])
+            np.save(path / f"{name}.ids.npy", article_ids[rows])
+            meta_shards.append({'name': name, 'start': start, 'end': end, 'count': len(rows)})
+
+        with open(path / cls.META_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'count': len(article_ids), 'dim': int(embeddings.shape[1]), 'shards': meta_shards}, f)
+
+        return cls(path)
+
+    def __len__(self) -> int:
+        return self.meta['count']
+
+    def shard_slices(self, start=None, end=None) -> List[Tuple[Dict, int, int]]:
+        """
+        Шарды и срезы строк внутри них для диапазона start <= дата < end
+
+        Args:
+            start, end: datetime, date или строка ISO 8601; None - без границы
+
+        Returns:
+            список (шард, начало среза, конец среза)
+        """
+        start_ts = to_timestamp(start) if start is not None else None
+        end_ts = to_timestamp(end) if end is not None else None
+
+        slices = []
+        for shard in self.shards:
+            if shard['name'] == self.UNDATED:
+                if start_ts is None and end_ts is None:
+                    slices.append((shard, 0, shard['count']))
+                continue
+            if (start_ts is not None and shard['end'] <= start_ts) or (end_ts is not None and shard['start'] >= end_ts):
+                continue
+            # Внутри месяца строки отсортированы по времени - границы диапазона ищутся бинарным поиском
+            low = np.searchsorted(shard['timestamps'], start_ts, 'left') if start_ts is not None else 0
+            high = np.searchsorted(shard['timestamps'], end_ts, 'left') if end_ts is not None else shard['count']
+            if high > low:
+                slices.append((shard, int(low), int(high)))
+        return slices
+
+    def search_batch_with_scores(self, query_embeddings: np.ndarray, k: int = 10, start=None,
+                                 end=None) -> Tuple[List[List[str]], List[List[float]]]:
+        """
+        Поиск для батча запросов с ограничением по дате
+
+        Args:
+            query_embeddings: нормализованные эмбеддинги запросов (Q x d)
+            k: количество результатов
+            start, end: диапазон дат публикации start <= дата < end (None - без границы)
+
+        Returns:
+            (ID статей, скоры) для каждого запроса
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+
+        candidate_scores, candidate_ids = [], []
+        for shard, low, high in self.shard_slices(start, end):
+            scores = queries @ np.asarray(shard['vectors'][low:high]).T
+            top = top_k_indices(scores, k)
+            candidate_scores.append(np.take_along_axis(scores, top, axis=1))
+            candidate_ids.append(shard['ids'][low:high][top])
+
+        if not candidate_scores:
+            return [[] for _ in queries], [[] for _ in queries]
+
+        # Слияние лучших кандидатов всех шардов
+        scores = np.concatenate(candidate_scores, axis=1)
+        ids = np.concatenate(candidate_ids, axis=1)
+        top = top_k_indices(scores, k)
+        return (np.take_along_axis(ids, top, axis=1).tolist(),
+                np.take_along_axis(scores, top, axis=1).tolist())
+
+    def search_batch(self, query_embeddings: np.ndarray, k: int = 10, start=None, end=None) -> List[List[str]]:
+        """Поиск для батча запросов, только ID статей"""
+        return self.search_batch_with_scores(query_embeddings, k, start, end)[0]
+
+    def search(self, query_embedding: np.ndarray, k: int = 10, start=None, end=None) -> List[str]:
+        """Поиск для одного запроса"""
+        return self.search_batch(np.atleast_2d(query_embedding), k, start, end)[0]
+
+
+def masked_search(index: DenseSearchIndex, timestamps: np.ndarray, queries: np.ndarray, k: int,
+                  start: Optional[float], end: Optional[float]) -> List[List[str]]:
+    """Фильтр по дате без шардов: скоры по всей матрице, статьи вне диапазона маскируются"""
+    scores = index.scores(queries)
+    outside = np.zeros(len(timestamps), dtype=bool)
+    if start is not None:
+        outside |= ~(timestamps >= start)
+    if end is not None:
+        outside |= ~(timestamps < end)
+    scores[:, outside] = -np.inf
+    top = top_k_indices(scores, k)
+    return [[index.article_ids[i] for i in row if np.isfinite(scores[q, i])] for q, row in enumerate(top)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Помесячные шарды dense индекса: поиск с диапазоном дат")
+    parser.add_argument('--index-dir', default='./temp_embeddings/time_shards')
+    parser.add_argument('--docs', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--months', type=int, default=36)
+    parser.add_argument('--queries', type=int, default=64)
+    parser.add_argument('-k', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    embeddings = rng.standard_normal((args.docs, args.dim)).astype(np.float32)
+    ages = rng.uniform(0, args.months * 30.4 * 86400, args.docs)
+    published_times = [(now - timedelta(seconds=age)).isoformat() for age in ages]
+    article_ids = [f"doc-{i}" for i in range(args.docs)]
+    queries = normalize_rows(rng.standard_normal((args.queries, args.dim)))
+
+    start_time = time.perf_counter()
+    sharded = TimeShardedDenseIndex.build(embeddings, article_ids, published_times, args.index_dir)
+    print(f"Шардов: {len(sharded.shards)}, сборка {time.perf_counter() - start_time:.1f} с")
+
+    full = DenseSearchIndex(embeddings, article_ids)
+    timestamps = published_timestamps(published_times)
+
+    print(f"{'Диапазон':<16} {'Строк':>8} {'Маска, мс':>10} {'Шарды, мс':>10} {'Совпадение':>11}")
+    print("-" * 60)
+    for days in (30, 90, 365, None):
+        start = now - timedelta(days=days) if days else None
+        start_ts = start.timestamp() if start else None
+
+        started = time.perf_counter()
+        expected = masked_search(full, timestamps, queries, args.k, start_ts, None)
+        masked_ms = (time.perf_counter() - started) / args.queries * 1000
+
+        started = time.perf_counter()
+        found = sharded.search_batch(queries, args.k, start=start)
+        sharded_ms = (time.perf_counter() - started) / args.queries * 1000
+
+        rows = sum(high - low for _, low, high in sharded.shard_slices(start))
+        label = f"{days} дней" if days else "все"
+        print(f"{label:<16} {rows:>8} {masked_ms:>10.2f} {sharded_ms:>10.2f} {str(found == expected):>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+QUANTIZATIONS = ('int8', 'float16')
+
+
+def _normalized_chunks(embeddings: np.ndarray, chunk_size: int):
+    """L2-нормализованные куски матрицы (без копии всей матрицы)"""
+    for start in range(0, len(embeddings), chunk_size):
+        chunk = np.asarray(embeddings[start:start + chunk_size], dtype=np.float32)
+        norms = np.linalg.norm(chunk, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        yield start, chunk / norms
+
+
+class QuantizedVectorStore:
+    """
+    Компактное хранилище нормализованных dense векторов
+
+    Векторы хранятся в .npy уже нормализованными: float16 или int8 со
+    скейлом на каждую размерность (x ~ code * scale). Файлы открываются
+    через np.memmap без копии в память. Поиск считает скоры по
+    квантованным векторам, а лучшие кандидаты пересчитываются по
+    полной точности (full.npy, с диска читаются только строки кандидатов).
+    """
+
+    META_FILE = "meta.json"
+
+    def __init__(self, path: str):
+        """Открывает хранилище, созданное через build"""
+        self.path = Path(path)
+        with open(self.path / self.META_FILE, 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+
+        self.quantization = self.meta['quantization']
+        self.codes = np.load(self.path / "codes.npy", mmap_mode='r')
+        self.scales = np.load(self.path / "scales.npy") if self.quantization == 'int8' else None
+        full_path = self.path / "full.npy"
+        self.full = np.load(full_path, mmap_mode='r') if full_path.exists() else None
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, path: str, quantization: str = 'int8',
+              keep_full: bool = True, chunk_size: int = 10000) -> 'QuantizedVectorStore':
+        """
+        Создает хранилище из матрицы эмбеддингов
+
+        Args:
+            embeddings: исходные векторы (N x d), можно memmap
+            path: директория хранилища
+            quantization: 'int8' или 'float16'
+            keep_full: сохранить нормализованные float32 векторы для пересчета
+            chunk_size: размер куска при обработке
+        """
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Неизвестная квантизация '{quantization}', доступны: {QUANTIZATIONS}")
+
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        count, dim = embeddings.shape
+
+        # Скейлы int8: максимум модуля по каждой размерности нормализованных векторов
+        scales = np.zeros(dim, dtype=np.float32)
+        if quantization == 'int8':
+            for _, chunk in _normalized_chunks(embeddings, chunk_size):
+                np.maximum(scales, np.abs(chunk).max(axis=0), out=scales)
+            scales[scales == 0] = 1.0
+            scales /= 127.0
+            np.save(path / "scales.npy", scales)
+
+        codes = np.lib.format.open_memmap(
+            path / "codes.npy", mode='w+',
+            dtype=np.int8 if quantization == 'int8' else np.float16, shape=(count, dim)
+        )
+        full = (np.lib.format.open_memmap(path / "full.npy", mode='w+', dtype=np.float32, shape=(count, dim))
+                if keep_full else None)
+
+        for start, chunk in _normalized_chunks(embeddings, chunk_size):
+            end = start + len(chunk)
+            if quantization == 'int8':
+                codes[start:end] = np.clip(np.rint(chunk / scales), -127, 127).astype(np.int8)
+            else:
+                codes[start:end] = chunk.astype(np.float16)
+            if full is not None:
+                full[start:end] = chunk
+
+        codes.flush()
+        del codes
+        if full is not None:
+            full.flush()
+            del full
+
+        with open(path / cls.META_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'quantization': quantization, 'count': count, 'dim': dim}, f)
+
+        return cls(path)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def scores(self, queries: np.ndarray, chunk_size: int = 4096) -> np.ndarray:
+        """
+        Приближенные скоры по квантованным векторам
+
+        Коды приводятся к float32 кусками по chunk_size строк, поэтому
+        дополнительная память - chunk_size x d float32 (16 МБ при d=1024),
+        а не копия всей матрицы.
+
+        Args:
+            queries: нормализованные запросы (Q x d)
+            chunk_size: строк в одном деквантованном куске
+
+        Returns:
+            матрица скоров (Q x N)
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        # q . (code * scale) = (q * scale) . code
+        weighted = queries * self.scales if self.scales is not None else queries
+
+        result = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), chunk_size):
+            chunk = np.asarray(self.codes[start:start + chunk_size], dtype=np.float32)
+            result[:, start:start + len(chunk)] = weighted @ chunk.T
+        return result
+
+    def vectors(self, indices: np.ndarray) -> np.ndarray:
+        """Векторы полной точности (или деквантованные, если full.npy нет)"""
+        if self.full is not None:
+            return np.asarray(self.full[indices])
+        codes = np.asarray(self.codes[indices], dtype=np.float32)
+        return codes * self.scales if self.scales is not None else codes
+
+    def rescore(self, queries: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+        """Точные скоры кандидатов (Q x C) для каждого запроса"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        result = np.empty(candidates.shape, dtype=np.float32)
+        for i, (query, row) in enumerate(zip(queries, candidates)):
+            result[i] = self.vectors(row) @ query
+        return result
+
+    def search(self, queries: np.ndarray, k: int = 10, oversample: int = 4) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-K: отбор k * oversample кандидатов по квантованным векторам и пересчет
+
+        Returns:
+            (индексы Q x k, скоры Q x k) по убыванию скора
+        """
+        approx = self.scores(queries)
+        candidates = top_k_indices(approx, k * oversample)
+        exact = self.rescore(queries, candidates)
+        order = top_k_indices(exact, k)
+        return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(exact, order, axis=1)
+
+    def nbytes(self) -> int:
+        """Объем данных, по которым идет поиск (без full.npy, он читается точечно)"""
+        size = self.codes.size * self.codes.itemsize
+        if self.scales is not None:
+            size += self.scales.nbytes
+        return size
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Индексы top-K по убыванию скора для каждой строки (Q x k)"""
+    num_docs = scores.shape[1]
+    k = min(k, num_docs)
+    if k < num_docs:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.tile(np.arange(num_docs), (scores.shape[0], 1))
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1)
+
+
+def recall_at_k(found: np.ndarray, exact: np.ndarray) -> float:
+    """Средняя доля точного top-K, найденная приближенным поиском"""
+    hits = [len(set(f.tolist()) & set(e.tolist())) for f, e in zip(found, exact)]
+    return sum(hits) / exact.size if exact.size else 1.0
+
+
+def evaluate_store(embeddings: np.ndarray, queries: np.ndarray, store_dir: str,
+                   k: int = 10, oversample_list=(1, 4)) -> List[Dict]:
+    """
+    Recall@k и память квантованных хранилищ против текущего float32 пути
+
+    Текущий путь: np.load всей матрицы float32 + копия в normalize().
+    """
+    exact_vectors = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    exact = top_k_indices(queries @ exact_vectors.T, k)
+    float32_bytes = 2 * embeddings.shape[0] * embeddings.shape[1] * 4
+
+    results = [{'mode': 'float32 (np.load + normalize)', 'recall': 1.0, 'bytes': float32_bytes, 'ms': None}]
+    for quantization in QUANTIZATIONS:
+        store = QuantizedVectorStore.build(embeddings, str(Path(store_dir) / quantization), quantization)
+        for oversample in oversample_list:
+            start = time.perf_counter()
+            found, _ = store.search(queries, k, oversample)
+            elapsed = time.perf_counter() - start
+            results.append({
+                'mode': f'{quantization} (кандидатов x{oversample})',
+                'recall': recall_at_k(found, exact),
+                'bytes': store.nbytes(),
+                'ms': elapsed / len(queries) * 1000,
+            })
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Квантованное хранилище векторов: recall@k и память")
+    parser.add_argument('--embeddings', default=None, help='.npy с эмбеддингами (по умолчанию синтетика)')
+    parser.add_argument('--store-dir', default='./temp_embeddings/vector_store')
+    parser.add_argument('--docs', type=int, default=10000)
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('-k', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.embeddings:
+        embeddings = np.load(args.embeddings, mmap_mode='r')
+        # Запросы - зашумленные векторы корпуса
+        picked = np.asarray(embeddings[rng.choice(len(embeddings), args.queries, replace=False)])
+        queries = picked + 0.3 * rng.standard_normal(picked.shape).astype(np.float32) * picked.std()
+    else:
+        # Кластеризованная синтетика: похожие статьи близки друг к другу
+        centers = rng.standard_normal((100, args.dim)).astype(np.float32)
+        embeddings = (centers[rng.integers(0, 100, args.docs)]
+                      + 0.5 * rng.standard_normal((args.docs, args.dim)).astype(np.float32))
+        queries = (centers[rng.integers(0, 100, args.queries)]
+                   + 0.5 * rng.standard_normal((args.queries, args.dim)).astype(np.float32))
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+    results = evaluate_store(np.asarray(embeddings, dtype=np.float32), queries.astype(np.float32),
+                             args.store_dir, args.k)
+
+    float32_bytes = results[0]['bytes']
+    print(f"{'Режим':<32} {'Recall@' + str(args.k):>10} {'Память, МБ':>12} {'Экономия':>10} {'мс/запрос':>10}")
+    print("-" * 78)
+    for res in results:
+        ms = f"{res['ms']:.2f}" if res['ms'] is not None else '-'
+        print(f"{res['mode']:<32} {res['recall']:>10.3f} {res['bytes'] / 2**20:>12.1f} "
+              f"{float32_bytes / res['bytes']:>9.1f}x {ms:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Модули проекта лежат плоско в src/ и импортируются без пакета
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
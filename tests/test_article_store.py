@@ -0,0 +1,37 @@
+import io
+import json
+
+import pytest
+
+from article_store import _iter_json_array, iter_articles
+
+
+def sample_articles():
+    return [{'id': str(i), 'title': f"Статья {i}", 'text': 'слово ' * (i * 7), 'word_count': i * 7,
+             'tags': ['ai', None, True], 'score': i / 3} for i in range(40)]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 17, 1 << 16])
+@pytest.mark.parametrize('indent', [None, 2])
+def test_json_array_stream_matches_json_load(chunk_size, indent):
+    # Элементы и числа разрезаются границами кусков
+    data = sample_articles() + [123456789, -1.5e10, 'строка "в кавычках"', [], {}]
+    text = json.dumps(data, ensure_ascii=False, indent=indent)
+    assert list(_iter_json_array(io.StringIO(text), chunk_size)) == data
+
+
+@pytest.mark.parametrize('text', ['', '{}', '[1,', '[{"a": 1}'])
+def test_json_array_stream_rejects_broken_input(text):
+    with pytest.raises(ValueError):
+        list(_iter_json_array(io.StringIO(text), 4))
+
+
+def test_iter_articles_reads_json_and_jsonl(tmp_path):
+    articles = sample_articles()
+    json_path = tmp_path / 'articles.json'
+    json_path.write_text(json.dumps(articles, ensure_ascii=False), encoding='utf-8')
+    jsonl_path = tmp_path / 'articles.jsonl'
+    jsonl_path.write_text(''.join(json.dumps(a, ensure_ascii=False) + '\n' for a in articles), encoding='utf-8')
+
+    assert list(iter_articles(str(json_path))) == articles
+    assert list(iter_articles(str(jsonl_path))) == articles
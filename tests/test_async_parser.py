@@ -0,0 +1,77 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import pytest
+
+from async_parser import parse_techcrunch_pagination_async
+from fixture_server import fixture_path, start_fixture_server
+from new_parser import extract_article_text, listing_page_url, parse_listing_page
+
+SITE = Path(__file__).parent / 'fixtures' / 'site'
+
+
+@contextmanager
+def serve(fixtures_dir):
+    """Сервер фикстур в отдельном потоке: parse_techcrunch_pagination_async запускает свой event loop"""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    runner, base_url = asyncio.run_coroutine_threadsafe(start_fixture_server(fixtures_dir), loop).result()
+    try:
+        yield base_url
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def crawl_sync(fixtures_dir, base_url):
+    """Последовательный путь parse_techcrunch_pagination по файлам фикстур, без сети и задержек"""
+    articles = {}
+    page = 1
+    while True:
+        path = fixture_path(fixtures_dir, urlsplit(listing_page_url(page, base_url)).path)
+        if not path.is_file():
+            break
+        page_articles, found, has_next = parse_listing_page(path.read_bytes(), page, base_url)
+        if not found:
+            break
+        for article in page_articles:
+            articles.setdefault(article["url"], article)
+        if not has_next:
+            break
+        page += 1
+
+    result = []
+    for url, article in articles.items():
+        text = extract_article_text(fixture_path(fixtures_dir, urlsplit(url).path).read_bytes())
+        if not text or len(text) < 500:
+            continue
+        result.append({**article, "text": text, "word_count": len(text.split())})
+    return result
+
+
+@pytest.mark.parametrize('backend', ['lxml', 'bs4'])
+def test_async_crawler_matches_sync_parser(backend):
+    with serve(SITE) as base_url:
+        articles = parse_techcrunch_pagination_async(100, 10, base_url=base_url, backend=backend,
+                                                     requests_per_second=1000, burst=50)
+        expected = crawl_sync(SITE, base_url)
+
+    assert articles == expected
+    # 13 статей на двух страницах (одна повторяется), у одной нет текста
+    assert len(articles) == 12
+    assert len({article["url"] for article in articles}) == 12
+
+
+def test_async_crawler_stops_at_target():
+    with serve(SITE) as base_url:
+        articles = parse_techcrunch_pagination_async(5, 10, base_url=base_url,
+                                                     requests_per_second=1000, burst=50)
+        expected = crawl_sync(SITE, base_url)
+
+    assert articles == expected[:5]
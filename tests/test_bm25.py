@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from bm25_search import BM25WithPreprocessing, synthetic_count_matrix
+
+
+@pytest.fixture(scope='module')
+def count_model():
+    counts = synthetic_count_matrix(3000, vocab_size=2000, avg_doc_length=80, seed=1)
+    return BM25WithPreprocessing(language='none').fit_count_matrix(counts, [f"w{i}" for i in range(2000)])
+
+
+def test_top_k_returns_k_results(count_model):
+    # Редкий термин: документов с ненулевым скором меньше K, но search по-прежнему отдает K
+    doc_freq = np.diff(count_model.postings_ptr)
+    term_id = int(np.flatnonzero((doc_freq > 0) & (doc_freq < 50))[0])
+    scores = count_model.score_all([term_id])
+    docs, top_scores = count_model._top_k(scores, 50)
+    assert len(docs) == 50
+    assert top_scores == sorted(top_scores, reverse=True)
+    assert sum(score > 0 for score in top_scores) == doc_freq[term_id]
+    # Документы с равным (нулевым) скором идут по возрастанию индекса
+    zero_docs = docs[doc_freq[term_id]:]
+    assert zero_docs == sorted(zero_docs)
+    assert len(count_model._top_k(scores, 10 ** 6)[0]) == count_model.num_docs
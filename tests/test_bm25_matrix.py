@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from bm25_matrix import BM25MatrixBuilder, build_bm25_matrix, load_bm25_matrix, matrix_from_model, query_term_ids
+from bm25_search import BM25WithPreprocessing, synthetic_count_matrix
+
+
+def synthetic_token_lists(num_docs, vocab_size=400, avg_doc_length=40, seed=0):
+    """Токенизированный корпус с частотами терминов по закону Ципфа"""
+    rng = np.random.default_rng(seed)
+    probs = np.arange(1, vocab_size + 1, dtype=np.float64) ** -1.1
+    probs /= probs.sum()
+    return [[f"w{t}" for t in rng.choice(vocab_size, size=max(int(rng.poisson(avg_doc_length)), 1), p=probs)]
+            for _ in range(num_docs)]
+
+
+@pytest.mark.parametrize('chunk_size, chunk_nnz', [(2000, 5_000_000), (37, 500)])
+def test_builder_matches_model(tmp_path, chunk_size, chunk_nnz):
+    docs = synthetic_token_lists(300)
+    builder = BM25MatrixBuilder(str(tmp_path / 'work'), chunk_size=chunk_size)
+    builder.add_documents(iter(docs))
+    output = builder.finalize(str(tmp_path / 'bm25.npz'), chunk_nnz=chunk_nnz)
+    builder.close()
+
+    built = sparse.load_npz(output)
+    expected = matrix_from_model(BM25WithPreprocessing(language='none').fit_tokens(docs))
+    built.sort_indices()
+    expected.sort_indices()
+    assert built.shape == expected.shape
+    np.testing.assert_array_equal(built.indptr, expected.indptr)
+    np.testing.assert_array_equal(built.indices, expected.indices)
+    # Одна и та же арифметика bm25_weights: веса совпадают до бита
+    np.testing.assert_array_equal(built.data, expected.data)
+
+
+def test_saved_vocabulary_maps_query_terms(tmp_path):
+    docs = synthetic_token_lists(300)
+    output = build_bm25_matrix(iter(docs), str(tmp_path / 'bm25.npz'), str(tmp_path / 'work'), chunk_size=50)
+    model = BM25WithPreprocessing(language='none').fit_tokens(docs)
+
+    # Новый процесс видит только файлы: матрицу и словарь рядом с ней
+    matrix, vocabulary, params = load_bm25_matrix(output)
+    assert params['num_docs'] == len(docs)
+    assert params['avg_doc_length'] == model.avg_doc_length
+    for tokens in (['w0', 'w17'], ['w3', 'unknown', 'w250', 'w3']):
+        term_ids = query_term_ids(vocabulary, tokens)
+        assert term_ids == model.query_term_ids(tokens)
+        query = np.zeros(matrix.shape[1])
+        query[term_ids] = 1.0
+        np.testing.assert_allclose(matrix @ query, model.score_all(term_ids), rtol=1e-12)
+
+
+def test_hashing_vocabulary_round_trip(tmp_path):
+    docs = synthetic_token_lists(100)
+    output = build_bm25_matrix(iter(docs), str(tmp_path / 'bm25.npz'), str(tmp_path / 'work'), n_features=2 ** 12)
+    matrix, vocabulary, _ = load_bm25_matrix(output)
+    assert matrix.shape == (100, 2 ** 12)
+    assert len(vocabulary) == 2 ** 12
+    term_id = query_term_ids(vocabulary, ['w5'])[0]
+    assert matrix[:, term_id].nnz == sum('w5' in tokens for tokens in docs)
+
+
+def test_matrix_rows_give_model_scores():
+    counts = synthetic_count_matrix(3000, vocab_size=2000, avg_doc_length=80, seed=1)
+    model = BM25WithPreprocessing(language='none').fit_count_matrix(counts, [f"w{i}" for i in range(2000)])
+    matrix = matrix_from_model(model)
+    rng = np.random.default_rng(4)
+    for _ in range(20):
+        term_ids = rng.choice(2000, size=rng.integers(1, 6), replace=False).tolist()
+        query = np.zeros(matrix.shape[1])
+        query[term_ids] = 1.0
+        np.testing.assert_allclose(matrix @ query, model.score_all(term_ids), rtol=1e-12)
@@ -0,0 +1,93 @@
+import tempfile
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+from qdrant_client.http import models
+
+from bm25_search import BM25WithPreprocessing
+from bm25_segments import SegmentedBM25Index
+from setup_qdrant import SPARSE_VECTOR_NAME, QdrantLocalSetup
+
+
+def synthetic_token_lists(num_docs, vocab_size=400, avg_doc_length=40, seed=0):
+    """Токенизированный корпус с частотами терминов по закону Ципфа"""
+    rng = np.random.default_rng(seed)
+    probs = np.arange(1, vocab_size + 1, dtype=np.float64) ** -1.1
+    probs /= probs.sum()
+    return [[f"w{t}" for t in rng.choice(vocab_size, size=max(int(rng.poisson(avg_doc_length)), 1), p=probs)]
+            for _ in range(num_docs)]
+
+
+def random_queries(vocab_size, count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.choice(vocab_size, size=rng.integers(1, 6), replace=False).tolist() for _ in range(count)]
+
+
+def test_segmented_matches_full_refit():
+    index = SegmentedBM25Index(merge_factor=3)
+    live = OrderedDict()
+    docs = synthetic_token_lists(600)
+    rng = np.random.default_rng(2)
+
+    for batch_start in range(0, 500, 25):
+        keys = [f"d{i}" for i in range(batch_start, batch_start + 25)]
+        tokens = docs[batch_start:batch_start + 25]
+        index.add_documents(keys, tokens)
+        live.update(zip(keys, tokens))
+        for key in rng.choice(list(live), size=5, replace=False):
+            index.delete(key)
+            del live[key]
+        index.maybe_merge()
+
+    # Замена существующих документов: новая версия встает в конец порядка добавления
+    replaced = list(live)[:10]
+    index.add_documents(replaced, docs[500:510])
+    for key, tokens in zip(replaced, docs[500:510]):
+        del live[key]
+        live[key] = tokens
+
+    keys = list(live)
+    for merged in (False, True):
+        if merged:
+            index.optimize()
+        refit = BM25WithPreprocessing(language='none').fit_tokens(list(live.values()))
+        for term_ids in random_queries(400, 50, seed=3):
+            tokens = [f"w{t}" for t in term_ids]
+            found_keys, found_scores = index.search_tokens(tokens, k=10)
+            indices, scores = refit._top_k(refit.score_all(refit.query_term_ids(tokens)), 10)
+            # Сегментированный индекс отдает только документы с ненулевым скором
+            indices = [i for i, score in zip(indices, scores) if score > 0]
+            scores = [score for score in scores if score > 0]
+            assert found_keys == [keys[i] for i in indices], tokens
+            np.testing.assert_allclose(found_scores, scores, rtol=1e-12)
+
+
+def test_rewrite_sparse_weights_matches_index():
+    index = SegmentedBM25Index()
+    docs = synthetic_token_lists(300, avg_doc_length=20)
+    keys = [str(uuid.UUID(int=i)) for i in range(300)]
+    index.add_documents(keys[:100], docs[:100])
+
+    setup = QdrantLocalSetup(path=tempfile.mkdtemp())
+    setup.create_collection('segments', sparse_vector_name=SPARSE_VECTOR_NAME, sparse_idf=True)
+    setup.upload_sparse_embeddings('segments', index.tf_matrix(index.segments[0]),
+                                   [{'id': key} for key in keys[:100]])
+
+    # Корпус растет (документы длиннее): нормировка длины у старых точек устарела
+    long_docs = [tokens * 3 for tokens in docs[100:]]
+    segment = index.add_documents(keys[100:], long_docs)
+    setup.upload_sparse_embeddings('segments', index.tf_matrix(segment), [{'id': key} for key in keys[100:]])
+    assert setup.rewrite_sparse_weights('segments', index, batch_size=64) == 300
+
+    for term_ids in random_queries(400, 20, seed=5):
+        tokens = [f"w{t}" for t in term_ids]
+        query_ids = sorted({index.term_to_id[token] for token in tokens if token in index.term_to_id})
+        if not query_ids:
+            continue
+        expected_keys, expected_scores = index.search_tokens(tokens, k=10)
+        points = setup.client.query_points(
+            'segments', query=models.SparseVector(indices=query_ids, values=[1.0] * len(query_ids)),
+            using=SPARSE_VECTOR_NAME, limit=10).points
+        np.testing.assert_allclose([point.score for point in points], expected_scores, rtol=1e-5)
+    setup.client.close()
@@ -0,0 +1,35 @@
+from pathlib import Path
+
+import pytest
+
+from html_extract import LxmlArticleExtractor, load_fixtures
+from new_parser import extract_article_text
+
+FIXTURES = load_fixtures(Path(__file__).parent / 'fixtures' / 'html')
+
+
+@pytest.mark.parametrize('path', sorted(FIXTURES), ids=lambda path: Path(path).stem)
+def test_lxml_matches_bs4(path):
+    html = FIXTURES[path]
+    assert LxmlArticleExtractor().extract(html) == extract_article_text(html)
+
+
+def test_cached_selector_matches_bs4():
+    # Один экземпляр на все страницы: быстрый путь по запомненному селектору
+    extractor = LxmlArticleExtractor()
+    for path in sorted(FIXTURES) * 2:
+        assert extractor.extract(FIXTURES[path]) == extract_article_text(FIXTURES[path]), path
+
+
+def test_fixtures_cover_text_and_no_text():
+    texts = {Path(path).stem: extract_article_text(html) for path, html in FIXTURES.items()}
+    assert texts['no_article_text'] is None
+    assert 'Advertisement' not in texts['article_content']
+    assert 'Lower priority' not in texts['entry_content_fallback_order']
+
+
+@pytest.mark.xfail(strict=True, reason="html.parser вкладывает незакрытые <p> друг в друга, lxml закрывает их")
+def test_unclosed_paragraphs_differ():
+    sentence = "Researchers measured how retrieval quality changes when signals are combined. "
+    html = '<html><body><div class="article-body">' + f'<p>{sentence * 2}' * 4 + '</div></body></html>'
+    assert LxmlArticleExtractor().extract(html) == extract_article_text(html)
@@ -0,0 +1,47 @@
+import numpy as np
+
+from bm25_search import BM25WithPreprocessing
+from dense_search import DenseSearchIndex
+from hybrid_search import HybridConfig, HybridRetriever
+
+
+def make_retriever(num_docs=40, dim=8, fusion='rrf'):
+    rng = np.random.default_rng(0)
+    # Термин "rare" есть только в трех документах
+    token_lists = [[f"w{t}" for t in rng.integers(0, 30, size=12)] for _ in range(num_docs)]
+    for doc in (3, 17, 29):
+        token_lists[doc].append('rare')
+    bm25 = BM25WithPreprocessing(language='none').fit_tokens(token_lists)
+    # Корпус уже токенизирован: запрос тоже разбивается по пробелам, без стоп-слов и стемминга NLTK
+    bm25.tokenize_query = str.split
+    embeddings = rng.standard_normal((num_docs, dim)).astype(np.float32)
+    query_emb = rng.standard_normal((1, dim)).astype(np.float32)
+    dense_index = DenseSearchIndex(embeddings, [f"doc-{i}" for i in range(num_docs)])
+    config = HybridConfig(fusion=fusion, title_weight=0.0, recency_weight=0.0)
+    return HybridRetriever(bm25, dense_index, lambda queries: np.repeat(query_emb, len(queries), axis=0), config)
+
+
+def test_sparse_leg_drops_zero_scores():
+    retriever = make_retriever()
+    try:
+        # BM25 отдает K документов, в гибрид попадают только три с термином запроса
+        indices, scores = retriever.bm25.search('rare', 20)
+        assert len(indices) == 20
+        sparse_indices, sparse_scores = retriever._sparse_leg('rare', 20)
+        assert sorted(sparse_indices.tolist()) == [3, 17, 29]
+        assert (sparse_scores > 0).all()
+    finally:
+        retriever.close()
+
+
+def test_zero_score_documents_get_no_sparse_credit():
+    for fusion in ('rrf', 'weighted'):
+        retriever = make_retriever(fusion=fusion)
+        try:
+            dense_only = retriever.dense_index.search(retriever.encode_queries(['rare']), 40)
+            found = retriever.search('rare', 40)
+            # Документы без термина ранжируются только dense веткой, в ее порядке
+            rest = [doc for doc in found if doc not in {'doc-3', 'doc-17', 'doc-29'}]
+            assert rest == [doc for doc in dense_only if doc in rest]
+        finally:
+            retriever.close()
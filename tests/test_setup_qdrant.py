@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from setup_qdrant import iter_dense_points, iter_hybrid_points, iter_sparse_points
+
+
+def articles(count):
+    # Генератор, как iter_articles: длина заранее неизвестна
+    return ({'id': f"doc-{i}", 'title': f"Статья {i}"} for i in range(count))
+
+
+@pytest.mark.parametrize('count', [3, 5])
+def test_point_builders_reject_count_mismatch(count):
+    embeddings = np.ones((4, 2), dtype=np.float32)
+    matrix = sparse.eye(4, 6, format='csr')
+    with pytest.raises(ValueError):
+        list(iter_dense_points(embeddings, articles(count)))
+    with pytest.raises(ValueError):
+        list(iter_sparse_points(matrix, articles(count)))
+    with pytest.raises(ValueError):
+        list(iter_hybrid_points(embeddings, matrix, articles(count)))
+
+
+def test_hybrid_points_pair_rows():
+    embeddings = np.arange(8, dtype=np.float32).reshape(4, 2)
+    points = list(iter_hybrid_points(embeddings, sparse.eye(4, 6, format='csr'), articles(4)))
+    assert [point.payload['id'] for point in points] == [f"doc-{i}" for i in range(4)]
+    assert [point.vector['dense'] for point in points] == embeddings.tolist()
+    assert [point.vector['bm25'].indices for point in points] == [[0], [1], [2], [3]]
+    with pytest.raises(ValueError):
+        list(iter_hybrid_points(embeddings[:3], sparse.eye(4, 6, format='csr'), articles(4)))
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from datetime import timedelta
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import aiohttp
+import pytest
+
+from fixture_server import start_fixture_server
+from sitemap_discovery import FeedEntry, SitemapDiscovery, bind_base_url, parse_feed, write_fixture_site
+
+
+def discover(fixtures_dir, *discoveries):
+    """Для каждого discovery - URL найденных статей (пути) и загруженные адреса, один сервер фикстур"""
+
+    async def run():
+        runner, base_url = await start_fixture_server(fixtures_dir)
+        # Адрес сервера подставляется в файлы фикстур один раз
+        bind_base_url(fixtures_dir, base_url)
+        results = []
+        try:
+            async with aiohttp.ClientSession() as session:
+                for discovery in discoveries:
+                    fetched = []
+
+                    async def fetch(url):
+                        fetched.append(url.replace(base_url, ''))
+                        async with session.get(url) as response:
+                            return response.status, await response.read()
+
+                    urls = [article['url'].replace(base_url, '')
+                            async for article in discovery.iter_articles(fetch, base_url)]
+                    results.append((urls, fetched))
+        finally:
+            await runner.cleanup()
+        return results
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def site(tmp_path):
+    write_fixture_site(str(tmp_path), articles=300, days=720, per_page=20)
+    return str(tmp_path)
+
+
+def expected_ai_urls(path, since):
+    """Статьи AI из помесячных sitemap фикстур с датой не раньше since"""
+    urls = set()
+    for file in Path(path).glob('sitemap-*.xml'):
+        for entry in parse_feed(file.read_bytes()):
+            if 'ai' in entry.categories and entry.lastmod >= since:
+                urls.add(urlsplit(entry.url).path)
+    return urls
+
+
+def test_sitemap_finds_recent_ai_articles(site):
+    discovery = SitemapDiscovery.recent()
+    [(urls, fetched)] = discover(site, discovery)
+    assert len(urls) == len(set(urls))
+    # Статьи первого дня окна (дата из URL - полночь) не теряются в зависимости от времени запуска
+    assert set(urls) == expected_ai_urls(site, discovery.since)
+    # Помесячные sitemap, не менявшиеся с начала окна дат, не загружаются
+    monthly = {f"/{file.name}" for file in Path(site).glob('sitemap-*.xml')}
+    assert 0 < len(monthly.intersection(fetched)) < len(monthly) / 2
+
+
+def test_recent_keeps_first_day_of_window():
+    discovery = SitemapDiscovery.recent(30)
+    first_day = discovery.since
+    assert (first_day.hour, first_day.minute, first_day.second) == (0, 0, 0)
+    assert discovery.accept(FeedEntry(url=f"/{first_day:%Y/%m/%d}/ai-news/", categories=('ai',))) is None
+    previous_day = first_day - timedelta(days=1)
+    assert discovery.accept(FeedEntry(url=f"/{previous_day:%Y/%m/%d}/ai-news/",
+                                      categories=('ai',))) == 'out_of_window'
+
+
+def test_category_feed_matches_sitemap(site):
+    (sitemap_urls, _), (feed_urls, fetched) = discover(
+        site, SitemapDiscovery.recent(), SitemapDiscovery.category_feed())
+    assert sorted(feed_urls) == sorted(sitemap_urls)
+    # Страницы фида читаются, пока не выйдут за начало окна: не больше одной лишней
+    assert len(fetched) <= len(feed_urls) // 20 + 2
+
+
+def test_uncategorized_sitemap_is_not_accepted(tmp_path, caplog):
+    (tmp_path / 'sitemap.xml').write_text(
+        '<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        '<url><loc>{base}/2099/01/01/robots-news/</loc></url>'
+        '<url><loc>{base}/2099/01/02/ai-news/</loc></url></urlset>', encoding='utf-8')
+    (tmp_path / 'robots.txt').write_text("Sitemap: {base}/sitemap.xml\n", encoding='utf-8')
+
+    with caplog.at_level(logging.WARNING, logger='sitemap_discovery'):
+        (rejected, _), (matched, _) = discover(
+            str(tmp_path), SitemapDiscovery(),
+            SitemapDiscovery(url_pattern=r'/ai-', keep_uncategorized=True))
+    # Без категорий и url_pattern фильтр категорий не пропускает ничего - и предупреждает об этом
+    assert rejected == []
+    assert 'url_pattern' in caplog.text
+    assert matched == ['/2099/01/02/ai-news/']